@@ -1,25 +1,35 @@
 import os
+import hmac
 import logging
-from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-import whatsapp_handler
 
+# Before importing the project modules: they read their settings when imported
 load_dotenv()
 
+from flask import Flask, Response, request, jsonify, stream_with_context
+import dedup
+import export
+import http_client
+import log_config
+import metrics
+import reminders
+import whatsapp_handler
+import webhook_queue
+
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
+log_config.setup()
 logger = logging.getLogger(__name__)
 
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
+# Required to download exports over HTTP; the endpoint is off without it
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+
+@app.before_request
+def start_background_tasks():
+    # Started on the first request so that, with a preloaded app, the
+    # scheduler thread runs in the workers and not in the gunicorn master
+    reminders.start(whatsapp_handler.send_message_async)
 
 @app.route("/", methods=["GET"])
 def index():
@@ -50,8 +60,16 @@ def webhook_handler():
     """
     try:
         body = request.get_json()
-        logger.info(f"Received webhook: {body}")
+        if logger.isEnabledFor(logging.INFO):
+            payload = log_config.webhook_payload(body)
+            if payload is not None:
+                logger.info("Received webhook", extra={"webhook": payload})
         
+        if webhook_queue.WEBHOOK_ASYNC:
+            if not webhook_queue.get_queue().submit(body):
+                return jsonify({"status": "busy"}), 503
+            return jsonify({"status": "queued"}), 200
+
         whatsapp_handler.process_webhook_event(body)
         
         return jsonify({"status": "success"}), 200
@@ -59,6 +77,63 @@ def webhook_handler():
         logger.error(f"Error in webhook handler: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route("/export", methods=["GET"])
+def export_csv():
+    """
+    Streams a user's gastos as CSV.
+    Query: user, desde/hasta (YYYY-MM-DD, inclusive), categoria (repeatable), gzip=1.
+    Auth: "Authorization: Bearer <EXPORT_TOKEN>" (not a query parameter,
+    which would end up in access logs and proxies).
+    """
+    auth = request.headers.get("Authorization", "")
+    token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+    if not EXPORT_TOKEN or not hmac.compare_digest(token, EXPORT_TOKEN):
+        return "Forbidden", 403
+
+    compress = request.args.get("gzip") == "1"
+    try:
+        body = export.stream(
+            request.args.get("user"),
+            request.args.get("desde"),
+            request.args.get("hasta"),
+            request.args.getlist("categoria"),
+            compress
+        )
+    except ValueError:
+        return "Bad Request", 400
+
+    filename = "gastos.csv.gz" if compress else "gastos.csv"
+    return Response(
+        stream_with_context(body),
+        mimetype="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """
+    Webhook queue, outbound send and dedup stats for this worker.
+    """
+    result = {
+        "webhook_async": webhook_queue.WEBHOOK_ASYNC,
+        "outbound": http_client.get_client().stats(),
+        "dedup": dedup.get_cache().stats()
+    }
+    if webhook_queue.WEBHOOK_ASYNC:
+        result["queue"] = webhook_queue.get_queue().stats()
+    if reminders.get_scheduler() is not None:
+        result["reminders"] = reminders.get_scheduler().stats()
+    return jsonify(result), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Prometheus metrics for this worker (METRICS_ENABLED=1).
+    """
+    if not metrics.METRICS_ENABLED:
+        return "Not Found", 404
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
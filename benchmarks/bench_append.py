@@ -0,0 +1,51 @@
+"""
+storage.save_gasto latency as a function of history size.
+
+For each size and backend, stores that many gastos, then times single
+appends. File rotation is off unless --rotate, so the JSON backend shows
+the cost of rewriting the whole file on every append. Prints one JSON
+object.
+
+    python benchmarks/bench_append.py --sizes 0,10000,100000,1000000 --appends 50
+"""
+import json
+import time
+import argparse
+import harness
+
+import storage
+
+
+def bench_appends(size, backend, appends, rotate):
+    with harness.data_dir(backend, rotate=rotate) as path:
+        harness.populate(size)
+        extra = harness.synthetic_gastos(appends, days=1, seed=2)
+        samples = []
+        for i, gasto in enumerate(extra):
+            gasto["id"] = f"g-append-{i}"
+            started = time.perf_counter()
+            storage.save_gasto(gasto)
+            samples.append(time.perf_counter() - started)
+        return dict(harness.summarize(samples), data_bytes=harness.data_bytes(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=harness.int_list, default=[0, 10000])
+    parser.add_argument("--backends", type=harness.str_list, default=list(harness.BACKENDS))
+    parser.add_argument("--appends", type=int, default=20)
+    parser.add_argument("--rotate", action="store_true", help="Keep the 10 MB file rotation on.")
+    args = parser.parse_args()
+
+    result = {"appends": args.appends, "rotate": args.rotate, "results": {}, "gate": {}}
+    for backend in args.backends:
+        for size in args.sizes:
+            stats = bench_appends(size, backend, args.appends, args.rotate)
+            result["results"][f"{backend}/{size}"] = stats
+            result["gate"][f"append.{backend}.{size}.p50_ms"] = stats["p50_ms"]
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
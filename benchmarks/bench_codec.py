@@ -0,0 +1,71 @@
+"""
+Size and speed of each on-disk codec (see codec.py) for a gastos file.
+
+For each history size and codec, encodes a synthetic history and times
+dumps, loads, table_rows (what get_table reads) and storage.save_gasto
+appends to that file. Prints one JSON object.
+
+    python benchmarks/bench_codec.py --sizes 10000,100000 --codecs json,compact,binary
+"""
+import json
+import time
+import argparse
+from unittest.mock import patch
+import harness
+
+import codec
+import storage
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return harness.summarize(samples)["p50_ms"]
+
+
+def bench_codec(size, name, repeat, appends):
+    gastos = harness.synthetic_gastos(size)
+    data = codec.dumps(gastos, name)
+    result = {
+        "bytes_per_record": round(len(data) / max(size, 1), 1),
+        "dumps_ms": _time(lambda: codec.dumps(gastos, name), repeat),
+        "loads_ms": _time(lambda: codec.loads(data), repeat),
+        "table_rows_ms": _time(lambda: codec.table_rows(data), repeat),
+    }
+    with harness.data_dir("json", rotate=False), patch.object(storage, "STORAGE_CODEC", name):
+        storage.save_gastos(gastos)
+        extra = harness.synthetic_gastos(appends, days=1, seed=2)
+        samples = []
+        for i, gasto in enumerate(extra):
+            gasto["id"] = f"g-append-{i}"
+            started = time.perf_counter()
+            storage.save_gasto(gasto)
+            samples.append(time.perf_counter() - started)
+    result["append_ms"] = harness.summarize(samples)["p50_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=harness.int_list, default=[10000])
+    parser.add_argument("--codecs", type=harness.str_list, default=list(codec.CODECS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--appends", type=int, default=10)
+    args = parser.parse_args()
+
+    result = {"repeat": args.repeat, "results": {}, "gate": {}}
+    for size in args.sizes:
+        for name in args.codecs:
+            stats = bench_codec(size, name, args.repeat, args.appends)
+            result["results"][f"{name}/{size}"] = stats
+            for metric, value in stats.items():
+                result["gate"][f"codec.{name}.{size}.{metric}"] = value
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
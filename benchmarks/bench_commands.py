@@ -0,0 +1,71 @@
+"""
+Per-command latency of commands.parse over synthetic histories.
+
+For each history size and backend, stores that many gastos in a
+throwaway data directory, then times every command in COMMANDS (the first
+call, which builds the indexes, is reported separately as cold_ms).
+Prints one JSON object.
+
+    python benchmarks/bench_commands.py --sizes 10000,100000,1000000 --backends json,sqlite
+"""
+import json
+import time
+import argparse
+import harness
+
+import commands
+
+# Reads first: the writes at the end change the history the reads see
+COMMANDS = (
+    "hoy",
+    "semana",
+    "mes",
+    "cuanto me queda",
+    "resumen",
+    "reporte mes",
+    "reporte categorias ano",
+    "top 5 mes",
+    "pagopendiente listar",
+    "presupuesto 2000000",
+    "gasto 15000 comida almuerzo",
+)
+
+
+def bench_history(size, backend, repeat):
+    with harness.data_dir(backend, rotate=False):
+        started = time.perf_counter()
+        harness.populate(size)
+        result = {"populate_s": round(time.perf_counter() - started, 3), "commands": {}}
+        for command in COMMANDS:
+            started = time.perf_counter()
+            commands.parse(command)
+            cold = time.perf_counter() - started
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                commands.parse(command)
+                samples.append(time.perf_counter() - started)
+            result["commands"][command] = dict(harness.summarize(samples), cold_ms=round(cold * 1000, 3))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=harness.int_list, default=[10000])
+    parser.add_argument("--backends", type=harness.str_list, default=list(harness.BACKENDS))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    result = {"repeat": args.repeat, "histories": {}, "gate": {}}
+    for size in args.sizes:
+        for backend in args.backends:
+            run = bench_history(size, backend, args.repeat)
+            result["histories"][f"{backend}/{size}"] = run
+            for command, stats in run["commands"].items():
+                result["gate"][f"commands.{backend}.{size}.{command.replace(' ', '_')}.p50_ms"] = stats["p50_ms"]
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
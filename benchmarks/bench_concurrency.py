@@ -0,0 +1,90 @@
+"""
+Concurrent writers through the flock path.
+
+Forks --processes writers (4, like the default gunicorn workers) that all
+append gastos to the same data directory at once, and reports throughput,
+per-append latency, the time spent waiting for file locks, and whether
+any write was lost or left the aggregate index out of step. Prints one
+JSON object; exits non-zero if writes were lost.
+
+    python benchmarks/bench_concurrency.py --processes 4 --writes 200 --history 10000
+"""
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import harness
+
+import metrics
+import storage
+
+
+def writer(worker, writes, start, results):
+    # The parent's lock-wait histogram is copied by fork, so start clean
+    metrics.METRICS_ENABLED = True
+    metrics.LOCK_WAIT_SECONDS.series.clear()
+    start.wait()
+    samples = []
+    for i, gasto in enumerate(harness.synthetic_gastos(writes, days=1, seed=worker + 10)):
+        gasto["id"] = f"g-w{worker}-{i}"
+        started = time.perf_counter()
+        ok = storage.save_gasto(gasto)
+        samples.append(time.perf_counter() - started if ok else None)
+    lock_wait = sum(total for _, total in metrics.LOCK_WAIT_SECONDS.series.values())
+    results.put((worker, samples, lock_wait))
+
+
+def bench(backend, processes, writes, history):
+    ctx = multiprocessing.get_context("fork")
+    with harness.data_dir(backend):
+        harness.populate(history)
+        start, results = ctx.Event(), ctx.Queue()
+        workers = [ctx.Process(target=writer, args=(w, writes, start, results)) for w in range(processes)]
+        for p in workers:
+            p.start()
+        started = time.perf_counter()
+        start.set()
+        outcomes = [results.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for p in workers:
+            p.join()
+
+        samples = [s for _, worker_samples, _ in outcomes for s in worker_samples]
+        stored = storage.get_gastos()
+        expected = history + processes * writes
+        return {
+            "writes": processes * writes,
+            "seconds": round(elapsed, 3),
+            "writes_per_second": round(processes * writes / elapsed, 1),
+            "latency": harness.summarize([s for s in samples if s is not None]),
+            "failed_writes": samples.count(None),
+            "lock_wait_s": round(sum(wait for _, _, wait in outcomes), 3),
+            "lost_writes": expected - len({g["id"] for g in stored}),
+            "index_drift": len(storage.check_index()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", type=harness.str_list, default=list(harness.BACKENDS))
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=100, help="Appends per process.")
+    parser.add_argument("--history", type=int, default=1000, help="Gastos stored before the writers start.")
+    args = parser.parse_args()
+
+    result = {"processes": args.processes, "history": args.history, "results": {}, "gate": {}}
+    for backend in args.backends:
+        run = bench(backend, args.processes, args.writes, args.history)
+        result["results"][backend] = run
+        result["gate"][f"concurrency.{backend}.p95_ms"] = run["latency"]["p95_ms"]
+        result["gate"][f"concurrency.{backend}.lost_writes"] = run["lost_writes"] + run["failed_writes"]
+        result["gate"][f"concurrency.{backend}.index_drift"] = run["index_drift"]
+
+    print(json.dumps(result, indent=2))
+    if any(r["lost_writes"] or r["failed_writes"] for r in result["results"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
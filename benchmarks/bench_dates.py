@@ -0,0 +1,107 @@
+"""
+Micro-benchmark of date handling: the dates fast paths against the
+dateparser / per-record fromisoformat code they replace.
+
+Times user date parsing, the per-record ISO week key and a month range
+filter over a synthetic history, plus the cost of importing dateparser
+in a fresh interpreter. Prints one JSON object.
+
+    python benchmarks/bench_dates.py --records 50000
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dates
+import utils
+
+TZ = "America/Bogota"
+INPUTS = ["hoy", "ayer", "mañana", "viernes", "2025-11-12", "2025-12-01"]
+
+
+def legacy_to_epoch(value):
+    return math.floor(datetime.datetime.fromisoformat(value).timestamp())
+
+
+def legacy_week_key(fecha):
+    year, week, _ = datetime.date.fromisoformat(fecha[:10]).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def legacy_filter(fechas, start_ts, end_ts):
+    return [f for f in fechas if start_ts <= legacy_to_epoch(f) < end_ts]
+
+
+def fast_filter(fechas, start_ts, end_ts):
+    test = dates.range_test(start_ts, end_ts)
+    return [f for f in fechas if test(f)]
+
+
+def synthetic_fechas(n, seed=1):
+    rng = random.Random(seed)
+    tz = utils.get_timezone(TZ)
+    start = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    span = 3 * 365 * 86400
+    return sorted(datetime.datetime.fromtimestamp(start + rng.random() * span, tz).isoformat() for _ in range(n))
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def import_seconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout)
+
+
+def compare(legacy, fast):
+    return {"legacy_us": round(legacy * 1e6, 3), "fast_us": round(fast * 1e6, 3), "speedup": round(legacy / fast, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    result = {"dateparser_import_seconds": round(import_seconds("dateparser"), 4)}
+
+    # Warm dateparser up so its one-off first-call cost is not counted
+    for text in INPUTS:
+        dates.parse_with_dateparser(text, TZ)
+    legacy, _ = timed(lambda: [dates.parse_with_dateparser(t, TZ) for t in INPUTS], args.iterations)
+    fast, _ = timed(lambda: [utils.parse_date_input(t, TZ) for t in INPUTS], args.iterations)
+    result["parse_date_input"] = compare(legacy / len(INPUTS), fast / len(INPUTS))
+
+    fechas = synthetic_fechas(args.records)
+    legacy, _ = timed(lambda: [legacy_week_key(f) for f in fechas], 3)
+    fast, _ = timed(lambda: [dates.week_key(f[:10]) for f in fechas], 3)
+    result["week_key_per_record"] = compare(legacy / len(fechas), fast / len(fechas))
+
+    tz = utils.get_timezone(TZ)
+    start = tz.localize(datetime.datetime(2024, 6, 1))
+    end = tz.localize(datetime.datetime(2024, 7, 1))
+    bounds = (utils.to_epoch(start), utils.to_epoch(end))
+    legacy, expected = timed(lambda: legacy_filter(fechas, *bounds), 3)
+    fast, got = timed(lambda: fast_filter(fechas, *bounds), 3)
+    assert got == expected, "fast filter disagrees with the legacy one"
+    result["month_filter"] = {"records": len(fechas), "matched": len(got), **compare(legacy, fast)}
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
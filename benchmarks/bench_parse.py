@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of command parsing over the EXAMPLES.txt corpus.
+
+Measures commands.resolve (routing only) and, with --full, commands.parse
+end to end against a throwaway data directory. Prints one JSON object.
+
+    python benchmarks/bench_parse.py --iterations 20000
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import commands
+import storage
+
+
+def load_corpus(path=os.path.join(ROOT, "EXAMPLES.txt")):
+    with open(path, encoding="utf-8") as f:
+        return re.findall(r"Usuario:\s*(.+)", f.read())
+
+
+def bench(fn, messages, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            fn(message)
+    elapsed = time.perf_counter() - started
+    calls = iterations * len(messages)
+    return {"calls": calls, "seconds": round(elapsed, 4), "per_second": round(calls / elapsed), "us_per_call": round(elapsed / calls * 1e6, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--full", action="store_true", help="Also time commands.parse with real storage.")
+    parser.add_argument("--full-iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    result = {"corpus_messages": len(corpus), "resolve": bench(commands.resolve, corpus, args.iterations)}
+
+    if args.full:
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch.object(storage, "DATA_DIR", tmp), \
+             patch.object(storage, "GASTOS_FILE", os.path.join(tmp, "gastos.json")), \
+             patch.object(storage, "PAGOS_FILE", os.path.join(tmp, "pagos.json")), \
+             patch.object(storage, "CONFIG_FILE", os.path.join(tmp, "config.json")), \
+             patch.object(storage, "SQLITE_FILE", os.path.join(tmp, "storage.db")):
+            result["parse"] = bench(commands.parse, corpus, args.full_iterations)
+
+    result["gate"] = {"parse.resolve_us": result["resolve"]["us_per_call"]}
+    if "parse" in result:
+        result["gate"]["parse.full_us"] = result["parse"]["us_per_call"]
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Startup benchmark: what a gunicorn worker pays to import the app.
+
+Runs ``python -X importtime -c "import app"`` in fresh interpreters and
+reports the cumulative import time of the app (median of the runs), the
+slowest imports, and which of the dependencies we defer got loaded anyway.
+Prints one JSON object; exits non-zero when --budget-ms is exceeded.
+
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 800
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that must only be imported when a command needs them
+DEFERRED_MODULES = ("dateparser", "pytz", "requests", "dateutil")
+
+_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module="app"):
+    """
+    {module_name: (self_us, cumulative_us)} from one fresh interpreter.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    profile = {}
+    for line in out.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            profile[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median import time exceeds this.")
+    args = parser.parse_args()
+
+    profiles = [import_profile(args.module) for _ in range(args.runs)]
+    totals = [p[args.module][1] / 1000 for p in profiles]
+    last = profiles[-1]
+    slowest = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+
+    result = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(totals), 2),
+        "min_ms": round(min(totals), 2),
+        "modules_imported": len(last),
+        "deferred_loaded": [m for m in DEFERRED_MODULES if m in last],
+        "slowest_self_ms": {name: round(self_us / 1000, 2) for name, (self_us, _) in slowest},
+    }
+    result["gate"] = {"startup.median_ms": result["median_ms"], "startup.deferred_loaded": len(result["deferred_loaded"])}
+    if args.budget_ms is not None:
+        result["budget_ms"] = args.budget_ms
+        result["within_budget"] = result["median_ms"] <= args.budget_ms and not result["deferred_loaded"]
+
+    print(json.dumps(result, indent=2))
+    if args.budget_ms is not None and not result["within_budget"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
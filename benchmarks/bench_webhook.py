@@ -0,0 +1,159 @@
+"""
+End-to-end load test of POST /webhook with the Graph API stubbed locally.
+
+Serves the app and a stub of the WhatsApp Cloud API on localhost, then
+posts --requests webhook events (one text message each, from --senders
+different numbers, taken from the EXAMPLES.txt corpus) over --concurrency
+keep-alive connections. Reports the webhook response latency, throughput,
+and how long it takes until every reply reached the stub. Prints one JSON
+object.
+
+    python benchmarks/bench_webhook.py --requests 2000 --concurrency 16 --api-latency-ms 80
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import http.client
+import http.server
+from concurrent.futures import ThreadPoolExecutor
+import harness
+
+# Quiet logs before the app configures them
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from werkzeug.serving import make_server
+import app
+import webhook_queue
+import whatsapp_handler
+from bench_parse import load_corpus
+
+
+class GraphStub(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), GraphStubHandler)
+        self.latency = latency
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+class GraphStubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.received += 1
+        body = b'{"messages": [{"id": "wamid.stub"}]}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def webhook_body(i, sender, text):
+    return json.dumps({"entry": [{"changes": [{"value": {"messages": [{
+        "id": f"wamid.bench.{i}", "from": sender, "type": "text", "text": {"body": text},
+    }]}}]}]})
+
+
+def post_all(port, bodies, concurrency):
+    local = threading.local()
+
+    def post(body):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection("127.0.0.1", port)
+        started = time.perf_counter()
+        conn.request("POST", "/webhook", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - started, response.status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(post, bodies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--history", type=int, default=1000, help="Gastos stored for each sender beforehand.")
+    parser.add_argument("--backend", default="journal")
+    parser.add_argument("--api-latency-ms", type=float, default=20)
+    parser.add_argument("--async", dest="async_", action="store_true", help="Process webhooks off the request path.")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for every reply.")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    senders = [f"57300{i:07d}" for i in range(args.senders)]
+    bodies = [webhook_body(i, senders[i % len(senders)], corpus[i % len(corpus)]) for i in range(args.requests)]
+
+    with harness.data_dir(args.backend) as path:
+        for sender in senders:
+            with harness.storage.user_partition(sender):
+                harness.populate(args.history)
+
+        stub = serve(GraphStub(args.api_latency_ms / 1000))
+        whatsapp_handler.BASE_URL = f"http://127.0.0.1:{stub.server_port}"
+        whatsapp_handler.PHONE_NUMBER_ID = "bench"
+        webhook_queue.WEBHOOK_ASYNC = args.async_
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = serve(make_server("127.0.0.1", 0, app.app, threaded=True))
+
+        started = time.perf_counter()
+        results = post_all(server.server_port, bodies, args.concurrency)
+        answered = time.perf_counter() - started
+        while stub.received < len(bodies) and time.perf_counter() - started < args.timeout:
+            time.sleep(0.01)
+        replied = time.perf_counter() - started
+        server.shutdown()
+        stub.shutdown()
+
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latency = harness.summarize([seconds for seconds, _ in results])
+    result = {
+        "requests": len(bodies),
+        "concurrency": args.concurrency,
+        "backend": args.backend,
+        "async": args.async_,
+        "statuses": statuses,
+        "latency": latency,
+        "requests_per_second": round(len(bodies) / answered, 1),
+        "replies": stub.received,
+        "all_replied_s": round(replied, 3),
+        "gate": {
+            "webhook.p50_ms": latency["p50_ms"],
+            "webhook.p99_ms": latency["p99_ms"],
+            "webhook.all_replied_ms": round(replied * 1000, 1),
+            "webhook.missing_replies": len(bodies) - stub.received,
+        },
+    }
+    print(json.dumps(result, indent=2))
+    if stub.received < len(bodies):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Shared helpers for the benchmarks: an isolated data directory, synthetic
+gasto histories and latency summaries.
+
+Every benchmark prints one JSON object. Those run by run_all.py also
+include a ``gate`` object of metrics where lower is better (milliseconds,
+unless the name says otherwise), which is what regressions are checked on.
+"""
+import os
+import sys
+import random
+import datetime
+import tempfile
+import contextlib
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage
+
+BACKENDS = ("json", "journal", "sqlite")
+
+# (categoria, weight, detalles)
+CATEGORIAS = (
+    ("comida", 30, ("almuerzo", "mercado", "cena", "café")),
+    ("transporte", 20, ("taxi", "bus", "gasolina")),
+    ("servicios", 10, ("luz", "agua", "internet")),
+    ("ocio", 10, ("cine", "concierto", "libros")),
+    ("salud", 5, ("farmacia", "consulta")),
+    ("varios", 25, ("regalo", "ropa", "hogar")),
+)
+
+TZ = datetime.timezone(datetime.timedelta(hours=-5))
+
+
+def synthetic_gastos(n, days=365, seed=1, end=None):
+    """
+    n gastos spread over the `days` days before end (default now), in time
+    order, with a skewed mix of categories and montos.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime.now(TZ).replace(microsecond=0)
+    span = days * 86400
+    names = [c for c, _, _ in CATEGORIAS]
+    weights = [w for _, w, _ in CATEGORIAS]
+    detalles = {c: d for c, _, d in CATEGORIAS}
+    offsets = sorted(rng.randrange(span) for _ in range(n))
+    gastos = []
+    for i, offset in enumerate(offsets):
+        categoria = rng.choices(names, weights)[0]
+        fecha = end - datetime.timedelta(seconds=span - offset)
+        gastos.append({
+            "id": f"g-bench-{i}",
+            "fecha": fecha.isoformat(),
+            "monto": int(rng.lognormvariate(9.5, 1)) // 100 * 100 + 100,
+            "categoria": categoria,
+            "detalle": rng.choice(detalles[categoria]),
+        })
+    return gastos
+
+
+def populate(n, seed=1, chunk=50000):
+    """
+    Stores a synthetic history of n gastos in the active data directory.
+    """
+    gastos = synthetic_gastos(n, seed=seed)
+    for i in range(0, n, chunk):
+        storage.save_gastos(gastos[i:i + chunk])
+    return n
+
+
+@contextlib.contextmanager
+def data_dir(backend="json", rotate=True):
+    """
+    Points storage at a throwaway directory with the given backend. With
+    rotate=False the JSON files grow without limit.
+    """
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        stack.enter_context(patch.object(storage, "DATA_DIR", tmp))
+        stack.enter_context(patch.object(storage, "GASTOS_FILE", os.path.join(tmp, "gastos.json")))
+        stack.enter_context(patch.object(storage, "PAGOS_FILE", os.path.join(tmp, "pagos.json")))
+        stack.enter_context(patch.object(storage, "CONFIG_FILE", os.path.join(tmp, "config.json")))
+        stack.enter_context(patch.object(storage, "SQLITE_FILE", os.path.join(tmp, "storage.db")))
+        stack.enter_context(patch.object(storage, "STORAGE_BACKEND", backend))
+        if not rotate:
+            stack.enter_context(patch.object(storage, "MAX_FILE_SIZE_BYTES", sys.maxsize))
+        yield tmp
+
+
+def data_bytes(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(seconds):
+    """
+    Latency summary in milliseconds of a list of durations in seconds.
+    """
+    ordered = sorted(seconds)
+    ms = lambda s: round(s * 1000, 3)
+    return {
+        "n": len(ordered),
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(percentile(ordered, 0.5)),
+        "p95_ms": ms(percentile(ordered, 0.95)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def str_list(text):
+    return [x for x in text.split(",") if x]
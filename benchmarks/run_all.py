@@ -0,0 +1,112 @@
+"""
+Runs the benchmark suite and checks it against a baseline.
+
+Each benchmark runs in its own interpreter; their JSON results are
+written together to --output. With --baseline, every ``gate`` metric
+(lower is better) is compared to the baseline's, and the run fails if one
+got worse by more than --tolerance (relative) and --min-delta (absolute,
+to ignore noise on tiny timings).
+
+    python benchmarks/run_all.py --output bench.json
+    python benchmarks/run_all.py --profile full --baseline bench.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROFILES = {
+    "quick": {
+        "bench_startup": ["--runs", "3"],
+        "bench_parse": ["--iterations", "2000", "--full", "--full-iterations", "5"],
+        "bench_commands": ["--sizes", "10000", "--repeat", "10"],
+        "bench_append": ["--sizes", "0,10000", "--appends", "10"],
+        "bench_concurrency": ["--writes", "50"],
+        "bench_webhook": ["--requests", "300", "--history", "100"],
+        "bench_codec": ["--sizes", "10000", "--repeat", "3"],
+    },
+    "full": {
+        "bench_startup": ["--runs", "5"],
+        "bench_parse": ["--full"],
+        "bench_commands": ["--sizes", "10000,100000,1000000", "--repeat", "20"],
+        "bench_append": ["--sizes", "0,10000,100000,1000000", "--appends", "20"],
+        "bench_concurrency": ["--writes", "200", "--history", "10000"],
+        "bench_webhook": ["--requests", "2000", "--concurrency", "16", "--history", "1000"],
+        "bench_codec": ["--sizes", "10000,100000,1000000", "--appends", "20"],
+    },
+}
+
+
+def run(name, extra_args):
+    out = subprocess.run(
+        [sys.executable, os.path.join(HERE, name + ".py"), *extra_args],
+        capture_output=True, text=True,
+    )
+    try:
+        result = json.loads(out.stdout)
+    except ValueError:
+        result = {"error": out.stderr.strip().splitlines()[-1:] or ["no output"]}
+    result["exit_code"] = out.returncode
+    return result
+
+
+def compare(current, baseline, tolerance, min_delta):
+    """
+    [(metric, baseline, current)] of the gate metrics that regressed.
+    """
+    regressions = []
+    for name, bench in baseline.get("results", {}).items():
+        gate = current["results"].get(name, {}).get("gate", {})
+        for metric, before in bench.get("gate", {}).items():
+            after = gate.get(metric)
+            if after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > min_delta:
+                regressions.append((metric, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run (e.g. bench_append).")
+    parser.add_argument("--output", help="Write the results here.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta", type=float, default=0.05)
+    args = parser.parse_args()
+
+    benches = PROFILES[args.profile]
+    if args.only:
+        benches = {name: benches[name] for name in args.only.split(",")}
+
+    current = {"profile": args.profile, "python": sys.version.split()[0], "results": {}}
+    for name, extra_args in benches.items():
+        print(f"Running {name}...", file=sys.stderr)
+        current["results"][name] = run(name, extra_args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+
+    failed = [name for name, result in current["results"].items() if result["exit_code"]]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(current, json.load(f), args.tolerance, args.min_delta)
+
+    summary = {
+        "failed": failed,
+        "regressions": [{"metric": m, "baseline": b, "current": c} for m, b, c in regressions],
+        "gate": {k: v for result in current["results"].values() for k, v in result.get("gate", {}).items()},
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
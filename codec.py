@@ -0,0 +1,515 @@
+"""
+On-disk encodings of the JSON array files (gastos, pagos, config).
+
+- "json": indented JSON, as the files have always been written.
+- "compact": JSON without whitespace, written with orjson if installed.
+- "binary": lists of records in a fixed-width format (below); anything
+  else, such as the config dict, is written as compact JSON.
+
+loads() recognizes the encoding from the first bytes, so files written
+with different codecs can sit side by side and be converted either way.
+JSON is parsed with orjson when it is installed.
+
+Binary layout, little-endian: MAGIC; a header with the record count,
+the number of interned categories and the size of the text block
+(uint32, uint16, uint32); the category names (uint16 length + UTF-8
+each); one fixed-width entry per record
+
+    flags (uint8) | fecha as epoch microseconds (int64) | monto (int64, or float64 bits) | utc offset in minutes (int16) | categoria (uint16)
+
+then the lengths, in characters, of each record's id (uint16), detalle
+(uint32) and extra keys (uint32, a JSON object of anything the fixed
+fields can't hold; when the record's keys were in another order than the
+decoder would give them, it lists every key in order, with null for the
+fixed ones); and last the UTF-8 text block with those pieces one
+after the other. Keeping each kind of field together lets the fixed part
+and the lengths be unpacked in bulk, and the text decoded in one call.
+"""
+import re
+import sys
+import json
+import array
+import struct
+import datetime
+import logging
+import columnar
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("json", "compact", "binary")
+MAGIC = b"\x00GB1"
+
+F_ID = 1
+F_FECHA = 2
+F_MONTO_INT = 4
+F_MONTO_FLOAT = 8
+F_CATEGORIA = 16
+F_DETALLE = 32
+F_EXTRA = 64
+# A gasto as commands.py saves it
+F_PLAIN = F_ID | F_FECHA | F_MONTO_INT | F_CATEGORIA | F_DETALLE
+
+_PLAIN_ORDER = ["id", "fecha", "monto", "categoria", "detalle"]
+# Fields kept in the fixed part, in the order a decoded record has them
+_FLAG_KEYS = ((F_ID, "id"), (F_FECHA, "fecha"), (F_MONTO_INT | F_MONTO_FLOAT, "monto"),
+              (F_CATEGORIA, "categoria"), (F_DETALLE, "detalle"))
+
+NAIVE = -32768  # offset of a fecha without timezone
+_FIXED_FIELDS = frozenset(("id", "fecha", "monto", "categoria", "detalle"))
+
+_HEAD = struct.Struct("<IHI")
+_RECORD = struct.Struct("<BqqhH")
+_U16 = struct.Struct("<H")
+_FLOAT_BITS = struct.Struct("<d")
+_INT_BITS = struct.Struct("<q")
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_MINUTE_US = 60 * 1000000
+_DAY_US = 86400 * 1000000
+
+_orjson = None
+
+
+def _get_orjson():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+            _orjson = orjson
+        except ImportError:
+            logger.info("orjson is not installed, JSON files are parsed with the json module.")
+            _orjson = False
+    return _orjson
+
+
+class CorruptFile(ValueError):
+    """
+    A binary file that ends early or has inconsistent lengths.
+    """
+
+
+# --- fecha ---
+
+class _FechaText:
+    """
+    Builds fecha strings from (epoch in microseconds, offset), caching the
+    date, time of day and offset parts since histories repeat them a lot.
+    """
+    def __init__(self):
+        self.days = {}
+        self.times = {}
+        self.offsets = {}
+
+    def day(self, days):
+        text = self.days.get(days)
+        if text is None:
+            text = self.days[days] = datetime.date.fromordinal(_EPOCH_ORDINAL + days).isoformat() + "T"
+        return text
+
+    def time(self, seconds):
+        text = self.times.get(seconds)
+        if text is None:
+            hours, rest = divmod(seconds, 3600)
+            text = self.times[seconds] = "%02d:%02d:%02d" % (hours, rest // 60, rest % 60)
+        return text
+
+    def offset(self, offset):
+        text = self.offsets.get(offset)
+        if text is None:
+            if offset == NAIVE:
+                text = ""
+            else:
+                hours, minutes = divmod(abs(offset), 60)
+                text = "%s%02d:%02d" % ("-" if offset < 0 else "+", hours, minutes)
+            self.offsets[offset] = text
+        return text
+
+    def __call__(self, epoch_us, offset):
+        seconds, micro = divmod(epoch_us + (0 if offset == NAIVE else offset * _MINUTE_US), 1000000)
+        days, seconds = divmod(seconds, 86400)
+        time = self.time(seconds)
+        if micro:
+            # As datetime.isoformat() writes it
+            time = "%s.%06d" % (time, micro)
+        return self.day(days) + time + self.offset(offset)
+
+
+# What datetime.isoformat() writes for whole seconds or microseconds,
+# naive or with an offset in minutes
+_FECHA_RE = re.compile(r"(\d{4}-\d{2}-\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{6}))?(?:([+-])(\d{2}):(\d{2}))?", re.ASCII)
+
+
+class _FechaPacker:
+    """
+    (epoch in microseconds, offset) that give back a fecha string exactly,
+    as datetime.isoformat() writes it, or None for anything else (a date
+    alone, a "Z" suffix, "-00:00"...).
+    """
+    def __init__(self):
+        self.days = {}
+
+    def __call__(self, fecha):
+        if type(fecha) is not str:
+            return None
+        m = _FECHA_RE.fullmatch(fecha)
+        if m is None:
+            return None
+        date, hours, minutes, seconds, micro, sign, off_hours, off_minutes = m.groups()
+        days = self.days.get(date)
+        if days is None:
+            try:
+                days = datetime.date.fromisoformat(date).toordinal() - _EPOCH_ORDINAL
+            except ValueError:
+                days = False
+            self.days[date] = days
+        hours, minutes, seconds = int(hours), int(minutes), int(seconds)
+        if days is False or hours > 23 or minutes > 59 or seconds > 59 or micro == "000000":
+            return None
+        epoch = ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+        epoch = epoch * 1000000 + (int(micro) if micro else 0)
+        if sign is None:
+            return epoch, NAIVE
+        off_hours, off_minutes = int(off_hours), int(off_minutes)
+        offset = off_hours * 60 + off_minutes
+        if off_hours > 23 or off_minutes > 59 or (sign == "-" and not offset):
+            return None
+        if sign == "-":
+            offset = -offset
+        return epoch - offset * _MINUTE_US, offset
+
+
+# --- Binary records ---
+
+def _float_bits(value):
+    return _INT_BITS.unpack(_FLOAT_BITS.pack(value))[0]
+
+
+def _encode(records, categories):
+    """
+    The fixed entries, the three length arrays and the text of records,
+    adding any new category to categories (name -> code).
+    """
+    pack_fecha = _FechaPacker()
+    fixed, texts = [], []
+    id_lengths, detalle_lengths, extra_lengths = array.array("H"), array.array("I"), array.array("I")
+    pack = _RECORD.pack
+    for record in records:
+        flags, epoch, monto, offset, categoria = 0, 0, 0, 0, 0
+        extra = {} if record.keys() <= _FIXED_FIELDS else {k: v for k, v in record.items() if k not in _FIXED_FIELDS}
+
+        gid = record.get("id")
+        if type(gid) is str and len(gid) <= 0xFFFF:
+            flags |= F_ID
+            texts.append(gid)
+            id_lengths.append(len(gid))
+        else:
+            id_lengths.append(0)
+            if "id" in record:
+                extra["id"] = gid
+
+        if "fecha" in record:
+            packed = pack_fecha(record["fecha"])
+            if packed is None:
+                extra["fecha"] = record["fecha"]
+            else:
+                flags |= F_FECHA
+                epoch, offset = packed
+
+        value = record.get("monto")
+        if type(value) is int and _INT64[0] <= value <= _INT64[1]:
+            flags |= F_MONTO_INT
+            monto = value
+        elif type(value) is float:
+            flags |= F_MONTO_FLOAT
+            monto = _float_bits(value)
+        elif "monto" in record:
+            extra["monto"] = value
+
+        name = record.get("categoria")
+        # The header counts categories in a uint16
+        if type(name) is str and (name in categories or len(categories) < 0xFFFF):
+            flags |= F_CATEGORIA
+            categoria = categories.get(name)
+            if categoria is None:
+                categoria = categories[name] = len(categories)
+        elif "categoria" in record:
+            extra["categoria"] = name
+
+        detalle = record.get("detalle")
+        if type(detalle) is str:
+            flags |= F_DETALLE
+            texts.append(detalle)
+            detalle_lengths.append(len(detalle))
+        else:
+            detalle_lengths.append(0)
+            if "detalle" in record:
+                extra["detalle"] = detalle
+
+        keys = list(record)
+        fixed_order = _PLAIN_ORDER if flags == F_PLAIN else [key for flag, key in _FLAG_KEYS if flags & flag]
+        if extra or keys != fixed_order:
+            flags |= F_EXTRA
+            extra_keys = [k for k in keys if k in extra]
+            if keys == fixed_order + extra_keys:
+                extra = {k: extra[k] for k in extra_keys}
+            else:
+                # Keeps the record's key order: the fields stored in the fixed
+                # part get a null placeholder there
+                extra = {k: extra.get(k) for k in keys}
+            extra_text = json.dumps(extra, ensure_ascii=False, separators=(',', ':'))
+            texts.append(extra_text)
+            extra_lengths.append(len(extra_text))
+        else:
+            extra_lengths.append(0)
+
+        fixed.append(pack(flags, epoch, monto, offset, categoria))
+
+    if sys.byteorder == "big":
+        for lengths in (id_lengths, detalle_lengths, extra_lengths):
+            lengths.byteswap()
+    return [b"".join(fixed), id_lengths.tobytes(), detalle_lengths.tobytes(), extra_lengths.tobytes(),
+            "".join(texts).encode("utf-8", "surrogatepass")]
+
+
+def _assemble(count, categories, blocks):
+    parts = [MAGIC, _HEAD.pack(count, len(categories), len(blocks[4]))]
+    for name in categories:
+        data = name.encode("utf-8")
+        parts += [_U16.pack(len(data)), data]
+    return b"".join(parts + blocks)
+
+
+def encode_records(records):
+    """
+    Binary encoding of a list of dicts; decode_records() gives back equal dicts.
+    """
+    categories = {}
+    return _assemble(len(records), categories, _encode(records, categories))
+
+
+def _checked(fn):
+    def wrapper(data, *args):
+        try:
+            return fn(memoryview(data), *args)
+        except (struct.error, IndexError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise CorruptFile(f"Corrupted binary records: {e}") from e
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+def _take(view, pos, size):
+    if pos + size > len(view):
+        raise CorruptFile(f"Binary records end early: {size} bytes needed at {pos}")
+    return view[pos:pos + size], pos + size
+
+
+def _sections(view):
+    """
+    (count, categories, blocks) of a binary file, the blocks being the
+    fixed entries, the three length arrays and the text.
+    """
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise CorruptFile("Not a binary records file")
+    count, n_categories, text_size = _HEAD.unpack_from(view, len(MAGIC))
+    pos = len(MAGIC) + _HEAD.size
+    categories = []
+    for _ in range(n_categories):
+        (length,) = _U16.unpack_from(view, pos)
+        name, pos = _take(view, pos + 2, length)
+        categories.append(str(name, "utf-8"))
+
+    blocks = []
+    for size in (_RECORD.size, 2, 4, 4):
+        block, pos = _take(view, pos, size * count)
+        blocks.append(block)
+    block, pos = _take(view, pos, text_size)
+    blocks.append(block)
+    if pos != len(view):
+        raise CorruptFile(f"{len(view) - pos} unexpected bytes after the records")
+    return count, categories, blocks
+
+
+def _lengths(block, typecode):
+    lengths = array.array(typecode)
+    lengths.frombytes(block)
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    return lengths
+
+
+def _entries(view):
+    """
+    (categories, per-record tuples, text) of a binary file: each tuple is
+    the fixed fields followed by the id, detalle and extra lengths.
+    """
+    _, categories, (fixed, ids, detalles, extras, text) = _sections(view)
+    entries = zip(_RECORD.iter_unpack(fixed), _lengths(ids, "H"), _lengths(detalles, "I"), _lengths(extras, "I"))
+    return categories, entries, str(text, "utf-8", "surrogatepass")
+
+
+def _record(fields, id_len, detalle_len, extra_len, categories, text, at, fecha):
+    """
+    The dict of a record with any flags, whose text starts at position at.
+    """
+    flags, epoch, monto, offset, categoria = fields
+    record = {}
+    if flags & F_ID:
+        record["id"] = text[at:at + id_len]
+    at += id_len
+    if flags & F_FECHA:
+        record["fecha"] = fecha(epoch, offset)
+    if flags & F_MONTO_INT:
+        record["monto"] = monto
+    elif flags & F_MONTO_FLOAT:
+        record["monto"] = _FLOAT_BITS.unpack(_INT_BITS.pack(monto))[0]
+    if flags & F_CATEGORIA:
+        record["categoria"] = categories[categoria]
+    if flags & F_DETALLE:
+        record["detalle"] = text[at:at + detalle_len]
+    at += detalle_len
+    if flags & F_EXTRA:
+        extra = json.loads(text[at:at + extra_len])
+        if any(k in record for k in extra):
+            # In the record's own key order (see _encode)
+            return {k: record[k] if k in record else v for k, v in extra.items()}
+        record.update(extra)
+    return record
+
+
+@_checked
+def decode_records(view):
+    """
+    The list of dicts in a binary file's contents.
+    """
+    categories, entries, text = _entries(view)
+    fecha = _FechaText()
+    times = fecha.times
+    records = []
+    append = records.append
+    at = 0
+    # Records mostly come in time order: the day and offset of the previous
+    # one usually fit the next
+    day_start = day_end = shift = last_offset = None
+    for fields, id_len, detalle_len, extra_len in entries:
+        flags, epoch, monto, offset, categoria = fields
+        if flags != F_PLAIN:
+            append(_record(fields, id_len, detalle_len, extra_len, categories, text, at, fecha))
+            at += id_len + detalle_len + extra_len
+            continue
+        if offset != last_offset:
+            last_offset, shift, suffix = offset, (0 if offset == NAIVE else offset * _MINUTE_US), fecha.offset(offset)
+            day_start = None
+        local = epoch + shift
+        if day_start is None or not day_start <= local < day_end:
+            days = local // _DAY_US
+            day_start, day_end, prefix = days * _DAY_US, days * _DAY_US + _DAY_US, fecha.day(days)
+        seconds, micro = divmod(local - day_start, 1000000)
+        time = times.get(seconds)
+        if time is None:
+            time = fecha.time(seconds)
+        if micro:
+            time = "%s.%06d" % (time, micro)
+        mid = at + id_len
+        end = mid + detalle_len
+        append({"id": text[at:mid], "fecha": prefix + time + suffix, "monto": monto,
+                "categoria": categories[categoria], "detalle": text[mid:end]})
+        at = end
+    if at != len(text):
+        raise CorruptFile("Text lengths do not add up to the text block")
+    return records
+
+
+@_checked
+def _binary_rows(view):
+    categories, entries, text = _entries(view)
+    fecha = _FechaText()
+    rows = []
+    append = rows.append
+    at = 0
+    for fields, id_len, detalle_len, extra_len in entries:
+        flags, epoch, monto, offset, categoria = fields
+        if flags == F_PLAIN and offset != NAIVE:
+            start = at + id_len
+            at = start + detalle_len
+            append((epoch // 1000000, monto, categories[categoria], text[start:at]))
+            continue
+        # Naive fechas are local time, left to utils.to_epoch
+        row = columnar.row_of(_record(fields, id_len, detalle_len, extra_len, categories, text, at, fecha))
+        if row is not None:
+            append(row)
+        at += id_len + detalle_len + extra_len
+    if at != len(text):
+        raise CorruptFile("Text lengths do not add up to the text block")
+    return rows
+
+
+# --- Files ---
+
+@_checked
+def append_records(view, records):
+    """
+    A binary file's contents with records added at the end. The records
+    already there are copied block by block, not decoded.
+    """
+    count, names, blocks = _sections(view)
+    categories = {name: code for code, name in enumerate(names)}
+    added = _encode(records, categories)
+    return _assemble(count + len(records), categories, [bytes(old) + new for old, new in zip(blocks, added)])
+
+
+def is_binary(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def dumps(data, codec="json"):
+    """
+    Encodes data (a list of records or a dict) as bytes with the given codec.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {', '.join(CODECS)}")
+    if codec == "binary" and isinstance(data, list) and all(isinstance(r, dict) for r in data):
+        return encode_records(data)
+    if codec == "json":
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    orjson = _get_orjson()
+    if orjson:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            # Integers beyond 64 bits, non-string keys...
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+
+
+def loads(data):
+    """
+    Decodes the contents of a file written by dumps() with any codec.
+    Raises ValueError if they are corrupted.
+    """
+    if is_binary(data):
+        return decode_records(data)
+    orjson = _get_orjson()
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def table_rows(data):
+    """
+    (ts, monto, categoria, detalle) rows of the gastos in a file's contents,
+    as columnar.row_of() gives them. Binary records get there without a
+    dict or a fecha to parse for each one.
+    """
+    if is_binary(data):
+        return _binary_rows(data)
+    return [row for row in map(columnar.row_of, loads(data)) if row is not None]
+
+
+def codec_of(data):
+    """
+    Best guess of the codec a file's contents were written with.
+    """
+    if is_binary(data):
+        return "binary"
+    return "json" if b"\n" in data[:256] else "compact"
@@ -0,0 +1,190 @@
+"""
+Columnar in-memory table of gastos for analytics over long histories.
+
+Instead of one dict per gasto, the table keeps parallel typed arrays sorted
+by time: epoch seconds and montos as array('q'), categories as small-int
+codes into an interned name list, plus a running total of the montos.
+That is a few machine words per record, and
+
+- a range is two bisects on the timestamps,
+- a range total is a difference of two running totals,
+- category breakdowns and top-N only walk the rows in range.
+
+NumPy, when installed, takes over breakdowns and top-N on large ranges
+(COLUMNAR_NUMPY=0 disables it). Montos are stored as integers.
+"""
+import os
+import heapq
+import bisect
+import logging
+from array import array
+import utils
+
+logger = logging.getLogger(__name__)
+
+# "auto": use NumPy if it is installed and the range is large enough
+COLUMNAR_NUMPY = os.getenv("COLUMNAR_NUMPY", "auto")
+NUMPY_MIN_ROWS = int(os.getenv("COLUMNAR_NUMPY_MIN_ROWS", "20000"))
+
+_numpy = None
+
+
+def _get_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            logger.info("NumPy is not installed, columnar aggregations run in pure Python.")
+            _numpy = False
+    return _numpy
+
+
+def row_of(g):
+    """
+    (ts, monto, categoria, detalle) of a gasto dict, None without a valid fecha.
+    """
+    fecha = g.get("fecha")
+    if not fecha:
+        return None
+    try:
+        ts = utils.to_epoch(fecha)
+    except ValueError:
+        return None
+    return ts, int(g.get("monto", 0)), g.get("categoria", "varios"), g.get("detalle", "")
+
+
+class GastoTable:
+    def __init__(self):
+        self.ts = array('q')
+        self.montos = array('q')
+        self.cats = array('I')
+        # Running total: cumsum[i] is the sum of montos[:i]
+        self.cumsum = array('q', [0])
+        self.categories = []
+        self.category_codes = {}
+        self.detalles = []
+
+    @classmethod
+    def from_gastos(cls, gastos):
+        """
+        Builds a table from gasto dicts; records without a valid fecha are skipped.
+        """
+        return cls.from_rows([row for row in map(row_of, gastos) if row is not None])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds a table from (ts, monto, categoria, detalle) rows.
+        """
+        # Stored in insertion order, which is almost always time order
+        if any(rows[i][0] > rows[i + 1][0] for i in range(len(rows) - 1)):
+            rows = sorted(rows, key=lambda row: row[0])
+
+        table = cls()
+        for ts, monto, categoria, detalle in rows:
+            table.append(ts, monto, categoria, detalle)
+        return table
+
+    def _code(self, categoria):
+        code = self.category_codes.get(categoria)
+        if code is None:
+            code = self.category_codes[categoria] = len(self.categories)
+            self.categories.append(categoria)
+        return code
+
+    def append(self, ts, monto, categoria, detalle=""):
+        """
+        Adds a row; it must not be older than the last one.
+        """
+        if self.ts and ts < self.ts[-1]:
+            raise ValueError("rows must be appended in time order")
+        self.ts.append(ts)
+        self.montos.append(monto)
+        self.cats.append(self._code(categoria))
+        self.cumsum.append(self.cumsum[-1] + monto)
+        self.detalles.append(detalle)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def nbytes(self):
+        """
+        Bytes held by the numeric columns.
+        """
+        return sum(a.itemsize * len(a) for a in (self.ts, self.montos, self.cats, self.cumsum))
+
+    def span(self, start_ts=None, end_ts=None):
+        """
+        (lo, hi) row positions of start_ts <= ts < end_ts; None bounds are open.
+        """
+        lo = 0 if start_ts is None else bisect.bisect_left(self.ts, start_ts)
+        hi = len(self.ts) if end_ts is None else bisect.bisect_left(self.ts, end_ts)
+        return lo, max(lo, hi)
+
+    def sum_between(self, start_ts=None, end_ts=None):
+        """
+        (total, count) of the rows in range.
+        """
+        lo, hi = self.span(start_ts, end_ts)
+        return self.cumsum[hi] - self.cumsum[lo], hi - lo
+
+    def numpy_for(self, rows):
+        """
+        The numpy module if it should handle this many rows, else None.
+        """
+        if COLUMNAR_NUMPY == "0" or (COLUMNAR_NUMPY == "auto" and rows < NUMPY_MIN_ROWS):
+            return None
+        return _get_numpy() or None
+
+    def by_category(self, start_ts=None, end_ts=None):
+        """
+        {categoria: (total, count)} of the rows in range, largest total first.
+        """
+        lo, hi = self.span(start_ts, end_ts)
+        np = self.numpy_for(hi - lo)
+        if np is not None:
+            codes = np.frombuffer(self.cats, dtype=np.uint32)[lo:hi]
+            montos = np.frombuffer(self.montos, dtype=np.int64)[lo:hi]
+            counts = np.bincount(codes, minlength=len(self.categories))
+            # float64 weights are exact for totals below 2**53
+            totals = np.bincount(codes, weights=montos, minlength=len(self.categories)).round()
+            groups = {self.categories[c]: (int(totals[c]), int(counts[c])) for c in np.flatnonzero(counts)}
+        else:
+            totals = [0] * len(self.categories)
+            counts = [0] * len(self.categories)
+            for code, monto in zip(self.cats[lo:hi], self.montos[lo:hi]):
+                totals[code] += monto
+                counts[code] += 1
+            groups = {self.categories[c]: (totals[c], counts[c]) for c in range(len(counts)) if counts[c]}
+        return dict(sorted(groups.items(), key=lambda item: (-item[1][0], item[0])))
+
+    def top(self, n, start_ts=None, end_ts=None):
+        """
+        Row positions of the n largest montos in range, largest first
+        (earlier rows first on ties).
+        """
+        lo, hi = self.span(start_ts, end_ts)
+        if n <= 0 or hi <= lo:
+            return []
+        np = self.numpy_for(hi - lo)
+        if np is not None and n < hi - lo:
+            montos = np.frombuffer(self.montos, dtype=np.int64)[lo:hi]
+            # The n-th largest value, then every row reaching it, so ties
+            # resolve by position exactly as in the pure Python path
+            threshold = np.partition(montos, len(montos) - n)[len(montos) - n]
+            candidates = np.flatnonzero(montos >= threshold)
+            ordered = candidates[np.lexsort((candidates, -montos[candidates]))][:n]
+            return [lo + int(i) for i in ordered]
+        # (monto, -position) pairs: ties go to the earlier row
+        largest = heapq.nlargest(n, zip(self.montos[lo:hi], range(-lo, -hi, -1)))
+        return [-neg for _, neg in largest]
+
+    def row(self, i):
+        return {
+            "ts": self.ts[i],
+            "monto": self.montos[i],
+            "categoria": self.categories[self.cats[i]],
+            "detalle": self.detalles[i],
+        }
@@ -1,14 +1,22 @@
+import re
+import inspect
 import datetime
 import logging
-import csv
-import io
 import os
-from dateutil.relativedelta import relativedelta
 import utils
+import export
+import metrics
+import query
+import reminders
 import storage
+import storage_index
 
 logger = logging.getLogger(__name__)
 
+# Periods starting at most this many days ago are read from the end of
+# the history instead of the full gasto table.
+RECENT_WINDOW_DAYS = int(os.getenv("RECENT_WINDOW_DAYS", "7"))
+
 def handle_gasto(args):
     """
     gasto <monto> <detalle>
@@ -60,79 +68,67 @@ def handle_gasto(args):
         logger.error(f"Error processing gasto: {e}")
         return "❌ Error interno al registrar el gasto."
 
-def handle_hoy():
+def _aggregate(periods=("dia", "semana", "mes")):
+    """
+    Reads the config once and the day/week/month totals from a single
+    index lookup. Shared by hoy, semana, mes, cuanto me queda and resumen.
+    """
     config = storage.get_config()
     tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
     now = datetime.datetime.now(tz)
-    today_str = now.strftime("%Y-%m-%d")
-    
-    gastos = storage.get_gastos()
-    total = 0
-    items = []
-    
-    for g in gastos:
-        # Parse stored date
-        g_date = datetime.datetime.fromisoformat(g["fecha"])
-        if g_date.strftime("%Y-%m-%d") == today_str:
-            total += g["monto"]
-            items.append(g)
-            
-    formatted_total = utils.format_currency(total, config.get("moneda", "COP"))
-    
-    if not items:
-        return f"Hoy ({today_str}) no has gastado nada."
-        
-    return f"Hoy has gastado: {formatted_total}."
+    keys = {
+        "dia": now.strftime("%Y-%m-%d"),
+        "semana": storage_index.week_key(now),
+        "mes": now.strftime("%Y-%m"),
+    }
+    totals = storage.get_totals([(period, keys[period]) for period in periods])
+    return {
+        "config": config,
+        "moneda": config.get("moneda", "COP"),
+        "presupuesto": config.get("presupuesto_mensual", 0),
+        "now": now,
+        "totals": {period: totals[(period, keys[period])] for period in periods},
+    }
+
+def _hoy_message(agg):
+    total, count = agg["totals"]["dia"]
+    if not count:
+        return f"Hoy ({agg['now'].strftime('%Y-%m-%d')}) no has gastado nada."
+    return f"Hoy has gastado: {utils.format_currency(total, agg['moneda'])}."
+
+def _semana_message(agg):
+    now = agg["now"]
+    # Start of week (Monday)
+    start_of_week = now - datetime.timedelta(days=now.weekday())
+    total, _ = agg["totals"]["semana"]
+    return f"Esta semana (desde {start_of_week.strftime('%d/%m')}) has gastado: {utils.format_currency(total, agg['moneda'])}."
+
+def _mes_message(agg):
+    total, _ = agg["totals"]["mes"]
+    presupuesto, moneda = agg["presupuesto"], agg["moneda"]
 
-def handle_mes():
-    config = storage.get_config()
-    tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
-    now = datetime.datetime.now(tz)
-    current_month = now.strftime("%Y-%m")
-    
-    gastos = storage.get_gastos()
-    total = 0
-    
-    for g in gastos:
-        g_date = datetime.datetime.fromisoformat(g["fecha"])
-        if g_date.strftime("%Y-%m") == current_month:
-            total += g["monto"]
-            
-    presupuesto = config.get("presupuesto_mensual", 0)
-    moneda = config.get("moneda", "COP")
-    
     formatted_total = utils.format_currency(total, moneda)
     formatted_presupuesto = utils.format_currency(presupuesto, moneda)
-    
-    msg = f"En {now.strftime('%B (%Y)')} has gastado: {formatted_total}. Presupuesto: {formatted_presupuesto}."
-    
+
+    msg = f"En {agg['now'].strftime('%B (%Y)')} has gastado: {formatted_total}. Presupuesto: {formatted_presupuesto}."
+
     if total > presupuesto:
         diff = total - presupuesto
         msg += f" Te has pasado {utils.format_currency(diff, moneda)}."
     else:
         left = presupuesto - total
         msg += f" Te quedan {utils.format_currency(left, moneda)}."
-        
+
     return msg
 
+def handle_hoy():
+    return _hoy_message(_aggregate(("dia",)))
+
+def handle_mes():
+    return _mes_message(_aggregate(("mes",)))
+
 def handle_semana():
-    config = storage.get_config()
-    tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
-    now = datetime.datetime.now(tz)
-    # Start of week (Monday)
-    start_of_week = now - datetime.timedelta(days=now.weekday())
-    start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    gastos = storage.get_gastos()
-    total = 0
-    
-    for g in gastos:
-        g_date = datetime.datetime.fromisoformat(g["fecha"])
-        if g_date >= start_of_week:
-            total += g["monto"]
-            
-    formatted_total = utils.format_currency(total, config.get("moneda", "COP"))
-    return f"Esta semana (desde {start_of_week.strftime('%d/%m')}) has gastado: {formatted_total}."
+    return _semana_message(_aggregate(("semana",)))
 
 def handle_presupuesto(args):
     if not args:
@@ -149,31 +145,19 @@ def handle_presupuesto(args):
     return f"✅ Presupuesto mensual actualizado a: {utils.format_currency(monto, moneda)}"
 
 def handle_cuanto_me_queda():
-    # Reuse logic from handle_mes but focused on remaining
-    config = storage.get_config()
-    tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
-    now = datetime.datetime.now(tz)
-    current_month = now.strftime("%Y-%m")
-    
-    gastos = storage.get_gastos()
-    total = 0
-    for g in gastos:
-        g_date = datetime.datetime.fromisoformat(g["fecha"])
-        if g_date.strftime("%Y-%m") == current_month:
-            total += g["monto"]
-            
-    presupuesto = config.get("presupuesto_mensual", 0)
+    agg = _aggregate(("mes",))
+    total, _ = agg["totals"]["mes"]
+    presupuesto, moneda = agg["presupuesto"], agg["moneda"]
     remaining = presupuesto - total
-    moneda = config.get("moneda", "COP")
-    
+
     if remaining < 0:
         return f"⚠️ No te queda nada. Te has excedido en {utils.format_currency(abs(remaining), moneda)}."
-    
+
     return f"Te quedan: {utils.format_currency(remaining, moneda)} del presupuesto de {utils.format_currency(presupuesto, moneda)}."
 
 def handle_pagopendiente(args):
     if not args:
-        return "Usa: pagopendiente agregar ... o pagopendiente listar"
+        return "Usa: pagopendiente agregar ..., pagopendiente listar o pagopendiente pagar <id>"
     
     subcmd = args[0].lower()
     
@@ -189,7 +173,9 @@ def handle_pagopendiente(args):
         if not utils.is_valid_amount(monto_str):
             return "❌ Monto inválido."
         
-        dt = utils.parse_date_input(date_str)
+        config = storage.get_config()
+        tz_name = config.get("timezone", "America/Bogota")
+        dt = utils.parse_date_input(date_str, tz_name)
         if not dt:
             return "❌ Fecha inválida."
             
@@ -201,85 +187,190 @@ def handle_pagopendiente(args):
             "pagado": False
         }
         storage.save_pago(pago)
+        reminders.schedule(pago, utils.get_timezone(tz_name))
         
-        moneda = storage.get_config().get("moneda", "COP")
+        moneda = config.get("moneda", "COP")
         return f"✅ Pago agregado: {nombre} - {utils.format_currency(pago['monto'], moneda)} - vence {pago['vencimiento']}."
 
     elif subcmd == "listar":
-        pagos = storage.get_pagos()
-        pendientes = [p for p in pagos if not p.get("pagado")]
+        pendientes = storage.get_pending_pagos()
         if not pendientes:
             return "No tienes pagos pendientes."
-            
-        # Sort by date
-        pendientes.sort(key=lambda x: x["vencimiento"])
         
         msg = "📅 Pagos pendientes:\n"
         moneda = storage.get_config().get("moneda", "COP")
         for p in pendientes:
-            msg += f"- {p['nombre']}: {utils.format_currency(p['monto'], moneda)} ({p['vencimiento']})\n"
+            msg += f"- {p['nombre']}: {utils.format_currency(p['monto'], moneda)} ({p['vencimiento']}) [{p['id']}]\n"
         return msg.strip()
+
+    elif subcmd == "pagar":
+        if len(args) < 2:
+            return "❌ Formato: pagopendiente pagar <id o nombre>"
+
+        ref = " ".join(args[1:])
+        pago = storage.get_due_index().find(ref)
+        if pago is None:
+            return f"❌ No encontré un pago pendiente '{ref}'. Usa 'pagopendiente listar' para ver los ids."
+
+        updated = storage.update_pago(pago["id"], {"pagado": True})
+        if not updated:
+            return "❌ Error interno al actualizar el pago."
+        reminders.cancel(pago["id"])
+
+        moneda = storage.get_config().get("moneda", "COP")
+        return f"✅ Pago marcado como pagado: {pago['nombre']} - {utils.format_currency(pago['monto'], moneda)}."
         
     else:
-        return "Subcomando desconocido. Usa 'agregar' o 'listar'."
+        return "Subcomando desconocido. Usa 'agregar', 'listar' o 'pagar'."
 
 def handle_resumen():
-    # Combine hoy, semana, mes, pagos proximos
-    hoy_msg = handle_hoy()
-    # We want compact, so let's strip prefixes maybe?
-    # "Hoy has gastado: X" -> "Hoy: X"
-    
-    # Let's just call the functions and concatenate
-    semana_msg = handle_semana()
-    mes_msg = handle_mes()
-    
-    # Pagos proximos (next 7 days)
-    pagos = storage.get_pagos()
-    pendientes = [p for p in pagos if not p.get("pagado")]
-    pendientes.sort(key=lambda x: x["vencimiento"])
-    
+    # hoy, semana and mes from one aggregate, plus the next pending pago
+    agg = _aggregate()
+
     proximos_msg = ""
-    if pendientes:
-        next_pago = pendientes[0]
-        moneda = storage.get_config().get("moneda", "COP")
-        proximos_msg = f"\nPróximo pago: {next_pago['nombre']} ({utils.format_currency(next_pago['monto'], moneda)}) el {next_pago['vencimiento']}."
+    next_pago = storage.get_due_index().next_due()
+    if next_pago:
+        proximos_msg = f"\nPróximo pago: {next_pago['nombre']} ({utils.format_currency(next_pago['monto'], agg['moneda'])}) el {next_pago['vencimiento']}."
 
-    return f"📊 Resumen:\n{hoy_msg}\n{semana_msg}\n{mes_msg}{proximos_msg}"
+    return f"📊 Resumen:\n{_hoy_message(agg)}\n{_semana_message(agg)}\n{_mes_message(agg)}{proximos_msg}"
 
 def handle_exportar(args):
-    # exportar mes <YYYY-MM>
-    if len(args) < 2 or args[0] != "mes":
-        return "❌ Formato: exportar mes YYYY-MM"
-    
-    mes_str = args[1] 
-    # Validate format YYYY-MM
+    # exportar mes <YYYY-MM> [categoria...] [gz]
+    # exportar <YYYY-MM-DD>..<YYYY-MM-DD> [categoria...] [gz]
+    formato = "❌ Formato: exportar mes YYYY-MM o exportar YYYY-MM-DD..YYYY-MM-DD [categoría] [gz]"
+    if not args:
+        return formato
+
+    config = storage.get_config()
+    tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
+
+    if args[0] == "mes":
+        if len(args) < 2:
+            return formato
+        periodo = args[1]
+        try:
+            start, end = export.month_range(periodo, tz)
+        except ValueError:
+            return "❌ Formato de fecha inválido. Usa YYYY-MM (ej: 2025-11)."
+        extra = args[2:]
+    elif ".." in args[0]:
+        desde, _, hasta = args[0].partition("..")
+        try:
+            start, end = export.day_range(desde, hasta, tz)
+        except ValueError:
+            return "❌ Rango inválido. Usa YYYY-MM-DD..YYYY-MM-DD (ej: 2025-01-01..2025-06-30)."
+        periodo = f"{desde or 'inicio'}_{hasta or 'hoy'}"
+        extra = args[1:]
+    else:
+        return formato
+
+    compress = "gz" in [a.lower() for a in extra]
+    categorias = [a for a in extra if a.lower() != "gz"]
+
+    filename = f"export_{periodo}"
+    if categorias:
+        filename += "_" + "-".join(c.lower() for c in categorias)
+    filename += ".csv.gz" if compress else ".csv"
+    filepath = os.path.join(storage.partition_dir(), filename)
+
+    rows = export.write_export(filepath, export.open_gastos(start, end, categorias), compress)
+    if not rows:
+        return f"No hay gastos para {periodo.replace('_', '..')}."
+
+    shown_path = os.path.relpath(filepath, os.path.dirname(storage.DATA_DIR))
+    return f"✅ Archivo exportado: {shown_path}\n(Nota: Para enviar el archivo real por WhatsApp se requiere subirlo a la API de Medios, lo cual requiere pasos adicionales. Por ahora se ha guardado localmente)."
+
+def _report_context():
+    config = storage.get_config()
+    tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
+    return tz, config.get("moneda", "COP")
+
+def _table_for(start, tz):
+    """
+    Gasto table for a report starting at start: only the recent gastos
+    when the period is short, the whole cached table otherwise.
+    """
+    if start is not None and start >= datetime.datetime.now(tz) - datetime.timedelta(days=RECENT_WINDOW_DAYS):
+        return storage.get_table(since=start)
+    return storage.get_table()
+
+def handle_reporte(args):
+    # reporte categorias [periodo]
+    # reporte <periodo>   (ej: 2025-01..2025-06)
+    formato = "❌ Formato: reporte categorias [hoy|semana|mes|año|YYYY-MM] o reporte YYYY-MM..YYYY-MM"
+    if not args:
+        return formato
+
+    por_categoria = args[0].lower() in ("categorias", "categorías")
+    spec = (args[1] if len(args) > 1 else "mes") if por_categoria else args[0]
+
+    tz, moneda = _report_context()
     try:
-        datetime.datetime.strptime(mes_str, "%Y-%m")
+        label, start, end = query.resolve_period(spec, tz)
     except ValueError:
-        return "❌ Formato de fecha inválido. Usa YYYY-MM (ej: 2025-11)."
-        
-    gastos = storage.get_gastos()
-    filtered = [g for g in gastos if g["fecha"].startswith(mes_str)]
-    
-    if not filtered:
-        return f"No hay gastos para {mes_str}."
-        
-    # Generate CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["fecha", "monto", "categoria", "detalle", "id"])
-    
-    for g in filtered:
-        writer.writerow([g["fecha"], g["monto"], g["categoria"], g["detalle"], g["id"]])
-        
-    csv_content = output.getvalue()
-    
-    filename = f"export_{mes_str}.csv"
-    filepath = os.path.join("data", filename)
-    with open(filepath, "w") as f:
-        f.write(csv_content)
-        
-    return f"✅ Archivo exportado: {filepath}\n(Nota: Para enviar el archivo real por WhatsApp se requiere subirlo a la API de Medios, lo cual requiere pasos adicionales. Por ahora se ha guardado localmente)."
+        return formato
+
+    table = _table_for(start, tz)
+    if por_categoria:
+        report = query.run(table, start, end, categorias=True)
+        if not report["count"]:
+            return f"No hay gastos en {label}."
+        msg = f"📊 Gastos por categoría ({label}):\n"
+        for categoria, (total, count) in report["categorias"].items():
+            msg += f"- {categoria}: {utils.format_currency(total, moneda)} ({count})\n"
+        msg += f"Total: {utils.format_currency(report['total'], moneda)}"
+        return msg
+
+    # Month-by-month breakdown of the range, from the first gasto if open
+    if start is None and len(table):
+        start = datetime.datetime.fromtimestamp(table.ts[0], tz)
+    if end is None:
+        end = datetime.datetime.now(tz)
+    periods = query.month_periods(start, end, tz) if start else []
+
+    report = query.run(table, start, end, categorias=True, periods=periods)
+    if not report["count"]:
+        return f"No hay gastos en {label}."
+
+    msg = f"📊 Reporte {label}:\n"
+    msg += f"Total: {utils.format_currency(report['total'], moneda)} en {report['count']} gastos.\n"
+    if len(periods) > 1:
+        msg += "Por mes:\n"
+        for mes, total, _ in report["periods"]:
+            msg += f"- {mes}: {utils.format_currency(total, moneda)}\n"
+    msg += "Categorías principales:\n"
+    for categoria, (total, _) in list(report["categorias"].items())[:3]:
+        msg += f"- {categoria}: {utils.format_currency(total, moneda)}\n"
+    return msg.strip()
+
+def handle_top(args):
+    # top [n] [gastos] [periodo]
+    formato = "❌ Formato: top <n> gastos [hoy|semana|mes|año|YYYY-MM]"
+    words = list(args)
+    n = 5
+    if words and words[0].isdigit():
+        n = int(words.pop(0))
+    if words and words[0].lower() == "gastos":
+        words.pop(0)
+    if not 1 <= n <= 50 or len(words) > 1:
+        return formato
+    spec = words[0] if words else "mes"
+
+    tz, moneda = _report_context()
+    try:
+        label, start, end = query.resolve_period(spec, tz)
+    except ValueError:
+        return formato
+
+    report = query.run(_table_for(start, tz), start, end, top=n)
+    if not report["top"]:
+        return f"No hay gastos en {label}."
+
+    msg = f"🏆 Top {len(report['top'])} gastos ({label}):\n"
+    for i, row in enumerate(report["top"], 1):
+        fecha = datetime.datetime.fromtimestamp(row["ts"], tz).strftime("%d/%m")
+        msg += f"{i}. {utils.format_currency(row['monto'], moneda)} — {row['detalle']} ({row['categoria']}, {fecha})\n"
+    return msg.strip()
 
 def handle_ayuda():
     return """🤖 Comandos disponibles:
@@ -293,38 +384,101 @@ def handle_ayuda():
 - *cuanto me queda*: Ver saldo restante.
 - *pagopendiente agregar <nombre> <monto> <fecha>*: Agendar pago.
 - *pagopendiente listar*: Ver pagos pendientes.
+- *pagopendiente pagar <id o nombre>*: Marcar un pago como pagado.
 - *resumen*: Reporte general.
 - *exportar mes <YYYY-MM>*: Exportar a CSV.
+- *exportar <desde>..<hasta> [categoría] [gz]*: Exportar un rango.
+- *reporte categorias [periodo]*: Gastos por categoría (hoy, semana, mes, año o YYYY-MM).
+- *reporte <desde>..<hasta>*: Reporte de un rango (ej: 2025-01..2025-06).
+- *top <n> gastos [periodo]*: Los gastos más grandes.
 """
 
-def parse(message_text):
+def parse(message_text, user_id=None):
+    """
+    Runs a command on behalf of user_id, against that sender's own data.
+    """
+    with storage.user_partition(user_id):
+        return _dispatch(message_text)
+
+# --- Dispatch ---
+
+# Single-word commands: keyword -> (handler, accepts extra words).
+# Handlers with an `args` parameter get the words after the command.
+COMMANDS = {
+    "gasto": (handle_gasto, True),
+    "hoy": (handle_hoy, False),
+    "gastos": (handle_hoy, False),
+    "mes": (handle_mes, True),
+    "semana": (handle_semana, True),
+    "presupuesto": (handle_presupuesto, True),
+    "pagopendiente": (handle_pagopendiente, True),
+    "resumen": (handle_resumen, True),
+    "exportar": (handle_exportar, True),
+    "reporte": (handle_reporte, True),
+    "top": (handle_top, True),
+    "ayuda": (handle_ayuda, True),
+}
+
+# Multi-word commands, matched (lowercased) before the keyword table.
+PHRASES = {
+    "gastos hoy": handle_hoy,
+    "gastos mes": handle_mes,
+    "gastos semana": handle_semana,
+    "cuanto me queda": handle_cuanto_me_queda,
+    "cuánto me queda": handle_cuanto_me_queda,
+}
+
+UNKNOWN_COMMAND = "❓ No entendí. Envía 'ayuda' para ver comandos."
+
+def _takes_args(handler):
+    return "args" in inspect.signature(handler).parameters
+
+def _compile_routes():
+    """
+    Resolves each handler's argument schema once, and compiles the phrases
+    into a single regex (longest first, so a phrase never shadows a longer one).
+    """
+    keywords = {
+        keyword: (handler, lenient, _takes_args(handler))
+        for keyword, (handler, lenient) in COMMANDS.items()
+    }
+    phrases = {phrase: (handler, _takes_args(handler)) for phrase, handler in PHRASES.items()}
+    alternation = "|".join(re.escape(p) for p in sorted(PHRASES, key=len, reverse=True))
+    return keywords, phrases, re.compile(rf"({alternation})(?:\s|$)")
+
+_KEYWORDS, _PHRASE_HANDLERS, _PHRASE_RE = _compile_routes()
+
+def resolve(message_text):
+    """
+    Maps a message to (handler, args), or (None, None) if it isn't a command.
+    """
+    parts = message_text.split()
+    if not parts:
+        return None, None
+
+    match = _PHRASE_RE.match(" ".join(parts).lower())
+    if match:
+        phrase = match.group(1)
+        handler, takes_args = _PHRASE_HANDLERS[phrase]
+        args = parts[phrase.count(" ") + 1:]
+        return handler, (args if takes_args else None)
+
+    entry = _KEYWORDS.get(parts[0].lower())
+    if entry is None:
+        return None, None
+    handler, lenient, takes_args = entry
+    args = parts[1:]
+    if args and not lenient:
+        return None, None
+    return handler, (args if takes_args else None)
+
+def _dispatch(message_text):
     text = message_text.strip()
     if not text:
         return "Mensaje vacío."
-        
-    parts = text.split()
-    cmd = parts[0].lower()
-    args = parts[1:]
-    
-    if cmd == "gasto":
-        return handle_gasto(args)
-    elif cmd in ["hoy", "gastos"] and (len(parts) == 1 or parts[1].lower() == "hoy"):
-        return handle_hoy()
-    elif cmd in ["mes", "gastos"] and (len(parts) > 1 and parts[1].lower() == "mes") or cmd == "mes":
-        return handle_mes()
-    elif cmd in ["semana", "gastos"] and (len(parts) > 1 and parts[1].lower() == "semana") or cmd == "semana":
-        return handle_semana()
-    elif cmd == "presupuesto":
-        return handle_presupuesto(args)
-    elif cmd == "cuanto" and len(parts) >= 3 and parts[1] == "me" and parts[2] == "queda":
-        return handle_cuanto_me_queda()
-    elif cmd == "pagopendiente":
-        return handle_pagopendiente(args)
-    elif cmd == "resumen":
-        return handle_resumen()
-    elif cmd == "exportar":
-        return handle_exportar(args)
-    elif cmd == "ayuda":
-        return handle_ayuda()
-    else:
-        return "❓ No entendí. Envía 'ayuda' para ver comandos."
+
+    handler, args = resolve(text)
+    if handler is None:
+        return UNKNOWN_COMMAND
+    with metrics.timer(metrics.COMMAND_SECONDS, command=handler.__name__[len("handle_"):]):
+        return handler(args) if args is not None else handler()
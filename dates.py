@@ -0,0 +1,150 @@
+"""
+Fast date handling.
+
+Dates typed by users ("2025-11-12", "hoy", "mañana", "viernes") are
+resolved with precompiled patterns and give the same result dateparser
+would; dateparser is only imported for anything else, since importing it
+costs about a quarter of a second and its first parse another tenth.
+
+Range filters over stored ``fecha`` strings decide most records from
+their "YYYY-MM-DD" date key alone and only parse the ones near a bound.
+"""
+import re
+import math
+import datetime
+import functools
+
+ISO_DATE_RE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+
+# Days from today, as dateparser understands them in Spanish
+RELATIVE_DAYS = {
+    "hoy": 0,
+    "ayer": -1,
+    "anteayer": -2,
+    "mañana": 1,
+    "manana": 1,
+}
+
+# Weekday names resolve to the latest such day, today included
+WEEKDAYS = {
+    "lunes": 0,
+    "martes": 1,
+    "miércoles": 2,
+    "miercoles": 2,
+    "jueves": 3,
+    "viernes": 4,
+    "sábado": 5,
+    "sabado": 5,
+    "domingo": 6,
+}
+
+def _localize(naive, tz):
+    if hasattr(tz, "localize"):
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tz)
+
+
+def local_midnight(day, tz):
+    """
+    Aware datetime for 00:00 of a date in tz.
+    """
+    return _localize(datetime.datetime(day.year, day.month, day.day), tz)
+
+
+def parse_date(text, tz):
+    """
+    Timezone-aware datetime for a user-typed date in tz, or None.
+    Keywords keep the current time of day; dates and weekdays are at midnight.
+    """
+    key = (text or "").strip().lower()
+    if not key:
+        return None
+
+    m = ISO_DATE_RE.fullmatch(key)
+    if m:
+        try:
+            day = datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+        return local_midnight(day, tz)
+
+    if key in RELATIVE_DAYS:
+        now = datetime.datetime.now(tz)
+        if not RELATIVE_DAYS[key]:
+            return now
+        return _localize(now.replace(tzinfo=None) + datetime.timedelta(days=RELATIVE_DAYS[key]), tz)
+
+    if key in WEEKDAYS:
+        today = datetime.datetime.now(tz).date()
+        return local_midnight(today - datetime.timedelta(days=(today.weekday() - WEEKDAYS[key]) % 7), tz)
+
+    return parse_with_dateparser(text, str(tz))
+
+
+def parse_with_dateparser(text, tz_name):
+    """
+    Slow path for free-form dates ("12 de noviembre", "en 3 días").
+    """
+    import dateparser
+    settings = {
+        'TIMEZONE': tz_name,
+        'RETURN_AS_TIMEZONE_AWARE': True
+    }
+    return dateparser.parse(text, settings=settings)
+
+
+def iso_to_epoch(value):
+    """
+    Epoch seconds (floored) of an ISO 8601 string; naive times are local.
+    """
+    return math.floor(datetime.datetime.fromisoformat(value).timestamp())
+
+
+def _utc_day_key(ts, days=0):
+    day = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).date()
+    return (day + datetime.timedelta(days=days)).isoformat()
+
+
+def range_test(start_ts, end_ts):
+    """
+    Predicate telling whether a fecha string falls in start_ts <= t < end_ts
+    (None bounds are open).
+
+    A record's local date is within a day of its UTC date, so dates two or
+    more days clear of a bound are decided by comparing "YYYY-MM-DD" keys;
+    only records near a bound get their exact epoch computed.
+    """
+    # Local dates <= lo_out are surely before start; >= lo_in surely after
+    lo_out = _utc_day_key(start_ts, -2) if start_ts is not None else None
+    lo_in = _utc_day_key(start_ts, 2) if start_ts is not None else None
+    hi_in = _utc_day_key(end_ts, -2) if end_ts is not None else None
+    hi_out = _utc_day_key(end_ts, 2) if end_ts is not None else None
+
+    def test(fecha):
+        if not fecha:
+            return False
+        if len(fecha) >= 10 and fecha[4] == "-" and fecha[7] == "-":
+            day = fecha[:10]
+            if lo_out is not None and day <= lo_out:
+                return False
+            if hi_out is not None and day >= hi_out:
+                return False
+            if (lo_in is None or day >= lo_in) and (hi_in is None or day <= hi_in):
+                return True
+        ts = iso_to_epoch(fecha)
+        if start_ts is not None and ts < start_ts:
+            return False
+        if end_ts is not None and ts >= end_ts:
+            return False
+        return True
+
+    return test
+
+
+@functools.lru_cache(maxsize=4096)
+def week_key(day_key):
+    """
+    ISO week "YYYY-Www" of a "YYYY-MM-DD" day. Raises ValueError if invalid.
+    """
+    year, week, _ = datetime.date.fromisoformat(day_key).isocalendar()
+    return f"{year}-W{week:02d}"
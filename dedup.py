@@ -0,0 +1,150 @@
+"""
+Deduplication of redelivered webhook messages, keyed by WhatsApp message id.
+
+Meta redelivers a webhook when we answer slowly, and replaying a "gasto"
+would record it twice. Ids are remembered in a bounded in-memory TTL/LRU
+map, backed by a small SQLite table shared by all gunicorn workers: the
+first worker to insert an id owns the message, everyone else sees a hit.
+
+A message is claimed before it is processed, so a crash mid-processing
+means a redelivery is dropped rather than applied twice.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", str(24 * 3600)))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "10000"))
+DEDUP_PATH = os.getenv("DEDUP_PATH")
+
+# Purge expired ids from the shared table every this many new ids
+_PURGE_EVERY = 1000
+
+
+class DedupCache:
+    def __init__(self, path, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.inserted = 0
+
+    def _connect(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, ts REAL NOT NULL)")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def _remember(self, message_id, now):
+        self.recent[message_id] = now + self.ttl
+        self.recent.move_to_end(message_id)
+        while len(self.recent) > self.max_entries:
+            self.recent.popitem(last=False)
+
+    def _seen_in_memory(self, message_id, now):
+        expires = self.recent.get(message_id)
+        if expires is None:
+            return False
+        if expires < now:
+            del self.recent[message_id]
+            return False
+        self.recent.move_to_end(message_id)
+        return True
+
+    def _claim_on_disk(self, message_id, now):
+        """
+        Returns True if this process is the first to see the id.
+        """
+        conn = self._connect()
+        cur = conn.execute(
+            "INSERT INTO seen (id, ts) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET ts = excluded.ts WHERE seen.ts < ?",
+            (message_id, now, now - self.ttl)
+        )
+        claimed = cur.rowcount == 1
+        if claimed:
+            with self.lock:
+                self.inserted += 1
+                purge = self.inserted % _PURGE_EVERY == 0
+            if purge:
+                conn.execute("DELETE FROM seen WHERE ts < ?", (now - self.ttl,))
+        return claimed
+
+    def is_duplicate(self, message_id):
+        """
+        Records the id and tells whether it had already been seen.
+        """
+        now = time.time()
+        with self.lock:
+            if self._seen_in_memory(message_id, now):
+                self.hits += 1
+                return True
+
+        try:
+            duplicate = not self._claim_on_disk(message_id, now)
+        except sqlite3.Error as e:
+            # Fall back to this worker's memory rather than dropping messages
+            logger.error(f"Dedup store unavailable: {e}")
+            duplicate = False
+
+        with self.lock:
+            self._remember(message_id, now)
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return duplicate
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self.recent)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DedupCache(DEDUP_PATH or os.path.join(storage.DATA_DIR, 'dedup.db'))
+        return _cache
+
+
+def is_duplicate(message_id):
+    """
+    True if the message was already handled (or dedup is disabled: False).
+    Messages without an id are never treated as duplicates.
+    """
+    if not DEDUP_ENABLED or not message_id:
+        return False
+    return get_cache().is_duplicate(message_id)
+
+
+@metrics.collector
+def _collect_metrics():
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    return [
+        ("bot_dedup_hits_total", "counter", "Redelivered messages skipped.",
+         [("bot_dedup_hits_total", {}, stats["hits"])]),
+        ("bot_dedup_misses_total", "counter", "New message ids seen.",
+         [("bot_dedup_misses_total", {}, stats["misses"])]),
+    ]
@@ -0,0 +1,127 @@
+"""
+Streaming CSV export of gastos.
+
+Rows are produced one at a time from storage.iter_gastos, which drops
+out-of-range records as it reads them, so neither the command nor the
+/export endpoint holds a whole month (or history) in memory. Output can
+be gzip-compressed on the fly.
+"""
+import os
+import csv
+import gzip
+import zlib
+import datetime
+import dates
+import storage
+import utils
+
+CSV_HEADER = ["fecha", "monto", "categoria", "detalle", "id"]
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the formatted line back to csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def month_range(mes_str, tz):
+    """
+    (start, end) datetimes covering a "YYYY-MM" month in tz.
+    """
+    mes = datetime.datetime.strptime(mes_str, "%Y-%m").date()
+    siguiente = (mes + datetime.timedelta(days=32)).replace(day=1)
+    # Each bound gets its own UTC offset, which differs across a DST change
+    return dates.local_midnight(mes, tz), dates.local_midnight(siguiente, tz)
+
+
+def day_range(desde, hasta, tz):
+    """
+    (start, end) datetimes from "YYYY-MM-DD" dates in tz, both days included.
+    Either date may be None for an open range.
+    """
+    start = end = None
+    if desde:
+        start = dates.local_midnight(datetime.date.fromisoformat(desde), tz)
+    if hasta:
+        end = dates.local_midnight(datetime.date.fromisoformat(hasta) + datetime.timedelta(days=1), tz)
+    if start and end and end <= start:
+        raise ValueError("empty range")
+    return start, end
+
+
+def filter_categorias(gastos, categorias):
+    if not categorias:
+        return gastos
+    wanted = {c.lower() for c in categorias}
+    return (g for g in gastos if str(g.get("categoria", "")).lower() in wanted)
+
+
+def iter_rows(gastos):
+    for g in gastos:
+        yield [g.get("fecha"), g.get("monto"), g.get("categoria"), g.get("detalle"), g.get("id")]
+
+
+def iter_csv(gastos):
+    """
+    Yields the CSV text line by line, header first.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in iter_rows(gastos):
+        yield writer.writerow(row)
+
+
+def iter_gzip(chunks):
+    """
+    Gzip-compresses a stream of text chunks as they come.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_export(filepath, gastos, compress=False):
+    """
+    Writes gastos to a CSV (or .csv.gz) file row by row.
+    Returns the number of rows; nothing is left behind when there are none.
+    """
+    tmp_path = filepath + ".tmp"
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(tmp_path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for row in iter_rows(gastos):
+            writer.writerow(row)
+            count += 1
+    if count:
+        os.replace(tmp_path, filepath)
+    else:
+        os.remove(tmp_path)
+    return count
+
+
+def open_gastos(start, end, categorias=None):
+    """
+    Iterator over the current partition's gastos in range and categories.
+    """
+    return filter_categorias(storage.iter_gastos(start, end), categorias)
+
+
+def stream(user_id, desde=None, hasta=None, categorias=None, compress=False):
+    """
+    CSV (or gzip) chunks of a user's gastos between two inclusive dates,
+    for streaming over HTTP. Raises ValueError on malformed dates.
+    """
+    with storage.user_partition(user_id):
+        config = storage.get_config()
+        tz = utils.get_timezone(config.get("timezone", "America/Bogota"))
+        start, end = day_range(desde, hasta, tz)
+        gastos = open_gastos(start, end, categorias)
+    chunks = iter_csv(gastos)
+    return iter_gzip(chunks) if compress else (c.encode('utf-8') for c in chunks)
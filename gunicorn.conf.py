@@ -0,0 +1,70 @@
+"""
+Gunicorn settings, read from the environment.
+
+With GUNICORN_PRELOAD=1 the app is imported once in the master before
+forking, and so are the dependencies the app defers until a command needs
+them, so every worker shares those pages copy-on-write instead of loading
+its own copy. Thread pools, sockets and database connections are all
+created lazily per process, so nothing opened here leaks into the workers.
+
+With STORAGE_BACKEND=daemon the master also starts storage_daemon.py
+(unless STORAGE_DAEMON_SPAWN=0, for a daemon run separately) and stops it
+on exit, so workers can be restarted without the data going cold.
+"""
+import os
+import sys
+import time
+import subprocess
+import importlib
+from dotenv import load_dotenv
+
+# The master imports the app (preload) and storage_client itself, and the
+# daemon it spawns inherits this environment
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+# Imported lazily by the app; worth loading in the master when preloading
+PRELOAD_MODULES = ("pytz", "requests", "dateparser")
+
+spawn_daemon = os.getenv("STORAGE_BACKEND") == "daemon" and os.getenv("STORAGE_DAEMON_SPAWN", "1") == "1"
+_daemon = None
+
+
+def _start_storage_daemon(server):
+    global _daemon
+    import storage_client
+    here = os.path.dirname(os.path.abspath(__file__))
+    _daemon = subprocess.Popen([sys.executable, os.path.join(here, "storage_daemon.py")])
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            storage_client.call("get_config")
+            break
+        except storage_client.DaemonError:
+            if _daemon.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The storage daemon did not start")
+            time.sleep(0.05)
+    # The workers open their own connections
+    storage_client.close()
+    server.log.info(f"Storage daemon started (pid {_daemon.pid})")
+
+
+def on_starting(server):
+    if spawn_daemon:
+        _start_storage_daemon(server)
+    if not preload_app:
+        return
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            server.log.warning(f"Could not preload {name}: {e}")
+
+
+def on_exit(server):
+    if _daemon is not None:
+        _daemon.terminate()
+        _daemon.wait(timeout=10)
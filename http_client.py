@@ -0,0 +1,276 @@
+"""
+Shared outbound HTTP client for the WhatsApp Cloud API.
+
+One pooled keep-alive session per process (HTTP/2 through httpx when
+OUTBOUND_HTTP2=1 and it is installed), so replies reuse the TCP+TLS
+connection to graph.facebook.com. Sends return futures: attempts run on a
+small thread pool, and retries (429, 5xx, network errors) are scheduled on
+a timer with jittered backoff, honouring Retry-After, instead of sleeping
+on the calling thread.
+"""
+import os
+import time
+import heapq
+import atexit
+import random
+import logging
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import metrics
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("OUTBOUND_POOL_SIZE", "10"))
+TIMEOUT = float(os.getenv("OUTBOUND_TIMEOUT", "10"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "1"))
+BACKOFF_CAP = float(os.getenv("OUTBOUND_BACKOFF_CAP", "30"))
+# Upper bound for a server-provided Retry-After, in seconds
+RETRY_AFTER_MAX = float(os.getenv("OUTBOUND_RETRY_AFTER_MAX", "300"))
+HTTP2 = os.getenv("OUTBOUND_HTTP2", "0") == "1"
+
+# Upper bounds (seconds) of the send latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self.lock:
+            self.counts[i] += 1
+            self.total += seconds
+
+    def snapshot(self):
+        with self.lock:
+            cumulative, out = 0, {}
+            for le, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+                cumulative += n
+                out[str(le)] = cumulative
+            return {"buckets": out, "count": cumulative, "sum": round(self.total, 6)}
+
+
+class RetryScheduler:
+    """
+    Runs callables at a later time from a single timer thread.
+    """
+    def __init__(self):
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def call_later(self, delay, fn):
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), fn))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="outbound-retry", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                due, _, fn = self.heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Error running scheduled retry: {e}")
+
+
+def _make_session(pool_size, http2):
+    if http2:
+        try:
+            import httpx
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            return httpx.Client(http2=True, limits=limits)
+        except ImportError:
+            logger.warning("httpx[http2] is not installed, using HTTP/1.1 keep-alive.")
+
+    # Imported here so workers only pay for requests once they send a reply
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date).
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class OutboundClient:
+    def __init__(self, pool_size=POOL_SIZE, timeout=TIMEOUT, max_attempts=MAX_ATTEMPTS,
+                 backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP, http2=HTTP2):
+        self.session = _make_session(pool_size, http2)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="outbound")
+        self.scheduler = RetryScheduler()
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.send_latency = LatencyHistogram()
+        self.attempt_latency = LatencyHistogram()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.counters = {"sent": 0, "failed": 0, "retries": 0, "rate_limited": 0, "errors": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def backoff(self, attempt):
+        """
+        Jittered exponential backoff: half fixed, half random.
+        """
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def post_async(self, url, headers, payload):
+        """
+        POSTs a JSON payload, retrying as needed. Returns a Future that
+        resolves to True on a 2xx response, False once retries are exhausted.
+        """
+        future = Future()
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._forget)
+        self.executor.submit(self._attempt, url, headers, payload, 0, future, time.monotonic())
+        return future
+
+    def _forget(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def _attempt(self, url, headers, payload, attempt, future, started):
+        t0 = time.monotonic()
+        response, status, error = None, None, None
+        try:
+            response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+            status = response.status_code
+        except Exception as e:
+            error = e
+        self.attempt_latency.observe(time.monotonic() - t0)
+
+        if status is not None and 200 <= status < 300:
+            self._count("sent")
+            self._observe_send(started)
+            future.set_result(True)
+            return
+
+        self._count("errors")
+        if status == 429:
+            self._count("rate_limited")
+        retryable = status is None or status == 429 or status >= 500
+        reason = error if error is not None else f"HTTP {status}"
+        logger.warning(f"Attempt {attempt+1} failed to send message: {reason}")
+
+        if retryable and attempt + 1 < self.max_attempts:
+            delay = None
+            if response is not None:
+                delay = parse_retry_after(response.headers.get("Retry-After"))
+            delay = min(delay, RETRY_AFTER_MAX) if delay is not None else self.backoff(attempt)
+            self._count("retries")
+            self.scheduler.call_later(delay, lambda: self._resubmit(url, headers, payload, attempt + 1, future, started))
+            return
+
+        logger.error(f"Failed to send message after {attempt+1} attempts.")
+        self._count("failed")
+        self._observe_send(started)
+        future.set_result(False)
+
+    def _observe_send(self, started):
+        seconds = time.monotonic() - started
+        self.send_latency.observe(seconds)
+        metrics.observe(metrics.SEND_SECONDS, seconds)
+
+    def _resubmit(self, url, headers, payload, attempt, future, started):
+        try:
+            self.executor.submit(self._attempt, url, headers, payload, attempt, future, started)
+        except RuntimeError:
+            # Executor shut down while the retry was waiting
+            self._count("failed")
+            future.set_result(False)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters["in_flight"] = len(self.pending)
+        counters["send_latency_seconds"] = self.send_latency.snapshot()
+        counters["attempt_latency_seconds"] = self.attempt_latency.snapshot()
+        return counters
+
+    def close(self, timeout=10):
+        """
+        Waits for in-flight sends (including scheduled retries), then closes.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending, timeout=timeout)
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Process-wide client, created lazily so each gunicorn worker gets its own
+    pool after the fork.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OutboundClient()
+            atexit.register(_client.close)
+        return _client
+
+
+@metrics.collector
+def _collect_metrics():
+    if _client is None:
+        return []
+    stats = _client.stats()
+    counters = [(f"bot_outbound_{name}_total", "counter", f"Outbound sends: {name}.",
+                 [(f"bot_outbound_{name}_total", {}, stats[name])])
+                for name in ("sent", "failed", "retries", "rate_limited", "errors")]
+    return counters + [
+        ("bot_outbound_in_flight", "gauge", "Outbound sends not finished yet.",
+         [("bot_outbound_in_flight", {}, stats["in_flight"])]),
+        ("bot_outbound_send_seconds", "histogram", "Time to deliver a message, retries included.",
+         metrics.histogram_samples("bot_outbound_send_seconds", stats["send_latency_seconds"])),
+        ("bot_outbound_attempt_seconds", "histogram", "Time of each outbound HTTP attempt.",
+         metrics.histogram_samples("bot_outbound_attempt_seconds", stats["attempt_latency_seconds"])),
+    ]
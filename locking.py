@@ -0,0 +1,44 @@
+import os
+import time
+import fcntl
+import metrics
+
+
+def flock(f, mode):
+    """
+    fcntl.flock that records the time spent waiting for the lock.
+    """
+    if not metrics.METRICS_ENABLED:
+        fcntl.flock(f, mode)
+        return
+    started = time.perf_counter()
+    fcntl.flock(f, mode)
+    metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, file=os.path.basename(f.name))
+
+
+class FileLock:
+    """
+    flock on a sidecar ``<path>.lock`` file.
+
+    Data files that get replaced (compaction, snapshots) can't carry their own
+    lock, since a new inode means a new lock; the sidecar file never moves.
+    """
+    def __init__(self, path, shared=False):
+        self.lock_path = path + ".lock"
+        self.mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.lock_path, 'a')
+        try:
+            flock(self.f, self.mode)
+        except BaseException:
+            self.f.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        finally:
+            self.f.close()
@@ -0,0 +1,218 @@
+"""
+Logging setup for the app.
+
+Log calls only put the record on an in-memory queue; a listener thread
+formats it and writes it to stderr and to a rotating file, so a slow disk
+never blocks a request. Formatting is deferred to that thread as well:
+with %-style arguments the message is only built if it is written.
+
+- LOG_FILE (default bot.log; empty for stderr only), rotated by size
+  (LOG_ROTATE=size, LOG_MAX_BYTES), by time (LOG_ROTATE=time,
+  LOG_ROTATE_WHEN) or by an external logrotate (LOG_ROTATE=external),
+  keeping LOG_BACKUP_COUNT old files.
+- LOG_FORMAT=json writes one JSON object per line, ``extra=`` fields included.
+- LOG_WEBHOOK_BODY and LOG_WEBHOOK_SAMPLE control how much of each
+  webhook body is logged (see webhook_payload).
+"""
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import datetime
+import logging.handlers
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# "summary" (ids, senders masked, types), "redacted", "full" or "off"
+LOG_WEBHOOK_BODY = os.getenv("LOG_WEBHOOK_BODY", "summary")
+# Fraction of webhook bodies logged
+LOG_WEBHOOK_SAMPLE = float(os.getenv("LOG_WEBHOOK_SAMPLE", "1"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _extras(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """
+    The usual one-line format, followed by any extra= fields as JSON.
+    """
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        line = super().format(record)
+        extras = _extras(record)
+        if extras:
+            line += " " + json.dumps(extras, ensure_ascii=False, default=str)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extras(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records untouched. The stock prepare() formats the message on
+    the calling thread; here that is left to the listener.
+    """
+    def prepare(self, record):
+        return record
+
+
+def _build_handlers():
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        if LOG_ROTATE == "time":
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"))
+        elif LOG_ROTATE == "external":
+            handlers.append(logging.handlers.WatchedFileHandler(LOG_FILE, encoding="utf-8"))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+_handler = None
+_listener = None
+_fork_hook = False
+
+
+def _start_listener():
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, *_build_handlers())
+    _listener.start()
+
+
+def _after_fork():
+    # The listener thread does not survive a fork (gunicorn preload), so
+    # each process drains its own queue
+    global _listener
+    if _listener is None:
+        return
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _start_listener()
+
+
+def setup():
+    """
+    Routes the root logger through the queue. Calling it again does nothing.
+    """
+    global _handler, _fork_hook
+    if _handler is not None:
+        return
+    _handler = DeferredQueueHandler(None)
+    _start_listener()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_handler)
+    atexit.register(stop)
+    if not _fork_hook:
+        os.register_at_fork(after_in_child=_after_fork)
+        _fork_hook = True
+
+
+def stop():
+    """
+    Writes out the queued records and stops the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+# --- Webhook payloads ---
+
+_PHONE_KEYS = {"from", "wa_id", "recipient_id", "display_phone_number"}
+_TEXT_KEYS = {"body", "caption", "name"}
+
+
+def mask_phone(number):
+    number = str(number or "")
+    if len(number) <= 5:
+        return "*" * len(number)
+    return number[:3] + "*" * (len(number) - 5) + number[-2:]
+
+
+def _redact(value, key=None):
+    if isinstance(value, dict):
+        return {k: _redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v, key) for v in value]
+    if key in _PHONE_KEYS:
+        return mask_phone(value)
+    if key in _TEXT_KEYS and isinstance(value, str):
+        return f"<{len(value)} chars>"
+    return value
+
+
+def _dicts(value, key):
+    """
+    The dict items of value[key]; the body is not validated yet, so
+    anything else is skipped.
+    """
+    items = value.get(key) if isinstance(value, dict) else None
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+
+def _summary(body):
+    if not isinstance(body, dict):
+        return {"type": type(body).__name__}
+    messages, statuses = [], 0
+    for entry in _dicts(body, "entry"):
+        for change in _dicts(entry, "changes"):
+            value = change.get("value")
+            statuses += len(_dicts(value, "statuses"))
+            for m in _dicts(value, "messages"):
+                messages.append({"id": m.get("id"), "from": mask_phone(m.get("from")), "type": m.get("type")})
+    return {"messages": messages, "statuses": statuses}
+
+
+def webhook_payload(body):
+    """
+    What to log of a webhook body, per LOG_WEBHOOK_BODY, or None if this
+    one is not logged (LOG_WEBHOOK_BODY=off, or left out by sampling).
+    Message texts and phone numbers only appear with "full".
+    """
+    if LOG_WEBHOOK_BODY == "off" or (LOG_WEBHOOK_SAMPLE < 1 and random.random() >= LOG_WEBHOOK_SAMPLE):
+        return None
+    if LOG_WEBHOOK_BODY == "full":
+        return body
+    if LOG_WEBHOOK_BODY == "redacted":
+        return _redact(body)
+    return _summary(body)
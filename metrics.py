@@ -0,0 +1,210 @@
+"""
+Prometheus-style metrics for this worker, served by GET /metrics.
+
+Hot paths are timed with the ``timed`` decorator or the ``timer`` context
+manager; both are no-ops when METRICS_ENABLED is off (``timed`` hands back
+the undecorated function), so the instrumentation costs nothing unless
+metrics are being scraped. Values that only matter at scrape time (file
+sizes, record counts, outbound and dedup counters) are read by collectors
+when /metrics is requested rather than updated on every call.
+
+Metrics are per process: with several gunicorn workers each scrape sees
+the worker that answered it.
+"""
+import os
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labelnames, values, extra=""):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(self.name + _labels_text(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.series.items())
+        out = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for le, n in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += n
+                out.append((self.name + "_bucket" + _labels_text(self.labelnames, key, f'le="{le}"'), cumulative))
+            out.append((self.name + "_count" + _labels_text(self.labelnames, key), cumulative))
+            out.append((self.name + "_sum" + _labels_text(self.labelnames, key), round(total, 6)))
+        return out
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name, help_text, labelnames=()):
+    metric = Counter(name, help_text, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help_text, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def collector(fn):
+    """
+    Registers a function called on every scrape. It returns a list of
+    (name, kind, help, [(sample name, labels dict, value)]) families.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+COMMAND_SECONDS = histogram("bot_command_seconds", "Time to run a bot command.", ("command",))
+STORAGE_SECONDS = histogram("bot_storage_seconds", "Time spent in storage operations.", ("op",))
+LOCK_WAIT_SECONDS = histogram("bot_lock_wait_seconds", "Time spent waiting for file locks.", ("file",))
+WEBHOOK_MESSAGES = counter("bot_webhook_messages_total", "Webhook messages by outcome.", ("result",))
+SEND_SECONDS = histogram("bot_send_message_seconds", "Time to deliver a WhatsApp message, retries included.",
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+def timed(metric, **labels):
+    """
+    Decorator observing the call duration in a histogram. With metrics
+    disabled the function is returned untouched.
+    """
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(metric, **labels):
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - started, **labels)
+
+
+def inc(metric, amount=1, **labels):
+    if METRICS_ENABLED:
+        metric.inc(amount, **labels)
+
+
+def observe(metric, seconds, **labels):
+    if METRICS_ENABLED:
+        metric.observe(seconds, **labels)
+
+
+def histogram_samples(name, snapshot, labels=None):
+    """
+    Samples of a {"buckets": {le: cumulative}, "count", "sum"} snapshot,
+    as produced by http_client.LatencyHistogram.
+    """
+    labels = labels or {}
+    samples = [(name + "_bucket", dict(labels, le=le), n) for le, n in snapshot["buckets"].items()]
+    samples.append((name + "_count", labels, snapshot["count"]))
+    samples.append((name + "_sum", labels, snapshot["sum"]))
+    return samples
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _metrics:
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {value}" for name, value in samples)
+
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            logger.error(f"Metrics collector {fn.__name__} failed: {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in samples:
+                lines.append(f"{sample}{_labels_text(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
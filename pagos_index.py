@@ -0,0 +1,43 @@
+"""
+Due-date index of pagos pendientes.
+
+Pending pagos are kept sorted by ``vencimiento`` (ties in the order they
+were added), so listing them, finding the next one due or the ones due by
+a given day is a slice or a bisect instead of a filter and a sort of
+every pago on each call.
+"""
+import bisect
+
+
+class DueIndex:
+    def __init__(self, pagos):
+        # sorted() is stable, so pagos due the same day keep their order
+        self.pending = sorted((p for p in pagos if not p.get("pagado")),
+                              key=lambda p: p.get("vencimiento", ""))
+        self.keys = [p.get("vencimiento", "") for p in self.pending]
+
+    def __len__(self):
+        return len(self.pending)
+
+    def next_due(self):
+        return self.pending[0] if self.pending else None
+
+    def due_until(self, day):
+        """
+        Pending pagos with vencimiento <= day ("YYYY-MM-DD").
+        """
+        return self.pending[:bisect.bisect_right(self.keys, day)]
+
+    def find(self, ref):
+        """
+        The pending pago with this id, else the earliest one due with this
+        nombre (case-insensitive). None if there is none.
+        """
+        for p in self.pending:
+            if p.get("id") == ref:
+                return p
+        ref = ref.lower()
+        for p in self.pending:
+            if str(p.get("nombre", "")).lower() == ref:
+                return p
+        return None
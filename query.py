@@ -0,0 +1,133 @@
+"""
+Query engine behind the ``reporte`` and ``top`` commands.
+
+Reports run against the columnar gasto table (storage.get_table), so a
+whole report is answered from one table with no reloading per section:
+
+- the range and its sub-periods (e.g. each month) come from bisects and
+  running sums, without touching the rows;
+- the per-category totals and the top-k gastos come from the table's own
+  by_category and top over the rows in range (vectorized with NumPy on
+  large ranges).
+"""
+import re
+import datetime
+import dates
+import utils
+
+DAY = r"\d{4}-\d{2}-\d{2}"
+MONTH = r"\d{4}-\d{2}"
+RANGE_RE = re.compile(rf"({DAY}|{MONTH})?\.\.({DAY}|{MONTH})?")
+MONTH_RE = re.compile(MONTH)
+
+
+def _first_of_month(day, months=0):
+    month = day.month - 1 + months
+    return datetime.date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _range_start(text):
+    if len(text) == 7:
+        return datetime.date.fromisoformat(text + "-01")
+    return datetime.date.fromisoformat(text)
+
+
+def _range_end(text):
+    """
+    Day after an inclusive range end ("YYYY-MM" covers the whole month).
+    """
+    if len(text) == 7:
+        return _first_of_month(datetime.date.fromisoformat(text + "-01"), 1)
+    return datetime.date.fromisoformat(text) + datetime.timedelta(days=1)
+
+
+def resolve_period(spec, tz, today=None):
+    """
+    (label, start, end) for a period spec, start and end being aware
+    datetimes (end exclusive) or None for an open end.
+
+    Specs: hoy, ayer, semana, mes, año, YYYY-MM, and ranges
+    A..B where A and B are YYYY-MM or YYYY-MM-DD (both included).
+    Raises ValueError for anything else.
+    """
+    spec = spec.lower()
+    if today is None:
+        today = datetime.datetime.now(tz).date()
+
+    if spec in ("hoy", "ayer"):
+        day = today if spec == "hoy" else today - datetime.timedelta(days=1)
+        first, last = day, day + datetime.timedelta(days=1)
+        label = day.isoformat()
+    elif spec == "semana":
+        first = today - datetime.timedelta(days=today.weekday())
+        last = first + datetime.timedelta(days=7)
+        label = f"semana del {first.strftime('%d/%m')}"
+    elif spec == "mes":
+        first, last = _first_of_month(today), _first_of_month(today, 1)
+        label = first.strftime("%Y-%m")
+    elif spec in ("año", "ano"):
+        first, last = datetime.date(today.year, 1, 1), datetime.date(today.year + 1, 1, 1)
+        label = str(today.year)
+    elif MONTH_RE.fullmatch(spec):
+        first = _range_start(spec)
+        last = _first_of_month(first, 1)
+        label = spec
+    else:
+        m = RANGE_RE.fullmatch(spec)
+        if not m or not (m.group(1) or m.group(2)):
+            raise ValueError(f"unknown period {spec!r}")
+        first = _range_start(m.group(1)) if m.group(1) else None
+        last = _range_end(m.group(2)) if m.group(2) else None
+        if first and last and last <= first:
+            raise ValueError("empty range")
+        label = spec
+
+    start = dates.local_midnight(first, tz) if first else None
+    end = dates.local_midnight(last, tz) if last else None
+    return label, start, end
+
+
+def month_periods(start, end, tz):
+    """
+    [(label, start, end)] for each calendar month overlapping [start, end),
+    clipped to the range.
+    """
+    periods = []
+    day = start.date()
+    while True:
+        month_start = max(start, dates.local_midnight(_first_of_month(day), tz))
+        month_end = min(end, dates.local_midnight(_first_of_month(day, 1), tz))
+        if month_start >= month_end:
+            break
+        periods.append((day.strftime("%Y-%m"), month_start, month_end))
+        day = _first_of_month(day, 1)
+    return periods
+
+
+def run(table, start=None, end=None, categorias=False, top=0, periods=()):
+    """
+    Report over the gastos with start <= fecha < end:
+
+        {"total", "count",
+         "periods": [(label, total, count)],      # one per given sub-period
+         "categorias": {name: (total, count)},    # if categorias, largest first
+         "top": [row]}                            # the `top` largest gastos
+
+    Rows are dicts with ts, monto, categoria and detalle.
+    """
+    start_ts, end_ts = utils.to_epoch(start), utils.to_epoch(end)
+    total, count = table.sum_between(start_ts, end_ts)
+    report = {
+        "total": total,
+        "count": count,
+        "periods": [(label, *table.sum_between(utils.to_epoch(s), utils.to_epoch(e))) for label, s, e in periods],
+        "categorias": None,
+        "top": [],
+    }
+    if not count or not (categorias or top):
+        report["categorias"] = {} if categorias else None
+        return report
+
+    report["categorias"] = table.by_category(start_ts, end_ts) if categorias else None
+    report["top"] = [table.row(i) for i in table.top(top, start_ts, end_ts)] if top else []
+    return report
@@ -0,0 +1,307 @@
+"""
+WhatsApp reminders for pagos pendientes.
+
+When a pago is added, a reminder is stored in a small SQLite table shared
+by all gunicorn workers (data/reminders.db), due at REMINDER_HOUR local
+time REMINDER_DAYS_BEFORE days before its vencimiento.
+
+Every worker runs a scheduler thread, but only the one holding the
+data/reminders.lock flock (the leader) sends anything; the others block on
+the lock and one of them takes over if the leader dies. The leader sleeps
+until the next reminder is due, on a Unix datagram socket that
+schedule() pokes from any worker when it adds an earlier reminder, so
+nothing polls. Due reminders go out in batches, one message per user
+listing all their pagos due, sent concurrently.
+"""
+import os
+import time
+import socket
+import atexit
+import sqlite3
+import logging
+import datetime
+import threading
+from concurrent.futures import wait
+import dates
+import storage
+import utils
+from locking import FileLock
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "0") == "1"
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "9"))
+REMINDER_DAYS_BEFORE = int(os.getenv("REMINDER_DAYS_BEFORE", "1"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "50"))
+# Seconds before retrying a reminder whose message could not be delivered
+REMINDER_RETRY_DELAY = float(os.getenv("REMINDER_RETRY_DELAY", "600"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    user TEXT NOT NULL,
+    pago_id TEXT NOT NULL,
+    due_ts INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, pago_id)
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_ts);
+"""
+
+
+def reminder_time(vencimiento, tz):
+    """
+    Aware datetime at which a pago due on vencimiento ("YYYY-MM-DD") is reminded.
+    """
+    day = datetime.date.fromisoformat(vencimiento) - datetime.timedelta(days=REMINDER_DAYS_BEFORE)
+    return dates.local_midnight(day, tz) + datetime.timedelta(hours=REMINDER_HOUR)
+
+
+def format_reminder(pagos, moneda):
+    msg = "🔔 Recordatorio de pagos:\n"
+    for p in pagos:
+        msg += f"- {p['nombre']}: {utils.format_currency(p['monto'], moneda)} (vence {p['vencimiento']})\n"
+    return msg.strip()
+
+
+class ReminderScheduler:
+    def __init__(self, data_dir, send_async, batch_size=REMINDER_BATCH_SIZE):
+        self.db_path = os.path.join(data_dir, "reminders.db")
+        self.lock_base = os.path.join(data_dir, "reminders")
+        self.sock_path = os.path.join(data_dir, "reminders.sock")
+        self.send_async = send_async
+        self.batch_size = batch_size
+        self.local = threading.local()
+        self.thread = None
+        self.stopped = False
+        self.is_leader = False
+        self.sent = 0
+        self.failed = 0
+
+    def _connect(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    # --- Any worker ---
+
+    def schedule(self, user, pago, due_ts):
+        self._connect().execute(
+            "INSERT INTO reminders (user, pago_id, due_ts) VALUES (?, ?, ?) "
+            "ON CONFLICT(user, pago_id) DO UPDATE SET due_ts = excluded.due_ts, attempts = 0",
+            (user, pago["id"], int(due_ts))
+        )
+        self.wake()
+
+    def cancel(self, user, pago_id):
+        self._connect().execute("DELETE FROM reminders WHERE user = ? AND pago_id = ?", (user, pago_id))
+
+    def wake(self):
+        """
+        Makes the leader re-read the next due time, whichever worker it is.
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                s.setblocking(False)
+                s.sendto(b"w", self.sock_path)
+        except OSError:
+            # No leader listening yet; it reads the table when it starts
+            pass
+
+    # --- Leader ---
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake()
+
+    def _run(self):
+        try:
+            with FileLock(self.lock_base):
+                if self.stopped:
+                    return
+                self.is_leader = True
+                logger.info(f"Reminder scheduler is the leader (pid {os.getpid()}).")
+                self._lead()
+        except Exception as e:
+            logger.error(f"Reminder scheduler stopped: {e}")
+        finally:
+            self.is_leader = False
+
+    def _bind(self):
+        # Holding the leader lock, so a leftover socket file is stale
+        try:
+            os.unlink(self.sock_path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.sock_path)
+        return sock
+
+    def _lead(self):
+        sock = self._bind()
+        try:
+            while not self.stopped:
+                try:
+                    delay = self.run_due()
+                except Exception as e:
+                    logger.error(f"Error sending reminders: {e}")
+                    delay = REMINDER_RETRY_DELAY
+                # settimeout(0) would make recv non-blocking
+                sock.settimeout(None if delay is None else max(delay, 0.01))
+                try:
+                    sock.recv(16)
+                except socket.timeout:
+                    pass
+        finally:
+            sock.close()
+
+    def next_due_in(self, now=None):
+        """
+        Seconds until the next reminder (0 if overdue), None if there is none.
+        """
+        (due,) = self._connect().execute("SELECT MIN(due_ts) FROM reminders").fetchone()
+        if due is None:
+            return None
+        return max(0.0, due - (now if now is not None else time.time()))
+
+    def run_due(self, now=None):
+        """
+        Sends every reminder that is due, a batch at a time. Returns the
+        seconds until the next one (None if there is none).
+        """
+        now = now if now is not None else time.time()
+        conn = self._connect()
+        while True:
+            rows = conn.execute(
+                "SELECT user, pago_id, attempts FROM reminders WHERE due_ts <= ? ORDER BY due_ts LIMIT ?",
+                (int(now), self.batch_size)
+            ).fetchall()
+            if not rows:
+                return self.next_due_in(now)
+            self._send_batch(rows, now)
+            if self.stopped:
+                return None
+
+    def _send_batch(self, rows, now):
+        by_user = {}
+        for user, pago_id, attempts in rows:
+            by_user.setdefault(user, {})[pago_id] = attempts
+
+        futures = {}
+        for user, pago_ids in by_user.items():
+            with storage.user_partition(user):
+                index = storage.get_due_index()
+                moneda = storage.get_config().get("moneda", "COP")
+            pagos = [p for p in index.pending if p.get("id") in pago_ids]
+            if not pagos:
+                # Paid (or deleted) since the reminder was scheduled
+                self._done(user, pago_ids)
+                continue
+            try:
+                futures[user] = self.send_async(user, format_reminder(pagos, moneda))
+            except Exception as e:
+                logger.error(f"Error sending reminder to {user}: {e}")
+                self.failed += 1
+                self._retry(user, pago_ids, now)
+        wait(list(futures.values()))
+
+        for user, future in futures.items():
+            delivered = not future.exception() and future.result()
+            if delivered:
+                self.sent += 1
+                self._done(user, by_user[user])
+                continue
+            self.failed += 1
+            logger.warning(f"Reminder to {user} was not delivered.")
+            self._retry(user, by_user[user], now)
+
+    def _done(self, user, pago_ids):
+        self._connect().executemany(
+            "DELETE FROM reminders WHERE user = ? AND pago_id = ?", [(user, pid) for pid in pago_ids]
+        )
+
+    def _retry(self, user, pago_ids, now):
+        conn = self._connect()
+        for pago_id, attempts in pago_ids.items():
+            if attempts + 1 >= REMINDER_MAX_ATTEMPTS:
+                logger.error(f"Giving up on reminder {pago_id} for {user}.")
+                conn.execute("DELETE FROM reminders WHERE user = ? AND pago_id = ?", (user, pago_id))
+            else:
+                conn.execute(
+                    "UPDATE reminders SET due_ts = ?, attempts = ? WHERE user = ? AND pago_id = ?",
+                    (int(now + REMINDER_RETRY_DELAY), attempts + 1, user, pago_id)
+                )
+
+    def stats(self):
+        return {"leader": self.is_leader, "sent": self.sent, "failed": self.failed}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(send_async=None):
+    """
+    Process-wide scheduler. The first call must pass the send function
+    (whatsapp_handler.send_message_async).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and send_async is not None:
+            _scheduler = ReminderScheduler(storage.DATA_DIR, send_async)
+        return _scheduler
+
+
+def start(send_async):
+    """
+    Starts this worker's scheduler thread (when REMINDERS_ENABLED=1).
+    """
+    if not REMINDERS_ENABLED:
+        return None
+    scheduler = get_scheduler(send_async)
+    if scheduler.thread is None:
+        scheduler.start()
+        atexit.register(scheduler.stop)
+    return scheduler
+
+
+def _recipient():
+    # Pagos in the shared files belong to STORAGE_LEGACY_USER, if set
+    return storage.current_user() or storage.LEGACY_USER
+
+
+def schedule(pago, tz):
+    """
+    Stores the reminder for a new pago of the current user. Reminders for
+    pagos already past due are not scheduled.
+    """
+    scheduler = get_scheduler()
+    user = _recipient()
+    if scheduler is None or not user:
+        return
+    try:
+        if datetime.date.fromisoformat(pago["vencimiento"]) < datetime.datetime.now(tz).date():
+            return
+        scheduler.schedule(user, pago, reminder_time(pago["vencimiento"], tz).timestamp())
+    except (ValueError, sqlite3.Error) as e:
+        logger.error(f"Could not schedule reminder for pago {pago.get('id')}: {e}")
+
+
+def cancel(pago_id):
+    scheduler = get_scheduler()
+    user = _recipient()
+    if scheduler is None or not user:
+        return
+    try:
+        scheduler.cancel(user, pago_id)
+    except sqlite3.Error as e:
+        logger.error(f"Could not cancel reminder for pago {pago_id}: {e}")
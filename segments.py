@@ -0,0 +1,220 @@
+"""
+Sealed segments of the JSON gastos file.
+
+When gastos.json passes the size limit it is sealed: renamed to
+gastos_<timestamp>.json (gzipped with STORAGE_SEGMENT_COMPRESS=1) and
+listed in a manifest, gastos.segments.json, with its record count and the
+epochs of its first and last fecha. A new, empty gastos.json takes over.
+
+Reads see the sealed segments plus the active file, and a range query
+only opens the segments whose [min_ts, max_ts] overlaps the range.
+
+Sealing writes the manifest entry before renaming the file, so the
+files on disk never count a gasto twice or miss one: until the rename
+the entry points at a file that does not exist yet (skipped) and the
+gastos are still in the active file. A reader still has to see the
+manifest and the active file as of the same moment; storage reads them
+lock-free and starts over if either was replaced meanwhile. recover()
+tidies up after a crash at any step, and adopts rotated files from
+before manifests existed.
+"""
+import os
+import re
+import json
+import gzip
+import logging
+import datetime
+import utils
+import codec
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+COMPRESS = os.getenv("STORAGE_SEGMENT_COMPRESS", "0") == "1"
+
+
+def manifest_path(path):
+    return os.path.splitext(path)[0] + ".segments.json"
+
+
+def _segment_re(path):
+    name = re.escape(os.path.splitext(os.path.basename(path))[0])
+    return re.compile(rf"{name}_\d{{8}}_\d{{6}}(?:_\d+)?\.json(?:\.gz)?")
+
+
+def _stem(name):
+    return name[:-3] if name.endswith(".gz") else name
+
+
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    """
+    Segments of the gastos file at path, oldest first; None if there is
+    no (readable) manifest.
+    """
+    try:
+        with open(manifest_path(path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Unreadable segment manifest for {path}, it will be rebuilt: {e}")
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest["segments"]
+
+
+def _save_manifest(path, segments):
+    manifest = {"version": MANIFEST_VERSION, "segments": segments}
+    _write_atomic(manifest_path(path), json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"))
+
+
+def describe(records):
+    """
+    Manifest fields of a list of gastos: count and min/max fecha epochs.
+    """
+    lo = hi = None
+    for g in records:
+        try:
+            ts = utils.to_epoch(g.get("fecha"))
+        except (ValueError, TypeError):
+            continue
+        if ts is None:
+            continue
+        lo = ts if lo is None or ts < lo else lo
+        hi = ts if hi is None or ts > hi else hi
+    return {"count": len(records), "min_ts": lo, "max_ts": hi}
+
+
+def read_bytes(path):
+    """
+    Contents of a segment file, uncompressed.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+def read_segment(path):
+    return codec.loads(read_bytes(path))
+
+
+def convert(path, codec_name):
+    """
+    Rewrites a sealed segment with another codec, keeping its compression.
+    """
+    data = codec.dumps(read_segment(path), codec_name)
+    _write_atomic(path, gzip.compress(data) if path.endswith(".gz") else data)
+
+
+def overlaps(segment, start_ts=None, end_ts=None):
+    if segment["min_ts"] is None:
+        # No valid fecha to go by
+        return True
+    return ((start_ts is None or segment["max_ts"] >= start_ts)
+            and (end_ts is None or segment["min_ts"] < end_ts))
+
+
+def segment_paths(path, segments, start_ts=None, end_ts=None):
+    """
+    Paths of the segments overlapping [start_ts, end_ts) that exist on disk.
+    """
+    directory = os.path.dirname(path)
+    paths = []
+    for s in segments:
+        if overlaps(s, start_ts, end_ts):
+            segment_path = os.path.join(directory, s["file"])
+            if os.path.exists(segment_path):
+                paths.append(segment_path)
+    return paths
+
+
+def has_orphans(path):
+    """
+    Whether there are rotated files next to path that no manifest lists yet.
+    """
+    pattern = _segment_re(path)
+    try:
+        return any(pattern.fullmatch(name) for name in os.listdir(os.path.dirname(path)))
+    except FileNotFoundError:
+        return False
+
+
+def recover(path):
+    """
+    Brings the manifest in line with the files on disk and returns its
+    segments. Entries whose file is missing (a crash before the rename) are
+    dropped, an uncompressed copy left next to its .gz is removed, and
+    rotated files not listed yet (a crash after the rename, or rotations
+    from before manifests existed) are added. The caller holds FileLock(path).
+    """
+    directory = os.path.dirname(path)
+    pattern = _segment_re(path)
+    listed = load_manifest(path)
+    names = set(os.listdir(directory))
+
+    segments = [s for s in (listed or []) if s["file"] in names]
+    files = {s["file"] for s in segments}
+    stems = {_stem(name) for name in files}
+    for name in sorted(names):
+        if not pattern.fullmatch(name) or name in files:
+            continue
+        if _stem(name) in stems:
+            # The other copy of a segment being compressed
+            os.remove(os.path.join(directory, name))
+            continue
+        try:
+            entry = dict(file=name, **describe(read_segment(os.path.join(directory, name))))
+        except (ValueError, OSError, EOFError) as e:
+            logger.error(f"Could not read rotated file {name}, leaving it out: {e}")
+            continue
+        segments.append(entry)
+        stems.add(_stem(name))
+        logger.info(f"Added rotated file {name} to the segment manifest ({entry['count']} gastos).")
+
+    segments.sort(key=lambda s: s["file"])
+    if segments != listed:
+        _save_manifest(path, segments)
+    return segments
+
+
+def _new_name(path, names):
+    base = os.path.splitext(os.path.basename(path))[0]
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    name, n = f"{base}_{stamp}.json", 0
+    while name in names or name + ".gz" in names:
+        n += 1
+        name = f"{base}_{stamp}_{n}.json"
+    return name
+
+
+def seal(path, records, compress=None):
+    """
+    Turns the active file at path (holding records) into a sealed segment
+    and returns its manifest entry. The caller holds FileLock(path) and
+    creates the new active file.
+    """
+    segments = recover(path)
+    directory = os.path.dirname(path)
+    entry = dict(file=_new_name(path, set(os.listdir(directory))), **describe(records))
+    segments.append(entry)
+    _save_manifest(path, segments)
+    os.replace(path, os.path.join(directory, entry["file"]))
+
+    if COMPRESS if compress is None else compress:
+        plain = os.path.join(directory, entry["file"])
+        with open(plain, 'rb') as f:
+            _write_atomic(plain + ".gz", gzip.compress(f.read()))
+        entry["file"] += ".gz"
+        _save_manifest(path, segments)
+        os.remove(plain)
+    return entry
@@ -1,47 +1,251 @@
 import json
 import os
-import fcntl
 import shutil
-from datetime import datetime
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+import calendar
+from datetime import date
 import logging
+import codec
+import columnar
+import pagos_index
+import segments
+import storage_index
+import storage_journal
+import storage_sqlite
+import storage_client
+import dates
+import utils
+import metrics
+from locking import FileLock
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 GASTOS_FILE = os.path.join(DATA_DIR, 'gastos.json')
 PAGOS_FILE = os.path.join(DATA_DIR, 'pagos.json')
 CONFIG_FILE = os.path.join(DATA_DIR, 'config.json')
+SQLITE_FILE = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, 'storage.db'))
 
 MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
 
-logging.basicConfig(level=logging.INFO)
+# Backend for gastos/pagos: "json" (one array per file), "journal"
+# (append-only JSON Lines next to the array file, see storage_journal.py)
+# or "sqlite" (WAL database with indexed dates, see storage_sqlite.py).
+# "daemon" sends every call to storage_daemon.py over a Unix socket.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+
+# Keep the per-day/week/month/category aggregate index up to date on writes.
+INDEX_ENABLED = os.getenv("STORAGE_INDEX", "1") == "1"
+
+# Serve parsed files from memory until their (inode, mtime_ns, size) changes.
+READ_CACHE_ENABLED = os.getenv("STORAGE_READ_CACHE", "1") == "1"
+# Partitions whose parsed files, tables and due indexes are kept in memory;
+# the least recently used ones are dropped past this many.
+CACHE_PARTITIONS = int(os.getenv("STORAGE_CACHE_PARTITIONS", "256"))
+# Gastos are appended in time order, give or take batching and clock
+# adjustments: a tail read stops at the first gasto this many seconds
+# older than the window it was asked for.
+TAIL_SLACK_SECONDS = int(os.getenv("STORAGE_TAIL_SLACK", "3600"))
+# fsync JSON files (and their directory) and journal appends on every
+# write; STORAGE_FSYNC=0 trades durability on power loss for write latency
+FSYNC_ENABLED = os.getenv("STORAGE_FSYNC", "1") == "1"
+
+# Encoding the JSON-array files are written with (see codec.py): "json",
+# "compact" or "binary". Files are read whatever codec wrote them.
+STORAGE_CODEC = os.getenv("STORAGE_CODEC", "json")
+
 logger = logging.getLogger(__name__)
 
+# --- Per-user partitions ---
+
+# Sender whose data the current thread/context works on. None means the
+# shared files above, which STORAGE_LEGACY_USER keeps using so a
+# pre-existing single-user history stays with its owner.
+_current_user = contextvars.ContextVar("storage_user", default=None)
+LEGACY_USER = os.getenv("STORAGE_LEGACY_USER")
+
+def _partition_dir(user_id):
+    """
+    data/users/<shard>/<user>/, sharded by a hash prefix so no directory
+    ends up holding thousands of users.
+    """
+    safe_id = "".join(c for c in str(user_id) if c.isalnum() or c in "-_") or "_"
+    shard = hashlib.sha1(safe_id.encode()).hexdigest()[:2]
+    return os.path.join(DATA_DIR, 'users', shard, safe_id)
+
+@contextmanager
+def user_partition(user_id):
+    """
+    Scopes the storage calls made inside the block to one sender's data.
+    The partition is created lazily on first use; None keeps the current one.
+    """
+    if user_id is None:
+        yield
+        return
+    token = _current_user.set(None if user_id == LEGACY_USER else str(user_id))
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+def current_user():
+    return _current_user.get()
+
+def _user_path(default_path):
+    user_id = _current_user.get()
+    if user_id is None:
+        return default_path
+    directory = _partition_dir(user_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(default_path))
+
+def _gastos_file():
+    return _user_path(GASTOS_FILE)
+
+def _pagos_file():
+    return _user_path(PAGOS_FILE)
+
+def _config_file():
+    return _user_path(CONFIG_FILE)
+
+def _sqlite_file():
+    return _user_path(SQLITE_FILE)
+
+def _remote(op, **args):
+    """
+    Runs op in the storage daemon on the current partition.
+    """
+    return storage_client.call(op, _current_user.get(), **args)
+
+# --- Read cache ---
+
+class _PartitionCache:
+    """
+    Cache entries grouped by the partition that stored them (the current
+    user, None for the shared files). Only the CACHE_PARTITIONS partitions
+    used most recently keep theirs, so idle senders don't pin their
+    history in every worker's memory.
+    """
+    def __init__(self):
+        self.partitions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        user = _current_user.get()
+        with self.lock:
+            entries = self.partitions.get(user)
+            if entries is None:
+                return None
+            self.partitions.move_to_end(user)
+            return entries.get(key)
+
+    def put(self, key, value):
+        user = _current_user.get()
+        with self.lock:
+            self.partitions.setdefault(user, {})[key] = value
+            self.partitions.move_to_end(user)
+            while len(self.partitions) > max(CACHE_PARTITIONS, 1):
+                self.partitions.popitem(last=False)
+
+    def discard(self, matches):
+        """
+        Drops the entries whose key matches, in every partition.
+        """
+        with self.lock:
+            for entries in self.partitions.values():
+                for key in [k for k in entries if matches(k)]:
+                    del entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.partitions.clear()
+
+# filepath (or (filepath, view)) -> ((inode, mtime_ns, size), parsed data)
+_read_cache = _PartitionCache()
+
+def _file_signature(filepath):
+    st = os.stat(filepath)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _shallow_copy(data):
+    # Callers may add keys to a config or sort a list, but records
+    # themselves are shared and must be treated as read-only.
+    if isinstance(data, dict):
+        return dict(data)
+    if isinstance(data, list):
+        return list(data)
+    return data
+
+def _cached_read(filepath, loader):
+    """
+    Returns loader(filepath), reusing the parsed result while a stat of the
+    file shows the same inode, mtime and size. The stat is what keeps
+    workers coherent: another process's write changes the signature.
+    """
+    if not READ_CACHE_ENABLED:
+        return loader(filepath)
+    try:
+        signature = _file_signature(filepath)
+    except FileNotFoundError:
+        return loader(filepath)
+
+    entry = _read_cache.get(filepath)
+    if entry is not None and entry[0] == signature:
+        return _shallow_copy(entry[1])
+
+    data = loader(filepath)
+    try:
+        # Don't cache a read that raced with a write
+        if _file_signature(filepath) == signature:
+            _read_cache.put(filepath, (signature, data))
+    except FileNotFoundError:
+        pass
+    return _shallow_copy(data)
+
+def invalidate_cache(filepath=None):
+    """
+    Drops cached reads of a file, or of every file.
+    """
+    if filepath is None:
+        _read_cache.clear()
+    else:
+        _read_cache.discard(lambda k: k == filepath)
+
 def _ensure_file_exists(filepath, default_content):
-    if not os.path.exists(filepath):
-        with open(filepath, 'w') as f:
-            json.dump(default_content, f, indent=2)
+    if os.path.exists(filepath):
+        return
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    _write_tmp(tmp_path, codec.dumps(default_content, STORAGE_CODEC))
+    try:
+        # Unlike open('w'), link() never clobbers a file another process
+        # created in the meantime
+        os.link(tmp_path, filepath)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
 
 def _rotate_file_if_needed(filepath):
+    """
+    Seals the gastos file as a segment (see segments.py) once it passes
+    MAX_FILE_SIZE_BYTES. The caller holds FileLock(filepath).
+    """
     if not os.path.exists(filepath):
         return
-    
+
     try:
         size = os.path.getsize(filepath)
         if size > MAX_FILE_SIZE_BYTES:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.basename(filepath)
-            name, ext = os.path.splitext(filename)
-            new_name = f"{name}_{timestamp}{ext}"
-            new_path = os.path.join(os.path.dirname(filepath), new_name)
-            
-            # Rename current file
-            shutil.move(filepath, new_path)
-            logger.info(f"Rotated file {filepath} to {new_path} due to size limit.")
-            
-            # Create new empty file
+            entry = segments.seal(filepath, _read_json(filepath))
+            invalidate_cache(filepath)
+            logger.info(f"Sealed {filepath} as segment {entry['file']} ({entry['count']} gastos).")
             _ensure_file_exists(filepath, [])
     except Exception as e:
         logger.error(f"Error rotating file {filepath}: {e}")
 
+@metrics.timed(metrics.STORAGE_SECONDS, op="load_json")
 def load_json(filepath, default=None):
     if default is None:
         default = []
@@ -49,16 +253,9 @@ def load_json(filepath, default=None):
     _ensure_file_exists(filepath, default)
     
     try:
-        with open(filepath, 'r') as f:
-            # Shared lock for reading
-            fcntl.flock(f, fcntl.LOCK_SH)
-            try:
-                data = json.load(f)
-                return data
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
-    except json.JSONDecodeError:
-        logger.error(f"JSON corrupted in {filepath}. Recreating empty file.")
+        return _cached_read(filepath, _read_json)
+    except ValueError:
+        logger.error(f"Corrupted data in {filepath}. Recreating empty file.")
         # Backup corrupted file
         if os.path.exists(filepath):
             shutil.copy(filepath, filepath + ".corrupted")
@@ -68,87 +265,841 @@ def load_json(filepath, default=None):
         logger.error(f"Error reading {filepath}: {e}")
         return default
 
+def _read_bytes(filepath):
+    # Writers replace the file atomically, so no lock is needed to read it
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+def _read_json(filepath):
+    return codec.loads(_read_bytes(filepath))
+
+def _write_tmp(tmp_path, content):
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        if FSYNC_ENABLED:
+            os.fsync(f.fileno())
+
+def _replace_json(filepath, data):
+    """
+    Encodes data with STORAGE_CODEC and writes it over filepath (see _replace_file).
+    """
+    _replace_file(filepath, codec.dumps(data, STORAGE_CODEC))
+
+def _replace_file(filepath, content):
+    """
+    Writes content to a temp file and renames it over filepath, so readers
+    see either the old or the new content and a crash mid-write leaves the
+    old file. The caller holds FileLock(filepath).
+    """
+    tmp_path = filepath + ".tmp"
+    try:
+        _write_tmp(tmp_path, content)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if FSYNC_ENABLED:
+        # Make the rename itself durable
+        fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+@metrics.timed(metrics.STORAGE_SECONDS, op="save_json")
 def save_json(filepath, data):
+    invalidate_cache(filepath)
     try:
-        # Check rotation before writing if it's the expenses file
-        if filepath == GASTOS_FILE:
-            _rotate_file_if_needed(filepath)
+        with FileLock(filepath):
+            # Check rotation before writing if it's the expenses file
+            if filepath == _gastos_file():
+                _rotate_file_if_needed(filepath)
+            _replace_json(filepath, data)
+        return True
+    except Exception as e:
+        logger.error(f"Error writing to {filepath}: {e}")
+        return False
 
-        with open(filepath, 'w') as f:
-            # Exclusive lock for writing
-            fcntl.flock(f, fcntl.LOCK_EX)
+def _append_json(filepath, items):
+    invalidate_cache(filepath)
+    try:
+        with FileLock(filepath):
+            if filepath == _gastos_file():
+                _rotate_file_if_needed(filepath)
+            if STORAGE_CODEC == "binary" and os.path.exists(filepath):
+                raw = _read_bytes(filepath)
+                if codec.is_binary(raw):
+                    # Only the new records are encoded
+                    _replace_file(filepath, codec.append_records(raw, items))
+                    return True
             try:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+                content = _read_json(filepath)
+            except FileNotFoundError:
+                content = []
+            except ValueError:
+                content = []
+            content.extend(items)
+            _replace_json(filepath, content)
         return True
     except Exception as e:
-        logger.error(f"Error writing to {filepath}: {e}")
+        logger.error(f"Error appending to {filepath}: {e}")
         return False
 
+def _update_json(filepath, item_id, changes):
+    """
+    Merges changes into the item with that id and rewrites the file.
+    Returns the updated item, or None if there is none.
+    """
+    invalidate_cache(filepath)
+    with FileLock(filepath):
+        try:
+            content = _read_json(filepath)
+        except FileNotFoundError:
+            return None
+        item = next((i for i in content if i.get("id") == item_id), None)
+        if item is None:
+            return None
+        item.update(changes)
+        _replace_json(filepath, content)
+        return item
+
+# --- Journal backend ---
+
+def _journal_path(filepath):
+    return os.path.splitext(filepath)[0] + ".jsonl"
+
+def _journal_for(filepath):
+    """
+    Returns the journal path for a JSON array file, migrating it on first use.
+    """
+    path = _journal_path(filepath)
+    if not os.path.exists(path):
+        sealed = _sealed_gastos(filepath) if filepath == _gastos_file() else []
+        storage_journal.migrate_from_json(filepath, path, sealed)
+    return path
+
+def compact():
+    """
+    Compacts the gastos/pagos journals. No-op for the JSON backend.
+    """
+    if STORAGE_BACKEND == "daemon":
+        return _remote("compact")
+    if STORAGE_BACKEND != "journal":
+        return 0
+    dropped = 0
+    for filepath in (_gastos_file(), _pagos_file()):
+        path = _journal_for(filepath)
+        invalidate_cache(path)
+        dropped += storage_journal.compact(path)
+    return dropped
+
+# --- Aggregate index ---
+
+def _index_path():
+    return os.path.splitext(_gastos_file())[0] + ".index.json"
+
+def _gastos_fingerprint():
+    """
+    Identifies the current state of the raw gastos for the active backend.
+    """
+    if STORAGE_BACKEND == "daemon":
+        return _remote("gastos_version")
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.fingerprint(_sqlite_file())
+    if STORAGE_BACKEND == "journal":
+        paths = [_journal_for(_gastos_file())]
+    else:
+        paths = [_gastos_file(), segments.manifest_path(_gastos_file())]
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if path == paths[0]:
+                return None
+            continue
+        fingerprint += [st.st_size, st.st_mtime_ns]
+    return fingerprint
+
+def _rebuild_index_locked():
+    index = storage_index.build(get_gastos(), _gastos_fingerprint())
+    _save_index(index)
+    return index
+
+def _save_index(index):
+    invalidate_cache(_index_path())
+    storage_index.save(_index_path(), index)
+
+def rebuild_index():
+    """
+    Rebuilds the aggregate index from the raw gastos.
+    """
+    if STORAGE_BACKEND == "daemon":
+        return _remote("rebuild_index")
+    with FileLock(_index_path()):
+        return _rebuild_index_locked()
+
+def get_index():
+    """
+    Returns the aggregate index, rebuilding it if it drifted from the data.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return _remote("get_index")
+    index = _cached_read(_index_path(), storage_index.load)
+    if index is not None and index["source"] == _gastos_fingerprint():
+        return index
+    with FileLock(_index_path()):
+        # Another worker may have rebuilt it while we waited for the lock
+        index = storage_index.load(_index_path())
+        if index is not None and index["source"] == _gastos_fingerprint():
+            return index
+        logger.info("Aggregate index missing or stale, rebuilding.")
+        return _rebuild_index_locked()
+
+def check_index():
+    """
+    Compares the stored index with the raw gastos; returns the drifted buckets.
+    """
+    if STORAGE_BACKEND == "daemon":
+        return _remote("check_index")
+    index = storage_index.load(_index_path()) or storage_index.empty()
+    return storage_index.drift(index, get_gastos())
+
+def get_period_totals(period, key):
+    """
+    (total, count) of the gastos in a "dia", "semana", "mes" or "categoria" bucket.
+    Keys look like "2025-11-12", "2025-W46", "2025-11" and "comida".
+    """
+    return storage_index.lookup(get_index(), period, key)
+
+def _bucket_since(period, key):
+    """
+    Epoch before which no gasto falls in a dia/semana/mes bucket, None for
+    categoria buckets.
+    """
+    if period == "dia":
+        day = date.fromisoformat(key)
+    elif period == "semana":
+        year, week = key.split("-W")
+        day = date.fromisocalendar(int(year), int(week), 1)
+    elif period == "mes":
+        day = date.fromisoformat(key + "-01")
+    else:
+        return None
+    # Keys are local dates, and no timezone is more than 14 hours ahead of UTC
+    return calendar.timegm(day.timetuple()) - 14 * 3600
+
+def get_totals(buckets):
+    """
+    {(period, key): (total, count)} for several buckets from one index read.
+    With STORAGE_INDEX=0, date buckets are summed from the end of the
+    history instead of rebuilding the index.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return {(period, key): (total, count) for period, key, total, count in _remote("get_totals", buckets=buckets)}
+    if not INDEX_ENABLED:
+        starts = [_bucket_since(*bucket) for bucket in buckets]
+        if starts and None not in starts:
+            totals = {bucket: (0, 0) for bucket in buckets}
+            for g in _iter_between(_recent_gastos(min(starts)), min(starts), None):
+                for bucket in storage_index.bucket_keys(g) or ():
+                    if bucket in totals:
+                        total, count = totals[bucket]
+                        totals[bucket] = (total + g.get("monto", 0), count + 1)
+            return totals
+    index = get_index()
+    return {bucket: storage_index.lookup(index, *bucket) for bucket in buckets}
+
+# --- Migration ---
+
+def _load_source(filepath):
+    """
+    Records of a JSON array file, or of its journal if it was migrated.
+    """
+    if os.path.exists(_journal_path(filepath)):
+        return storage_journal.read_records(_journal_path(filepath))
+    if filepath == _gastos_file():
+        return _json_gastos(filepath)
+    return load_json(filepath, [])
+
+def migrate_to_sqlite():
+    """
+    Copies gastos/pagos from the JSON (or journal) files into the SQLite database.
+    Upserts by id, so running it twice is harmless. Source files are kept.
+    """
+    gastos = _load_source(_gastos_file())
+    pagos = _load_source(_pagos_file())
+    storage_sqlite.insert_gastos(_sqlite_file(), gastos)
+    storage_sqlite.insert_pagos(_sqlite_file(), pagos)
+    logger.info(f"Migrated {len(gastos)} gastos and {len(pagos)} pagos to {_sqlite_file()}.")
+    return len(gastos), len(pagos)
+
+def convert_files(codec_name):
+    """
+    Rewrites the JSON-backend files of the current partition (gastos and
+    its sealed segments, pagos, config) with another codec. Returns the
+    number of files rewritten.
+    """
+    if codec_name not in codec.CODECS:
+        raise ValueError(f"Unknown codec {codec_name!r}, expected one of {', '.join(codec.CODECS)}")
+    converted = 0
+    # Listed before taking the lock, which _segments may take itself
+    sealed = segments.segment_paths(_gastos_file(), _segments(_gastos_file()))
+    with FileLock(_gastos_file()):
+        for path in sealed:
+            segments.convert(path, codec_name)
+            converted += 1
+    for filepath in (_gastos_file(), _pagos_file(), _config_file()):
+        with FileLock(filepath):
+            if os.path.exists(filepath):
+                _replace_file(filepath, codec.dumps(_read_json(filepath), codec_name))
+                converted += 1
+    invalidate_cache()
+    logger.info(f"Converted {converted} files to the {codec_name} codec.")
+    return converted
+
+# --- Write batching ---
+
+_batch = threading.local()
+
+class WriteBatch:
+    """
+    Writes buffered by batched_writes(). ``owner`` tags the buffered records
+    so callers can tell which of their operations ended up in a failed flush.
+    """
+    def __init__(self):
+        self.gastos = []
+        self.pagos = []
+        self.owner = None
+        self.failed = set()
+
+    def flush(self):
+        gastos, self.gastos = self.gastos, []
+        pagos, self.pagos = self.pagos, []
+        if gastos and not save_gastos([g for _, g in gastos]):
+            self.failed.update(owner for owner, _ in gastos)
+        if pagos and not save_pagos([p for _, p in pagos]):
+            self.failed.update(owner for owner, _ in pagos)
+
+@contextmanager
+def batched_writes():
+    """
+    Coalesces the save_gasto/save_pago calls made by this thread into one
+    append per file. Buffered writes are flushed on exit, and before any
+    read in between so the thread still sees its own writes.
+    """
+    if getattr(_batch, "current", None) is not None:
+        yield _batch.current
+        return
+
+    batch = _batch.current = WriteBatch()
+    try:
+        yield batch
+    finally:
+        _batch.current = None
+        batch.flush()
+
+def _flush_pending():
+    batch = getattr(_batch, "current", None)
+    if batch is not None and (batch.gastos or batch.pagos):
+        _batch.current = None
+        try:
+            batch.flush()
+        finally:
+            _batch.current = batch
+
+# --- Segments ---
+
+def _segments(filepath):
+    """
+    Sealed segments of a JSON gastos file. Files rotated before there was
+    a manifest are added to a new one on first use.
+    """
+    listed = _cached_read(segments.manifest_path(filepath), lambda _: segments.load_manifest(filepath))
+    if listed is None:
+        if not segments.has_orphans(filepath):
+            return []
+        with FileLock(filepath):
+            listed = segments.recover(filepath)
+        invalidate_cache(segments.manifest_path(filepath))
+    return listed
+
+def _sealed_gastos(filepath, start_ts=None, end_ts=None):
+    """
+    Gastos in the sealed segments overlapping [start_ts, end_ts), oldest first.
+    Segments never change, so their parsed contents stay in the read cache.
+    """
+    gastos = []
+    for path in segments.segment_paths(filepath, _segments(filepath), start_ts, end_ts):
+        gastos.extend(_cached_read(path, segments.read_segment))
+    return gastos
+
+# Tries at a lock-free snapshot of the segments and the active file
+# before reading them under the writers' lock
+_SNAPSHOT_ATTEMPTS = 3
+
+def _history_signature(filepath):
+    signature = []
+    for path in (segments.manifest_path(filepath), filepath):
+        try:
+            signature.append(_file_signature(path))
+        except FileNotFoundError:
+            signature.append(None)
+    return signature
+
+def _read_history(filepath, read):
+    """
+    read() of the sealed segments and the active gastos file as of one
+    moment. Sealing rewrites the manifest and then renames the active file,
+    and every write replaces one of the two, so a read that overlapped a
+    write sees a signature change and starts over. After a few tries it is
+    done under the writers' lock.
+    """
+    for _ in range(_SNAPSHOT_ATTEMPTS):
+        before = _history_signature(filepath)
+        try:
+            result = read()
+        except FileNotFoundError:
+            # A segment's uncompressed copy, removed after its .gz was listed
+            continue
+        if _history_signature(filepath) == before:
+            return result
+    # What may take the lock itself (adopting rotated files, resetting a
+    # corrupted file) is done first; FileLock isn't reentrant
+    _segments(filepath)
+    load_json(filepath, [])
+    with FileLock(filepath):
+        return read()
+
+def _json_gastos(filepath, start_ts=None, end_ts=None):
+    """
+    Gastos of the sealed segments overlapping [start_ts, end_ts) followed
+    by those of the active file.
+    """
+    def read():
+        sealed = _sealed_gastos(filepath, start_ts, end_ts)
+        active = load_json(filepath, [])
+        return sealed + active if sealed else active
+    return _read_history(filepath, read)
+
+def recover_segments():
+    """
+    Reconciles the segment manifest with the rotated files on disk.
+    """
+    with FileLock(_gastos_file()):
+        listed = segments.recover(_gastos_file())
+    invalidate_cache(segments.manifest_path(_gastos_file()))
+    return listed
+
 # --- Specific Accessors ---
 
 def get_gastos():
-    return load_json(GASTOS_FILE, [])
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return _remote("get_gastos")
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.get_gastos(_sqlite_file())
+    if STORAGE_BACKEND == "journal":
+        return _cached_read(_journal_for(_gastos_file()), storage_journal.read_records)
+    return _json_gastos(_gastos_file())
 
-def save_gasto(gasto):
+def _iter_between(gastos, start_ts, end_ts):
+    in_range = dates.range_test(start_ts, end_ts)
+    for g in gastos:
+        if in_range(g.get("fecha")):
+            yield g
+
+def filter_gastos_between(gastos, start=None, end=None):
+    """
+    Gastos with start <= fecha < end; a None bound is open.
+    """
+    return list(_iter_between(gastos, utils.to_epoch(start), utils.to_epoch(end)))
+
+def _take_tail(newest_first, since_ts):
+    """
+    Gastos from a newest-first iterable until the first one older than
+    since_ts minus the slack, returned oldest first.
+    """
+    stop_ts = since_ts - TAIL_SLACK_SECONDS
+    tail = []
+    for g in newest_first:
+        try:
+            ts = utils.to_epoch(g.get("fecha"))
+        except (ValueError, TypeError):
+            ts = None
+        if ts is not None and ts < stop_ts:
+            break
+        tail.append(g)
+    tail.reverse()
+    return tail
+
+def _recent_gastos(since_ts):
+    """
+    The gastos at the end of the history back to since_ts (with some slack),
+    in storage order. The journal is read backwards from its end; JSON
+    files only open the sealed segments reaching since_ts.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return list(storage_sqlite.iter_gastos_between(_sqlite_file(), since_ts, None))
+    if STORAGE_BACKEND == "journal":
+        newest_first = storage_journal.iter_reverse(_journal_for(_gastos_file()))
+    else:
+        newest_first = reversed(_json_gastos(_gastos_file(), since_ts))
+    return _take_tail(newest_first, since_ts)
+
+def iter_gastos(start=None, end=None, since=None):
+    """
+    Iterates the gastos with start <= fecha < end in storage order, dropping
+    the ones outside the range as they are read. The journal and SQLite
+    backends stream from disk; a JSON array has to be parsed whole.
+
+    since (a datetime) also bounds the range from below, but reads the
+    history from its end backwards and stops once past it, so asking for
+    the last few days costs the same however long the history is.
+
+    Paths are resolved on call, so the iterator can be consumed outside
+    the user_partition() it was created in.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return iter(_remote("iter_gastos", start=start, end=end, since=since))
+    start_ts, end_ts = utils.to_epoch(start), utils.to_epoch(end)
+    if since is not None:
+        since_ts = utils.to_epoch(since)
+        start_ts = since_ts if start_ts is None else max(start_ts, since_ts)
+        return _iter_between(_recent_gastos(since_ts), start_ts, end_ts)
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.iter_gastos_between(_sqlite_file(), start_ts, end_ts)
+    if STORAGE_BACKEND == "journal":
+        return _iter_between(storage_journal.iter_records(_journal_for(_gastos_file())), start_ts, end_ts)
+    # Only the sealed segments overlapping the range are opened
+    return _iter_between(_json_gastos(_gastos_file(), start_ts, end_ts), start_ts, end_ts)
+
+def partition_dir():
+    """
+    Directory holding the current partition's files.
+    """
+    return os.path.dirname(_gastos_file())
+
+def get_gastos_between(start=None, end=None):
+    """
+    Gastos with start <= fecha < end, bounds being datetimes or None.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return _remote("get_gastos_between", start=start, end=end)
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.get_gastos_between(_sqlite_file(), utils.to_epoch(start), utils.to_epoch(end))
+    if STORAGE_BACKEND == "json":
+        return list(iter_gastos(start, end))
+    return filter_gastos_between(get_gastos(), start, end)
+
+def sum_gastos_between(start=None, end=None):
+    """
+    Total monto of the gastos with start <= fecha < end.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return _remote("sum_gastos_between", start=start, end=end)
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.sum_gastos_between(_sqlite_file(), utils.to_epoch(start), utils.to_epoch(end))
+    total, _ = get_table().sum_between(utils.to_epoch(start), utils.to_epoch(end))
+    return total
+
+_tables = _PartitionCache()
+
+def get_table(since=None):
+    """
+    Columnar table of the current partition's gastos (see columnar.py),
+    built once and reused until the raw gastos change. With since, a
+    table of only the gastos from then on, read from the end of the
+    history (see iter_gastos) and not cached.
+    """
+    _flush_pending()
+    if since is not None:
+        return columnar.GastoTable.from_gastos(iter_gastos(since=since))
+    # The daemon owns the files: resolving a path here would create the
+    # partition's directory on this side too
+    key = (STORAGE_BACKEND, current_user() if STORAGE_BACKEND == "daemon" else _gastos_file())
+    fingerprint = _gastos_fingerprint()
+    entry = _tables.get(key)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+    # Fingerprint taken before the read: a concurrent write only costs a
+    # rebuild. The records are read around the read cache, so only the
+    # table stays in memory
+    if STORAGE_BACKEND == "json":
+        table = columnar.GastoTable.from_rows(_table_rows(_gastos_file()))
+    elif STORAGE_BACKEND == "journal":
+        table = columnar.GastoTable.from_gastos(storage_journal.read_records(_journal_for(_gastos_file())))
+    else:
+        table = columnar.GastoTable.from_gastos(get_gastos())
+    _tables.put(key, (fingerprint, table))
+    return table
+
+def _table_rows(filepath):
+    """
+    Table rows of the sealed segments and the active file, read straight
+    from their bytes (see codec.table_rows). They are not cached: the
+    table built from them is.
+    """
+    _ensure_file_exists(filepath, [])
+    def read():
+        rows = []
+        for path in segments.segment_paths(filepath, _segments(filepath)):
+            rows.extend(codec.table_rows(segments.read_bytes(path)))
+        rows.extend(codec.table_rows(_read_bytes(filepath)))
+        return rows
     try:
-        with open(GASTOS_FILE, 'r+') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                try:
-                    content = json.load(f)
-                except json.JSONDecodeError:
-                    content = []
-                
-                content.append(gasto)
-                
-                f.seek(0)
-                json.dump(content, f, indent=2, ensure_ascii=False)
-                f.truncate()
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+        return _read_history(filepath, read)
+    except ValueError:
+        load_json(filepath, [])  # backs up and resets a corrupted active file
+        invalidate_cache(filepath)
+        return _read_history(filepath, read)
+
+@metrics.timed(metrics.STORAGE_SECONDS, op="save_gasto")
+def save_gasto(gasto):
+    batch = getattr(_batch, "current", None)
+    if batch is not None:
+        batch.gastos.append((batch.owner, gasto))
         return True
-    except FileNotFoundError:
-        return save_json(GASTOS_FILE, [gasto])
+    return save_gastos([gasto])
+
+@metrics.timed(metrics.STORAGE_SECONDS, op="save_gastos")
+def save_gastos(gastos):
+    """
+    Saves several gastos with a single append.
+    """
+    if STORAGE_BACKEND == "daemon":
+        # The daemon keeps its own index up to date
+        return _save_gastos(gastos)
+    if not INDEX_ENABLED:
+        return _save_gastos(gastos)
+
+    # The index lock covers the write too, so the fingerprint stored with
+    # the index always describes exactly the gastos it counts.
+    with FileLock(_index_path()):
+        before = _gastos_fingerprint()
+        saved = _save_gastos(gastos)
+        if saved:
+            try:
+                index = storage_index.load(_index_path())
+                after = _gastos_fingerprint()
+                if index is None or index["source"] != before:
+                    _rebuild_index_locked()
+                else:
+                    for g in gastos:
+                        storage_index.add(index, g)
+                    index["source"] = after
+                    _save_index(index)
+            except Exception as e:
+                logger.error(f"Error updating aggregate index: {e}")
+    return saved
+
+def _save_gastos(gastos):
+    try:
+        if STORAGE_BACKEND == "daemon":
+            return _remote("save_gastos", records=gastos)
+        if STORAGE_BACKEND == "sqlite":
+            return storage_sqlite.insert_gastos(_sqlite_file(), gastos)
+        if STORAGE_BACKEND == "journal":
+            path = _journal_for(_gastos_file())
+            invalidate_cache(path)
+            return storage_journal.append_records(path, gastos, fsync=FSYNC_ENABLED)
     except Exception as e:
-        logger.error(f"Error saving gasto: {e}")
+        logger.error(f"Error saving gastos: {e}")
         return False
+    return _append_json(_gastos_file(), gastos)
 
 def get_pagos():
-    return load_json(PAGOS_FILE, [])
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return _remote("get_pagos")
+    if STORAGE_BACKEND == "sqlite":
+        return storage_sqlite.get_pagos(_sqlite_file())
+    if STORAGE_BACKEND == "journal":
+        return _cached_read(_journal_for(_pagos_file()), storage_journal.read_records)
+    return load_json(_pagos_file(), [])
 
 def save_pago(pago):
-    try:
-        with open(PAGOS_FILE, 'r+') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
-            try:
-                try:
-                    content = json.load(f)
-                except json.JSONDecodeError:
-                    content = []
-                
-                content.append(pago)
-                
-                f.seek(0)
-                json.dump(content, f, indent=2, ensure_ascii=False)
-                f.truncate()
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+    batch = getattr(_batch, "current", None)
+    if batch is not None:
+        batch.pagos.append((batch.owner, pago))
         return True
+    return save_pagos([pago])
+
+def save_pagos(pagos):
+    """
+    Saves several pagos with a single append.
+    """
+    try:
+        if STORAGE_BACKEND == "daemon":
+            return _remote("save_pagos", records=pagos)
+        if STORAGE_BACKEND == "sqlite":
+            return storage_sqlite.insert_pagos(_sqlite_file(), pagos)
+        if STORAGE_BACKEND == "journal":
+            path = _journal_for(_pagos_file())
+            invalidate_cache(path)
+            return storage_journal.append_records(path, pagos, fsync=FSYNC_ENABLED)
+    except Exception as e:
+        logger.error(f"Error saving pagos: {e}")
+        return False
+    return _append_json(_pagos_file(), pagos)
+
+def update_pago(pago_id, changes):
+    """
+    Merges changes (e.g. {"pagado": True}) into the pago with that id.
+    Returns the updated pago, None if there is no such pago, or False
+    if it could not be written.
+    """
+    _flush_pending()
+    try:
+        if STORAGE_BACKEND == "daemon":
+            return _remote("update_pago", pago_id=pago_id, changes=changes)
+        if STORAGE_BACKEND == "sqlite":
+            return storage_sqlite.update_pago(_sqlite_file(), pago_id, changes)
+        if STORAGE_BACKEND == "journal":
+            # The journal keeps the last version of each id
+            current = next((p for p in get_pagos() if p.get("id") == pago_id), None)
+            if current is None:
+                return None
+            pago = dict(current, **changes)
+            path = _journal_for(_pagos_file())
+            invalidate_cache(path)
+            return pago if storage_journal.append_records(path, [pago], fsync=FSYNC_ENABLED) else False
+        return _update_json(_pagos_file(), pago_id, changes)
+    except Exception as e:
+        logger.error(f"Error updating pago {pago_id}: {e}")
+        return False
+
+_due_indexes = _PartitionCache()
+
+def get_due_index():
+    """
+    Pending pagos of the current partition ordered by vencimiento
+    (a pagos_index.DueIndex), rebuilt only when the pagos change.
+    """
+    _flush_pending()
+    if STORAGE_BACKEND == "daemon":
+        return pagos_index.DueIndex(_remote("get_pending_pagos"))
+    if STORAGE_BACKEND == "sqlite":
+        return pagos_index.DueIndex(storage_sqlite.get_pending_pagos(_sqlite_file()))
+    path = _journal_for(_pagos_file()) if STORAGE_BACKEND == "journal" else _pagos_file()
+    try:
+        signature = _file_signature(path)
     except FileNotFoundError:
-        return save_json(PAGOS_FILE, [pago])
+        signature = None
+    key = (STORAGE_BACKEND, path)
+    entry = _due_indexes.get(key)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+    index = pagos_index.DueIndex(get_pagos())
+    _due_indexes.put(key, (signature, index))
+    return index
+
+def get_pending_pagos():
+    """
+    Unpaid pagos, earliest vencimiento first.
+    """
+    return list(get_due_index().pending)
 
 def get_config():
+    if STORAGE_BACKEND == "daemon":
+        return _remote("get_config")
     default_config = {
         "presupuesto_mensual": 0,
         "moneda": "COP",
         "timezone": "America/Bogota"
     }
-    return load_json(CONFIG_FILE, default_config)
+    if _current_user.get() is not None:
+        # New users start with the shared currency and timezone
+        shared = load_json(CONFIG_FILE, dict(default_config))
+        default_config.update({k: shared[k] for k in ("moneda", "timezone") if k in shared})
+    return load_json(_config_file(), default_config)
 
 def update_config(key, value):
+    if STORAGE_BACKEND == "daemon":
+        return _remote("update_config", key=key, value=value)
     config = get_config()
     config[key] = value
-    save_json(CONFIG_FILE, config)
+    save_json(_config_file(), config)
     return config
+
+# --- Metrics ---
+
+def _file_kind(name):
+    """
+    Metric label for a data file; rotated gastos files share one label.
+    """
+    if name.startswith("gastos_") and name[len("gastos_"):len("gastos_") + 1].isdigit():
+        return "gastos_rotated"
+    return name
+
+@metrics.collector
+def _collect_metrics():
+    """
+    Size and number of the data files (all partitions) and the gastos
+    counted by the aggregate indexes, read at scrape time.
+    """
+    sizes, counts, indexed = {}, {}, 0
+    for root, _, names in os.walk(DATA_DIR):
+        for name in names:
+            if name.endswith(".lock"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            kind = _file_kind(name)
+            sizes[kind] = sizes.get(kind, 0) + size
+            counts[kind] = counts.get(kind, 0) + 1
+            if name.endswith(".index.json"):
+                indexed += (_cached_read(path, storage_index.load) or {}).get("count", 0)
+    return [
+        ("bot_data_file_bytes", "gauge", "Bytes of the data files, by file name.",
+         [("bot_data_file_bytes", {"file": kind}, size) for kind, size in sorted(sizes.items())]),
+        ("bot_data_files", "gauge", "Number of data files, by file name.",
+         [("bot_data_files", {"file": kind}, n) for kind, n in sorted(counts.items())]),
+        ("bot_gastos_indexed", "gauge", "Gastos counted by the aggregate indexes.",
+         [("bot_gastos_indexed", {}, indexed)]),
+    ]
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Storage maintenance commands.")
+    parser.add_argument("--user", help="Phone number whose partition to work on (default: shared files).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate-sqlite", help="Copy data/*.json into the SQLite database.")
+    subparsers.add_parser("compact", help="Compact the journal files.")
+    subparsers.add_parser("check-index", help="Report aggregate index drift from the raw gastos.")
+    subparsers.add_parser("rebuild-index", help="Rebuild the aggregate index from the raw gastos.")
+    subparsers.add_parser("segments", help="List the sealed gastos segments, adding any unlisted rotated files.")
+    convert_parser = subparsers.add_parser("convert", help="Rewrite the JSON files with another codec.")
+    convert_parser.add_argument("codec", choices=codec.CODECS)
+    args = parser.parse_args()
+
+    with user_partition(args.user):
+        if args.command == "migrate-sqlite":
+            n_gastos, n_pagos = migrate_to_sqlite()
+            print(f"Migrated {n_gastos} gastos and {n_pagos} pagos to {_sqlite_file()}")
+        elif args.command == "compact":
+            print(f"Dropped {compact()} dead journal lines")
+        elif args.command == "check-index":
+            drifted = check_index()
+            print(json.dumps(drifted, indent=2) if drifted else "Index is consistent with the data")
+        elif args.command == "rebuild-index":
+            index = rebuild_index()
+            print(f"Indexed {index['count']} gastos")
+        elif args.command == "segments":
+            for segment in recover_segments():
+                print(f"{segment['file']}: {segment['count']} gastos")
+        elif args.command == "convert":
+            print(f"Rewrote {convert_files(args.codec)} files as {args.codec}")
@@ -0,0 +1,126 @@
+"""
+Client of the storage daemon, used by the "daemon" storage backend.
+
+Each request is one JSON line on a Unix domain socket ({"op", "user",
+"args"}) and gets one JSON line back ({"result"} or {"error"}). Datetimes
+travel as ISO 8601 strings, which the storage functions accept as bounds.
+See storage_daemon.py for the server.
+"""
+import os
+import json
+import select
+import socket
+import datetime
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOCKET_PATH = os.getenv("STORAGE_DAEMON_SOCKET", os.path.join(os.path.dirname(__file__), 'data', 'storage.sock'))
+TIMEOUT = float(os.getenv("STORAGE_DAEMON_TIMEOUT", "10"))
+
+
+# Operations that change nothing, safe to send again when the connection
+# drops before the answer (storage_daemon.READS)
+READ_ONLY = frozenset({
+    "get_gastos", "get_gastos_between", "iter_gastos", "sum_gastos_between", "gastos_version",
+    "get_index", "get_totals", "check_index", "get_pagos", "get_pending_pagos", "get_config",
+})
+
+
+class DaemonError(Exception):
+    """
+    The daemon could not be reached or could not run the request.
+    """
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot send {type(value).__name__} to the storage daemon")
+
+
+def encode(message):
+    return json.dumps(message, ensure_ascii=False, default=_default).encode("utf-8") + b"\n"
+
+
+# One connection per (process, thread); a socket must not be shared
+# across a fork or between threads waiting for their own answers.
+_local = threading.local()
+
+
+def _connection():
+    if getattr(_local, "pid", None) != os.getpid() or _local.sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(TIMEOUT)
+        try:
+            sock.connect(SOCKET_PATH)
+        except OSError:
+            sock.close()
+            raise
+        _local.sock, _local.reader, _local.pid = sock, sock.makefile('rb'), os.getpid()
+    return _local.sock, _local.reader
+
+
+def close():
+    """
+    Closes this thread's connection; the next call opens a new one.
+    """
+    sock = getattr(_local, "sock", None)
+    if sock is not None and getattr(_local, "pid", None) == os.getpid():
+        _local.reader.close()
+        sock.close()
+    _local.sock = None
+
+
+def _closed_by_daemon(sock):
+    """
+    Whether the daemon closed this connection, e.g. it restarted since the
+    connection was opened. Nothing is pending on an idle connection, so
+    anything readable is the end of the stream.
+    """
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+
+
+def _send(data):
+    try:
+        sock, reader = _connection()
+        if _closed_by_daemon(sock):
+            close()
+            sock, reader = _connection()
+        sock.sendall(data)
+    except (BrokenPipeError, ConnectionResetError):
+        # The daemon restarted since this connection was opened. Nothing
+        # reached it, so the request can be sent again
+        close()
+        sock, reader = _connection()
+        sock.sendall(data)
+    return reader
+
+
+def call(op, user=None, **args):
+    """
+    Runs a storage operation in the daemon on the given user's partition
+    and returns its result. Raises DaemonError if it can't be done.
+    """
+    data = encode({"op": op, "user": user, "args": args})
+    try:
+        line = _send(data).readline()
+        if not line and op in READ_ONLY:
+            # Dropped before the answer; a write may have been applied
+            # anyway, so only reads are sent again
+            close()
+            line = _send(data).readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        response = json.loads(line)
+    except (OSError, ValueError) as e:
+        close()
+        raise DaemonError(f"storage daemon at {SOCKET_PATH}: {e}") from e
+    if "error" in response:
+        raise DaemonError(f"{op}: {response['error']}")
+    return response["result"]
@@ -0,0 +1,262 @@
+"""
+Storage daemon: one process owns the data files and the gunicorn workers
+reach them through a Unix domain socket (STORAGE_BACKEND=daemon, see
+storage_client.py).
+
+The daemon runs the usual storage functions on its own backend
+(STORAGE_DAEMON_BACKEND, default json), so its read cache, aggregate
+indexes and columnar tables stay warm across requests and across worker
+restarts, and no worker ever waits on a file lock held by another.
+
+Writes are group-committed: the ones arriving within STORAGE_DAEMON_COMMIT_MS
+of each other are merged into one append (one write and fsync) per file,
+and each client gets its answer once its records are on disk.
+
+    python storage_daemon.py
+"""
+import os
+import json
+import queue
+import signal
+import socket
+import threading
+import socketserver
+import time
+import logging
+from dotenv import load_dotenv
+
+# Before the project modules, which read their settings when imported
+load_dotenv()
+
+import log_config
+import storage
+import storage_client
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("STORAGE_DAEMON_BACKEND", "json")
+COMMIT_WINDOW = float(os.getenv("STORAGE_DAEMON_COMMIT_MS", "2")) / 1000
+# Upper bound on the records merged into one commit
+MAX_GROUP = int(os.getenv("STORAGE_DAEMON_MAX_GROUP", "1000"))
+
+
+def _totals(buckets):
+    totals = storage.get_totals([tuple(bucket) for bucket in buckets])
+    return [[period, key, total, count] for (period, key), (total, count) in totals.items()]
+
+
+# Read-only operations, run right away on the connection's thread
+READS = {
+    "get_gastos": lambda: storage.get_gastos(),
+    "get_gastos_between": lambda start=None, end=None: storage.get_gastos_between(start, end),
+    "iter_gastos": lambda start=None, end=None, since=None: list(storage.iter_gastos(start, end, since)),
+    "sum_gastos_between": lambda start=None, end=None: storage.sum_gastos_between(start, end),
+    "gastos_version": lambda: storage._gastos_fingerprint(),
+    "get_index": lambda: storage.get_index(),
+    "get_totals": _totals,
+    "check_index": lambda: storage.check_index(),
+    "get_pagos": lambda: storage.get_pagos(),
+    "get_pending_pagos": lambda: storage.get_pending_pagos(),
+    "get_config": lambda: storage.get_config(),
+}
+
+# Operations that change the data, run one at a time by the committer
+WRITES = {
+    "update_pago": lambda pago_id, changes: storage.update_pago(pago_id, changes),
+    "update_config": lambda key, value: storage.update_config(key, value),
+    "rebuild_index": lambda: storage.rebuild_index(),
+    "compact": lambda: storage.compact(),
+}
+
+# Appends, merged per (op, user) within a commit window
+APPENDS = {
+    "save_gastos": lambda records: storage.save_gastos(records),
+    "save_pagos": lambda records: storage.save_pagos(records),
+}
+
+
+class _Pending:
+    """
+    A write waiting for the committer, and its outcome.
+    """
+    def __init__(self, op, user, args):
+        self.op, self.user, self.args = op, user, args
+        self.response = None
+        self.done = threading.Event()
+
+    def finish(self, response):
+        self.response = response
+        self.done.set()
+
+
+class GroupCommitter:
+    """
+    Single writer thread. It waits for a write, gathers the ones arriving
+    during the next COMMIT_WINDOW seconds, and applies them: appends to the
+    same file go out as one save_gastos/save_pagos call.
+    """
+    def __init__(self, window=None, max_group=None):
+        self.window = COMMIT_WINDOW if window is None else window
+        self.max_group = MAX_GROUP if max_group is None else max_group
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="storage-committer", daemon=True)
+        self.commits = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, op, user, args):
+        pending = _Pending(op, user, args)
+        self.queue.put(pending)
+        pending.done.wait()
+        return pending.response
+
+    def _gather(self, first):
+        group = [first]
+        size = len(first.args.get("records", ()))
+        deadline = time.monotonic() + self.window
+        while size < self.max_group:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            group.append(item)
+            size += len(item.args.get("records", ()))
+        return group
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            self.commit(self._gather(first))
+
+    def commit(self, group):
+        # Appends go in arrival order within each file; concurrent clients
+        # have no order between them anyway
+        appends = {}
+        for pending in group:
+            if pending.op in APPENDS:
+                appends.setdefault((pending.op, pending.user), []).append(pending)
+            else:
+                pending.finish(_run(WRITES[pending.op], pending.user, pending.args))
+        for (op, user), waiting in appends.items():
+            records = [r for pending in waiting for r in pending.args["records"]]
+            response = _run(APPENDS[op], user, {"records": records})
+            for pending in waiting:
+                pending.finish(response)
+        self.commits += 1
+        logger.debug("Committed %d requests in %d appends", len(group), len(appends))
+
+
+def _run(fn, user, args):
+    try:
+        with storage.user_partition(user):
+            return {"result": fn(**args)}
+    except Exception as e:
+        logger.exception("Storage daemon request failed")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def handle(committer, request):
+    """
+    Response (a dict with "result" or "error") to one decoded request.
+    """
+    op, user, args = request.get("op"), request.get("user"), request.get("args") or {}
+    if op in READS:
+        return _run(READS[op], user, args)
+    if op in WRITES or op in APPENDS:
+        return committer.submit(op, user, args)
+    return {"error": f"unknown operation {op!r}"}
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Connecting to a full Unix socket backlog fails right away (EAGAIN)
+    request_queue_size = 128
+
+    def __init__(self, path, committer):
+        self.committer = committer
+        super().__init__(path, _Handler)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = handle(self.server.committer, json.loads(line))
+            except ValueError as e:
+                response = {"error": f"bad request: {e}"}
+            try:
+                self.wfile.write(storage_client.encode(response))
+            except TypeError as e:
+                self.wfile.write(storage_client.encode({"error": f"bad response: {e}"}))
+
+
+def _remove_stale_socket(path):
+    """
+    Removes a socket file left by a daemon that is gone; fails if one is
+    still listening on it.
+    """
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+    else:
+        raise RuntimeError(f"A storage daemon is already listening on {path}")
+    finally:
+        probe.close()
+
+
+def serve(path=None, backend=BACKEND):
+    """
+    Creates the committer and the listening server (not yet serving).
+    """
+    if backend == "daemon":
+        raise ValueError("STORAGE_DAEMON_BACKEND must be json, journal or sqlite")
+    storage.STORAGE_BACKEND = backend
+    path = path or storage_client.SOCKET_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _remove_stale_socket(path)
+    committer = GroupCommitter()
+    committer.start()
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(path, committer)
+    finally:
+        os.umask(old_umask)
+    return server
+
+
+def main():
+    log_config.setup()
+    server = serve()
+    # shutdown() waits for serve_forever(), so it can't run on this thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    logger.info(f"Storage daemon listening on {server.server_address} (backend {BACKEND}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.committer.stop()
+        os.remove(server.server_address)
+        logger.info("Storage daemon stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Aggregate index of gastos: totals per day, ISO week, month and category.
+
+Stored as a small JSON file next to the data and updated on every save,
+so period totals are a dict lookup no matter how long the history is.
+Buckets use the local date written in each ``fecha`` (its first 10 chars),
+the same date the summaries have always shown.
+
+``source`` holds a fingerprint of the raw data the index was built from;
+when it no longer matches, the index is stale and gets rebuilt.
+"""
+import json
+import os
+import logging
+import dates
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+PERIODS = ("dia", "semana", "mes", "categoria")
+
+
+def week_key(d):
+    year, week, _ = d.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def bucket_keys(gasto):
+    """
+    The (period, key) pairs a gasto counts towards, or None without a valid fecha.
+    """
+    fecha = gasto.get("fecha") or ""
+    try:
+        semana = dates.week_key(fecha[:10])
+    except ValueError:
+        return None
+    return (
+        ("dia", fecha[:10]),
+        ("semana", semana),
+        ("mes", fecha[:7]),
+        ("categoria", gasto.get("categoria", "varios")),
+    )
+
+
+def empty(source=None):
+    index = {"version": INDEX_VERSION, "source": source, "count": 0, "total": 0}
+    for period in PERIODS:
+        index[period] = {}
+    return index
+
+
+def add(index, gasto):
+    keys = bucket_keys(gasto)
+    if keys is None:
+        return index
+    monto = gasto.get("monto", 0)
+    index["count"] += 1
+    index["total"] += monto
+    for period, key in keys:
+        bucket = index[period].setdefault(key, [0, 0])
+        bucket[0] += monto
+        bucket[1] += 1
+    return index
+
+
+def build(gastos, source=None):
+    index = empty(source)
+    for g in gastos:
+        add(index, g)
+    return index
+
+
+def lookup(index, period, key):
+    """
+    Returns (total, count) for a bucket, (0, 0) if it has no gastos.
+    """
+    total, count = index[period].get(key, (0, 0))
+    return total, count
+
+
+def drift(index, gastos):
+    """
+    Buckets whose totals differ from the raw gastos, as {period: [keys]}.
+    """
+    fresh = build(gastos)
+    diff = {}
+    for period in PERIODS:
+        keys = set(index.get(period, {})) | set(fresh[period])
+        bad = sorted(k for k in keys
+                     if list(index.get(period, {}).get(k, [0, 0])) != fresh[period].get(k, [0, 0]))
+        if bad:
+            diff[period] = bad
+    return diff
+
+
+def load(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Unreadable index {path}, it will be rebuilt: {e}")
+        return None
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def save(path, index):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
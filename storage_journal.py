@@ -0,0 +1,239 @@
+"""
+Append-only JSON Lines journal used by the "journal" storage backend.
+
+Each save appends a single line, so writing a record costs O(1) bytes
+instead of rewriting the whole array. Records sharing an ``id`` are folded
+on read (last write wins); compaction rewrites the journal as a snapshot
+without superseded or torn lines.
+"""
+import json
+import os
+import logging
+import codec
+from locking import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Compact once this many superseded/torn lines have piled up in a journal.
+COMPACT_DEAD_LINES = 1000
+# Bytes read at a time when reading a journal backwards.
+REVERSE_CHUNK_SIZE = 64 * 1024
+
+
+def encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+
+def _write_all(fd, data):
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def append_records(path, records, fsync=False):
+    """
+    Appends records to the journal in a single write, followed by one
+    fsync when fsync is set.
+    """
+    data = "".join(encode(r) for r in records).encode('utf-8')
+    if not data:
+        return True
+
+    with FileLock(path):
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # A crash mid-append can leave a line without its newline;
+            # start on a fresh line so the new record isn't glued onto it.
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                data = b"\n" + data
+            _write_all(fd, data)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+    return True
+
+
+def append_record(path, record):
+    return append_records(path, [record])
+
+
+def _scan(path):
+    """
+    Returns (records, dead_lines) folding records by id, last write wins.
+    """
+    folded = {}
+    dead = 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    dead += 1
+                    continue
+                key = record.get("id") if isinstance(record, dict) else None
+                if key is None:
+                    key = object()
+                elif key in folded:
+                    dead += 1
+                folded[key] = record
+    except FileNotFoundError:
+        pass
+    return list(folded.values()), dead
+
+
+def _lines_with_offsets(f):
+    """
+    (offset, length, record) of each parseable line of a binary file,
+    from its current position.
+    """
+    offset = f.tell()
+    for line in f:
+        length = len(line)
+        if line.strip():
+            try:
+                yield offset, length, json.loads(line)
+            except ValueError:
+                pass
+        offset += length
+
+
+def iter_records(path):
+    """
+    Streams the journal in file order without holding it in memory,
+    folded like read_records(): a repeated id comes out once, where it
+    first appears, with its last version. The file is read twice, the
+    first time to find where each id was last written; only ids and
+    offsets are remembered.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        latest = {}
+        for offset, length, record in _lines_with_offsets(f):
+            key = record.get("id") if isinstance(record, dict) else None
+            if key is not None:
+                latest[key] = (offset, length)
+
+        f.seek(0)
+        seen = set()
+        for offset, length, record in _lines_with_offsets(f):
+            key = record.get("id") if isinstance(record, dict) else None
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+                last = latest.get(key)
+                if last is not None and last[0] != offset:
+                    # Same descriptor: a compaction since can't move the line
+                    record = json.loads(os.pread(f.fileno(), last[1], last[0]))
+            yield record
+
+
+def _reverse_lines(path, chunk_size):
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b""
+        while pos > 0:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b"\n")
+            # The first piece may be the end of a line that starts in the previous chunk
+            rest = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+
+def iter_reverse(path, chunk_size=REVERSE_CHUNK_SIZE):
+    """
+    Streams the journal from its last line back to the first, reading
+    chunks from the end of the file, so the newest records cost the same
+    however long the journal is. A repeated id yields only its last
+    version, as in read_records().
+    """
+    seen = set()
+    for line in _reverse_lines(path, chunk_size):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        key = record.get("id") if isinstance(record, dict) else None
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        yield record
+
+
+def read_records(path):
+    records, dead = _scan(path)
+    if dead >= COMPACT_DEAD_LINES:
+        compact(path)
+    return records
+
+
+def _write_snapshot(path, records):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for r in records:
+            f.write(encode(r))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def compact(path):
+    """
+    Rewrites the journal as a snapshot of its live records.
+    """
+    try:
+        with FileLock(path):
+            records, dead = _scan(path)
+            if not dead:
+                return 0
+            _write_snapshot(path, records)
+        logger.info(f"Compacted {path}: dropped {dead} dead lines.")
+        return dead
+    except Exception as e:
+        logger.error(f"Error compacting {path}: {e}")
+        return 0
+
+
+def migrate_from_json(json_path, path, sealed=()):
+    """
+    One-time migration of a JSON array file into a journal, after the
+    records of its sealed segments if any. The original file is kept as
+    ``<file>.migrated``.
+    """
+    # The JSON file's own lock keeps its writers out until it is renamed
+    with FileLock(path), FileLock(json_path):
+        if os.path.exists(path):
+            return False
+        records = []
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'rb') as f:
+                    records = codec.loads(f.read())
+            except ValueError:
+                logger.error(f"JSON corrupted in {json_path}. Starting an empty journal.")
+                records = []
+        records = list(sealed) + records
+        _write_snapshot(path, records)
+        if os.path.exists(json_path):
+            os.replace(json_path, json_path + ".migrated")
+    logger.info(f"Migrated {len(records)} records from {json_path} to {path}.")
+    return True
@@ -0,0 +1,215 @@
+"""
+SQLite engine used by the "sqlite" storage backend.
+
+The database runs in WAL mode so readers never block the writer. Each row
+keeps the original record as JSON (so get_gastos() returns the same dicts)
+plus indexed columns for the epoch timestamp of ``fecha`` and the
+category, which lets date ranges and sums be answered by the database.
+"""
+import os
+import json
+import sqlite3
+import threading
+import logging
+import utils
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS gastos (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    fecha TEXT,
+    ts INTEGER,
+    monto INTEGER NOT NULL DEFAULT 0,
+    categoria TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_gastos_fecha ON gastos(ts);
+CREATE INDEX IF NOT EXISTS idx_gastos_categoria ON gastos(categoria);
+
+CREATE TABLE IF NOT EXISTS pagos (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    vencimiento TEXT,
+    pagado INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pagos_vencimiento ON pagos(vencimiento);
+
+-- Bumped by every transaction that writes gastos, updates included
+CREATE TABLE IF NOT EXISTS gastos_writes (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO gastos_writes (id, n) VALUES (1, 0);
+"""
+
+_UPSERT_GASTO = """
+INSERT INTO gastos (id, fecha, ts, monto, categoria, data) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    fecha = excluded.fecha, ts = excluded.ts, monto = excluded.monto,
+    categoria = excluded.categoria, data = excluded.data
+"""
+
+_UPSERT_PAGO = """
+INSERT INTO pagos (id, vencimiento, pagado, data) VALUES (?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    vencimiento = excluded.vencimiento, pagado = excluded.pagado, data = excluded.data
+"""
+
+# One connection per (process, thread, database); sqlite3 connections
+# must not cross threads and must not survive a fork.
+_local = threading.local()
+
+
+def connect(path):
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.conns = {}
+
+    conn = _local.conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conns[path] = conn
+    return conn
+
+
+def _write(path, sql, rows, counter=None):
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(sql, rows)
+        if counter:
+            conn.execute(f"UPDATE {counter} SET n = n + 1")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return True
+
+
+def _range_clause(start_ts, end_ts):
+    clauses, params = [], []
+    if start_ts is not None:
+        clauses.append("ts >= ?")
+        params.append(start_ts)
+    if end_ts is not None:
+        clauses.append("ts < ?")
+        params.append(end_ts)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+# --- Gastos ---
+
+def _ts(fecha):
+    # An unparseable fecha is stored with ts NULL (left out of date ranges)
+    # rather than failing the whole batch
+    try:
+        return utils.to_epoch(fecha)
+    except (ValueError, TypeError):
+        return None
+
+
+def insert_gastos(path, gastos):
+    rows = [
+        (g.get("id"), g.get("fecha"), _ts(g.get("fecha")), g.get("monto", 0),
+         g.get("categoria"), json.dumps(g, ensure_ascii=False))
+        for g in gastos
+    ]
+    return _write(path, _UPSERT_GASTO, rows, counter="gastos_writes")
+
+
+def get_gastos(path):
+    rows = connect(path).execute("SELECT data FROM gastos ORDER BY seq")
+    return [json.loads(data) for (data,) in rows]
+
+
+def get_gastos_between(path, start_ts, end_ts):
+    where, params = _range_clause(start_ts, end_ts)
+    rows = connect(path).execute(f"SELECT data FROM gastos{where} ORDER BY ts, seq", params)
+    return [json.loads(data) for (data,) in rows]
+
+
+def iter_gastos_between(path, start_ts, end_ts, batch_size=500):
+    """
+    Streams matching gastos in date order, fetching rows in batches.
+    """
+    where, params = _range_clause(start_ts, end_ts)
+    cursor = connect(path).execute(f"SELECT data FROM gastos{where} ORDER BY ts, seq", params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for (data,) in rows:
+            yield json.loads(data)
+
+
+def sum_gastos_between(path, start_ts, end_ts):
+    where, params = _range_clause(start_ts, end_ts)
+    (total,) = connect(path).execute(f"SELECT COALESCE(SUM(monto), 0) FROM gastos{where}", params).fetchone()
+    return total
+
+
+def fingerprint(path):
+    """
+    Changes whenever gastos are written, new or updated in place (an upsert
+    keeps MAX(seq)); used to detect a stale aggregate index.
+    """
+    (seq, writes) = connect(path).execute(
+        "SELECT (SELECT COALESCE(MAX(seq), 0) FROM gastos), (SELECT n FROM gastos_writes)"
+    ).fetchone()
+    return [seq, writes]
+
+
+# --- Pagos ---
+
+def insert_pagos(path, pagos):
+    rows = [
+        (p.get("id"), p.get("vencimiento"), 1 if p.get("pagado") else 0,
+         json.dumps(p, ensure_ascii=False))
+        for p in pagos
+    ]
+    return _write(path, _UPSERT_PAGO, rows)
+
+
+def get_pagos(path):
+    rows = connect(path).execute("SELECT data FROM pagos ORDER BY seq")
+    return [json.loads(data) for (data,) in rows]
+
+
+def get_pending_pagos(path):
+    """
+    Unpaid pagos ordered by vencimiento, served by idx_pagos_vencimiento.
+    """
+    rows = connect(path).execute("SELECT data FROM pagos WHERE pagado = 0 ORDER BY vencimiento, seq")
+    return [json.loads(data) for (data,) in rows]
+
+
+def update_pago(path, pago_id, changes):
+    """
+    Merges changes into a stored pago. Returns the updated pago, or None
+    if there is no pago with that id.
+    """
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT data FROM pagos WHERE id = ?", (pago_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        pago = json.loads(row[0])
+        pago.update(changes)
+        conn.execute(
+            "UPDATE pagos SET vencimiento = ?, pagado = ?, data = ? WHERE id = ?",
+            (pago.get("vencimiento"), 1 if pago.get("pagado") else 0, json.dumps(pago, ensure_ascii=False), pago_id)
+        )
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return pago
@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_APP = """
+import sys, json
+sys.path.insert(0, {root!r})
+import dotenv.main
+dotenv.main.find_dotenv = lambda *args, **kwargs: {env_file!r}
+import app, storage, metrics, log_config, reminders
+print(json.dumps({expression}))
+"""
+
+
+@pytest.fixture
+def app_with_dotenv(tmp_path):
+    """
+    Runs ``import app`` in a fresh interpreter whose .env holds the given
+    settings, and returns what expression evaluates to there (as JSON).
+    """
+    def run(settings, expression):
+        env_file = tmp_path / ".env"
+        env_file.write_text("".join(f"{k}={v}\n" for k, v in settings.items()))
+        env = {k: v for k, v in os.environ.items() if k not in settings}
+        env["LOG_FILE"] = ""
+        script = _IMPORT_APP.format(root=ROOT, env_file=str(env_file), expression=expression)
+        out = subprocess.run([sys.executable, "-c", script], cwd=str(tmp_path), env=env,
+                             capture_output=True, text=True, check=True)
+        return json.loads(out.stdout.splitlines()[-1])
+    return run
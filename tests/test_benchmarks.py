@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import harness
+import run_all
+import storage
+
+
+def test_synthetic_history_is_ordered_and_stored():
+    gastos = harness.synthetic_gastos(200, days=30)
+    assert [g["fecha"] for g in gastos] == sorted(g["fecha"] for g in gastos)
+    assert len({g["id"] for g in gastos}) == 200
+    with harness.data_dir("journal"):
+        harness.populate(200, chunk=64)
+        assert len(storage.get_gastos()) == 200
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = {"results": {"b": {"gate": {"fast": 0.01, "slow": 10.0, "lost": 0}}}}
+    current = {"results": {"b": {"gate": {"fast": 0.04, "slow": 13.0, "lost": 1}}}}
+    regressions = run_all.compare(current, baseline, tolerance=0.25, min_delta=0.05)
+    assert regressions == [("slow", 10.0, 13.0), ("lost", 0, 1)]
@@ -0,0 +1,129 @@
+import gzip
+import json
+import random
+import pytest
+from unittest.mock import patch
+import codec
+import columnar
+import storage
+
+
+def _gastos(n, seed=3):
+    rng = random.Random(seed)
+    cats = ["comida", "transporte", "ocio", "salud"]
+    # Keys in the order commands.py saves them
+    return [{
+        "id": f"{rng.getrandbits(64):016x}",
+        "fecha": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:07.{i:06d}-05:00",
+        "monto": rng.choice([1500, 8000, 12500, 45000]),
+        "categoria": rng.choice(cats),
+        "detalle": rng.choice(["almuerzo", "taxi al trabajo", "cine", "droguería"]),
+    } for i in range(n)]
+
+
+ODD = [
+    {"id": "a", "monto": 10.5, "categoria": "comida", "detalle": "", "fecha": "2025-01-01T10:00:00"},
+    {"id": "b", "monto": 2 ** 70, "categoria": None, "detalle": "ñandú 🦤", "fecha": "2024-02-29T23:59:59+05:30"},
+    {"id": "c", "monto": 300, "fecha": "no es fecha", "pagado": True, "nota": {"x": [1, 2]}},
+    {"monto": -4, "categoria": "", "detalle": None, "fecha": "1969-12-31T23:59:59.999999+00:00"},
+    {},
+]
+
+
+@pytest.mark.parametrize("name", codec.CODECS)
+def test_round_trip(name):
+    records = _gastos(200) + ODD
+    assert codec.loads(codec.dumps(records, name)) == records
+
+
+def test_binary_keeps_key_order():
+    records = _gastos(20) + ODD + [
+        {"monto": 1, "id": "x"},
+        {"detalle": "y", "nota": 1, "id": "z", "fecha": "2025-01-01T10:00:00"},
+        {"nota": None, "id": "w", "monto": 2.5},
+    ]
+    assert json.dumps(codec.loads(codec.dumps(records, "binary"))) == json.dumps(records)
+
+
+def test_categories_past_the_header_limit_go_to_extra():
+    records = [{"id": str(i), "categoria": f"c{i}"} for i in range(0x10000 + 1)]
+    data = codec.dumps(records, "binary")
+    assert codec.loads(data) == records
+    assert codec.loads(codec.append_records(data, [{"id": "n", "categoria": "nueva"}]))[-1]["categoria"] == "nueva"
+
+
+def test_dict_is_written_as_json_by_every_codec():
+    config = {"presupuesto_mensual": 0, "moneda": "COP"}
+    for name in codec.CODECS:
+        assert codec.loads(codec.dumps(config, name)) == config
+
+
+def test_binary_is_smaller_than_json():
+    records = _gastos(1000)
+    assert len(codec.dumps(records, "binary")) * 2 < len(codec.dumps(records, "json"))
+
+
+def test_append_matches_full_encode():
+    records = _gastos(50) + ODD
+    data = codec.dumps(records[:20], "binary")
+    data = codec.append_records(data, records[20:])
+    assert data == codec.dumps(records, "binary")
+    assert codec.loads(data) == records
+
+
+def test_corrupted_binary_raises_value_error():
+    data = codec.dumps(_gastos(10), "binary")
+    for broken in (data[:-3], data + b"x", data[:6]):
+        with pytest.raises(ValueError):
+            codec.loads(broken)
+
+
+def test_table_rows_match_records():
+    records = _gastos(300) + ODD
+    expected = [row for row in map(columnar.row_of, records) if row is not None]
+    for name in codec.CODECS:
+        assert codec.table_rows(codec.dumps(records, name)) == expected
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.dumps([], "xml")
+
+
+@pytest.fixture
+def binary_storage(tmp_path):
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+         patch('storage.PAGOS_FILE', str(tmp_path / 'pagos.json')), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')), \
+         patch('storage.STORAGE_CODEC', "binary"):
+        storage.invalidate_cache()
+        yield tmp_path
+
+
+def test_storage_with_binary_codec(binary_storage):
+    gastos = _gastos(40)
+    with patch('storage.MAX_FILE_SIZE_BYTES', 0), patch('segments.COMPRESS', True):
+        storage.save_gastos(gastos[:20])
+        storage.save_gastos(gastos[20:30])
+    for g in gastos[30:]:
+        storage.save_gasto(g)
+    storage.update_config("moneda", "USD")
+
+    assert codec.is_binary((binary_storage / 'gastos.json').read_bytes())
+    assert storage.get_gastos() == gastos
+    assert storage.get_config()["moneda"] == "USD"
+    table = storage.get_table()
+    assert len(table) == 40
+    assert table.sum_between(None, None)[0] == sum(g["monto"] for g in gastos)
+
+    # The sealed segment, gastos.json and config.json; no pago was saved
+    assert storage.convert_files("json") == 3
+    assert json.loads((binary_storage / 'gastos.json').read_text()) == gastos[20:]
+    segment, = binary_storage.glob('gastos_*.json.gz')
+    assert json.loads(gzip.decompress(segment.read_bytes())) == gastos[:20]
+    assert storage.get_gastos() == gastos
+
+
+def test_codec_comes_from_dotenv(app_with_dotenv):
+    assert app_with_dotenv({"STORAGE_CODEC": "binary"}, "storage.STORAGE_CODEC") == "binary"
@@ -0,0 +1,102 @@
+import random
+import pytest
+from unittest.mock import patch
+import columnar
+import storage
+import utils
+
+
+def _gastos(n, seed=7):
+    rng = random.Random(seed)
+    cats = ["comida", "transporte", "ocio", "varios"]
+    gastos = []
+    for i in range(n):
+        day = 1 + i * 28 // n
+        gastos.append({
+            "id": f"g-{i}",
+            "fecha": f"2025-03-{day:02d}T{rng.randrange(24):02d}:00:00-05:00",
+            "monto": rng.choice([1000, 2500, 5000, 12000, 40000]),
+            "categoria": rng.choice(cats),
+            "detalle": f"d{i}",
+        })
+    return gastos
+
+
+def _naive(gastos, start_ts, end_ts):
+    return [g for g in gastos if start_ts <= utils.to_epoch(g["fecha"]) < end_ts]
+
+
+BOUNDS = (utils.to_epoch("2025-03-05T00:00:00-05:00"), utils.to_epoch("2025-03-20T00:00:00-05:00"))
+
+
+@pytest.fixture(params=["0", "1"], ids=["python", "numpy"])
+def engine(request):
+    if request.param == "1":
+        pytest.importorskip("numpy")
+    with patch.object(columnar, "COLUMNAR_NUMPY", request.param):
+        yield request.param
+
+
+def test_sum_between_matches_scan():
+    gastos = _gastos(500)
+    table = columnar.GastoTable.from_gastos(gastos)
+    expected = _naive(gastos, *BOUNDS)
+
+    assert table.sum_between(*BOUNDS) == (sum(g["monto"] for g in expected), len(expected))
+    assert table.sum_between() == (sum(g["monto"] for g in gastos), len(gastos))
+    assert table.sum_between(BOUNDS[1], BOUNDS[0]) == (0, 0)
+
+
+def test_unsorted_input_and_bad_fechas():
+    gastos = _gastos(50)
+    shuffled = list(reversed(gastos)) + [{"id": "x", "monto": 5}, {"id": "y", "fecha": "nope", "monto": 5}]
+    table = columnar.GastoTable.from_gastos(shuffled)
+
+    assert len(table) == 50
+    assert list(table.ts) == sorted(table.ts)
+    assert table.sum_between() == columnar.GastoTable.from_gastos(gastos).sum_between()
+
+
+def test_by_category(engine):
+    gastos = _gastos(500)
+    table = columnar.GastoTable.from_gastos(gastos)
+    expected = {}
+    for g in _naive(gastos, *BOUNDS):
+        total, count = expected.get(g["categoria"], (0, 0))
+        expected[g["categoria"]] = (total + g["monto"], count + 1)
+
+    groups = table.by_category(*BOUNDS)
+    assert groups == expected
+    totals = [total for total, _ in groups.values()]
+    assert totals == sorted(totals, reverse=True)
+
+
+def test_top(engine):
+    gastos = _gastos(500)
+    table = columnar.GastoTable.from_gastos(gastos)
+    in_range = _naive(gastos, *BOUNDS)
+    expected = sorted(in_range, key=lambda g: (-g["monto"], utils.to_epoch(g["fecha"])))[:5]
+
+    rows = [table.row(i) for i in table.top(5, *BOUNDS)]
+    assert [r["detalle"] for r in rows] == [g["detalle"] for g in expected]
+    assert table.top(0) == []
+    assert len(table.top(10_000)) == len(gastos)
+
+
+def test_memory_per_record():
+    table = columnar.GastoTable.from_gastos(_gastos(1000))
+    assert table.nbytes() / len(table) < 32
+
+
+def test_storage_table_is_reused_until_data_changes(tmp_path):
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')):
+        storage.save_gastos(_gastos(10))
+        table = storage.get_table()
+        assert storage.get_table() is table
+
+        storage.save_gasto({"id": "n", "fecha": "2025-03-30T10:00:00-05:00", "monto": 7, "categoria": "ocio"})
+        rebuilt = storage.get_table()
+        assert rebuilt is not table
+        assert len(rebuilt) == 11
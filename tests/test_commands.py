@@ -1,6 +1,10 @@
 import pytest
 from unittest.mock import patch, MagicMock
 import commands
+import columnar
+import pagos_index
+import storage
+import storage_index
 import datetime
 
 @pytest.fixture
@@ -14,6 +18,18 @@ def mock_storage():
         }
         mock.get_gastos.return_value = []
         mock.get_pagos.return_value = []
+        # Range queries run against whatever get_gastos is set to return
+        mock.get_gastos_between.side_effect = lambda start=None, end=None: \
+            storage.filter_gastos_between(mock.get_gastos.return_value, start, end)
+        mock.sum_gastos_between.side_effect = lambda start=None, end=None: \
+            sum(g["monto"] for g in mock.get_gastos_between(start, end))
+        mock.get_period_totals.side_effect = lambda period, key: \
+            storage_index.lookup(storage_index.build(mock.get_gastos.return_value), period, key)
+        mock.get_totals.side_effect = lambda buckets: \
+            {b: storage_index.lookup(storage_index.build(mock.get_gastos.return_value), *b) for b in buckets}
+        mock.get_due_index.side_effect = lambda: pagos_index.DueIndex(mock.get_pagos.return_value)
+        mock.get_pending_pagos.side_effect = lambda: list(mock.get_due_index().pending)
+        mock.get_table.side_effect = lambda since=None: columnar.GastoTable.from_gastos(mock.get_gastos.return_value)
         yield mock
 
 def test_parse_gasto_valid(mock_storage):
@@ -63,3 +79,148 @@ def test_pagopendiente_agregar(mock_storage):
 def test_unknown_command():
     response = commands.parse("saltar 500")
     assert "No entendí" in response
+
+def test_calculo_hoy_excludes_other_days(mock_storage):
+    now = datetime.datetime.now()
+    mock_storage.get_gastos.return_value = [
+        {"fecha": now.isoformat(), "monto": 7000, "categoria": "x", "detalle": "y"},
+        {"fecha": (now - datetime.timedelta(days=2)).isoformat(), "monto": 3000, "categoria": "x", "detalle": "z"}
+    ]
+
+    response = commands.parse("hoy")
+    assert response == "Hoy has gastado: 7.000 COP."
+
+def test_resumen_reads_each_file_once(tmp_path):
+    with patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+         patch('storage.PAGOS_FILE', str(tmp_path / 'pagos.json')), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')):
+        commands.parse("gasto 15000 almuerzo")
+        commands.parse("pagopendiente agregar luz 45000 2025-11-30")
+        storage.invalidate_cache()
+
+        with patch('storage._read_json', wraps=storage._read_json) as read:
+            response = commands.parse("resumen")
+            read_paths = [call.args[0] for call in read.call_args_list]
+
+    assert "Hoy has gastado: 15.000 COP." in response
+    assert sorted(read_paths) == sorted([str(tmp_path / 'config.json'), str(tmp_path / 'pagos.json')])
+
+@pytest.mark.parametrize("text, handler", [
+    ("hoy", commands.handle_hoy),
+    ("gastos", commands.handle_hoy),
+    ("Gastos HOY", commands.handle_hoy),
+    ("gastos mes", commands.handle_mes),
+    ("mes", commands.handle_mes),
+    ("gastos   semana", commands.handle_semana),
+    ("semana", commands.handle_semana),
+    ("cuanto me queda", commands.handle_cuanto_me_queda),
+    ("Cuánto me queda?", None),
+    ("cuánto me queda", commands.handle_cuanto_me_queda),
+    ("cuanto me", None),
+    ("hoy gaste mucho", None),
+    ("gastos ayer", None),
+    ("resumen", commands.handle_resumen),
+    ("reporte categorias mes", commands.handle_reporte),
+    ("top 5 gastos semana", commands.handle_top),
+])
+def test_resolve(text, handler):
+    assert commands.resolve(text)[0] is handler
+
+def test_resolve_keeps_argument_case():
+    handler, args = commands.resolve("gasto 5000 Transporte Bus")
+    assert handler is commands.handle_gasto
+    assert args == ["5000", "Transporte", "Bus"]
+    assert commands.resolve("ayuda por favor") == (commands.handle_ayuda, None)
+
+def _report_gastos():
+    return [
+        {"fecha": "2025-01-10T12:00:00+00:00", "monto": 10000, "categoria": "comida", "detalle": "almuerzo"},
+        {"fecha": "2025-01-20T12:00:00+00:00", "monto": 30000, "categoria": "ocio", "detalle": "cine"},
+        {"fecha": "2025-02-03T12:00:00+00:00", "monto": 5000, "categoria": "comida", "detalle": "pan"},
+        {"fecha": "2025-07-01T12:00:00+00:00", "monto": 99000, "categoria": "ocio", "detalle": "fuera de rango"},
+    ]
+
+def test_reporte_categorias(mock_storage):
+    mock_storage.get_gastos.return_value = _report_gastos()
+    response = commands.parse("reporte categorias 2025-01")
+    assert response == (
+        "📊 Gastos por categoría (2025-01):\n"
+        "- ocio: 30.000 COP (1)\n"
+        "- comida: 10.000 COP (1)\n"
+        "Total: 40.000 COP"
+    )
+
+def test_reporte_rango_por_mes(mock_storage):
+    mock_storage.get_gastos.return_value = _report_gastos()
+    response = commands.parse("reporte 2025-01..2025-06")
+    assert response == (
+        "📊 Reporte 2025-01..2025-06:\n"
+        "Total: 45.000 COP en 3 gastos.\n"
+        "Por mes:\n"
+        "- 2025-01: 40.000 COP\n"
+        "- 2025-02: 5.000 COP\n"
+        "- 2025-03: 0 COP\n"
+        "- 2025-04: 0 COP\n"
+        "- 2025-05: 0 COP\n"
+        "- 2025-06: 0 COP\n"
+        "Categorías principales:\n"
+        "- ocio: 30.000 COP\n"
+        "- comida: 15.000 COP"
+    )
+    mock_storage.get_table.assert_called_once()
+
+def test_top_gastos(mock_storage):
+    mock_storage.get_gastos.return_value = _report_gastos()
+    response = commands.parse("top 2 gastos 2025-01..2025-02")
+    assert response == (
+        "🏆 Top 2 gastos (2025-01..2025-02):\n"
+        "1. 30.000 COP — cine (ocio, 20/01)\n"
+        "2. 10.000 COP — almuerzo (comida, 10/01)"
+    )
+
+@pytest.mark.parametrize("text", ["reporte", "reporte categorias ayer2", "reporte 2025-06..2025-01", "top 0 gastos", "top 5 gastos mes extra"])
+def test_reporte_formato_invalido(mock_storage, text):
+    assert commands.parse(text).startswith("❌ Formato")
+
+def test_reporte_sin_gastos(mock_storage):
+    assert commands.parse("reporte categorias mes").startswith("No hay gastos en ")
+
+def test_reporte_reciente_lee_solo_la_cola(mock_storage):
+    commands.parse("reporte categorias hoy")
+    since = mock_storage.get_table.call_args.kwargs["since"]
+    assert since.date() == datetime.datetime.now(since.tzinfo).date()
+
+    mock_storage.get_table.reset_mock()
+    commands.parse("top 3 gastos 2025-01")
+    mock_storage.get_table.assert_called_once_with()
+
+def test_resumen_matches_individual_commands(mock_storage):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    mock_storage.get_gastos.return_value = [
+        {"fecha": now.isoformat(), "monto": 50000, "categoria": "x", "detalle": "y"},
+        {"fecha": (now - datetime.timedelta(days=40)).isoformat(), "monto": 9000, "categoria": "x", "detalle": "z"},
+    ]
+    mock_storage.get_pagos.return_value = [
+        {"nombre": "agua", "monto": 20000, "vencimiento": "2025-12-05", "pagado": False},
+        {"nombre": "luz", "monto": 45000, "vencimiento": "2025-11-30", "pagado": False},
+        {"nombre": "gas", "monto": 1000, "vencimiento": "2025-11-01", "pagado": True},
+    ]
+    expected = "📊 Resumen:\n" + "\n".join(commands.parse(c) for c in ("hoy", "semana", "mes")) \
+        + "\nPróximo pago: luz (45.000 COP) el 2025-11-30."
+
+    mock_storage.get_config.reset_mock()
+    mock_storage.get_totals.reset_mock()
+    assert commands.parse("resumen") == expected
+    mock_storage.get_config.assert_called_once()
+    mock_storage.get_totals.assert_called_once()
+
+def test_pagopendiente_pagar(mock_storage):
+    mock_storage.get_pagos.return_value = [
+        {"id": "p-1", "nombre": "luz", "monto": 45000, "vencimiento": "2025-11-30", "pagado": False},
+    ]
+    mock_storage.update_pago.return_value = {"id": "p-1", "pagado": True}
+
+    assert commands.parse("pagopendiente pagar Luz") == "✅ Pago marcado como pagado: luz - 45.000 COP."
+    mock_storage.update_pago.assert_called_once_with("p-1", {"pagado": True})
+    assert commands.parse("pagopendiente pagar p-9").startswith("❌ No encontré")
+    assert "[p-1]" in commands.parse("pagopendiente listar")
@@ -0,0 +1,78 @@
+import math
+import datetime
+import pytest
+from unittest.mock import patch
+import dates
+import utils
+
+TZ = "America/Bogota"
+
+
+@pytest.mark.parametrize("text", [
+    "hoy", "Hoy", " ayer ", "anteayer", "mañana", "manana",
+    "lunes", "miércoles", "miercoles", "sábado", "sabado", "domingo",
+    "2025-11-12", "2025-2-3",
+])
+def test_fast_path_matches_dateparser(text):
+    with patch.object(dates, "parse_with_dateparser") as slow:
+        fast = utils.parse_date_input(text, TZ)
+    slow.assert_not_called()
+
+    expected = dates.parse_with_dateparser(text, TZ)
+    assert fast.date() == expected.date()
+    assert fast.utcoffset() == expected.utcoffset()
+    assert (fast.time() == datetime.time(0)) == (expected.time() == datetime.time(0))
+
+
+def test_invalid_iso_date_is_none():
+    with patch.object(dates, "parse_with_dateparser") as slow:
+        assert utils.parse_date_input("2025-02-30", TZ) is None
+    slow.assert_not_called()
+
+
+def test_free_form_falls_back_to_dateparser():
+    dt = utils.parse_date_input("12 de noviembre de 2025", TZ)
+    assert dt.date() == datetime.date(2025, 11, 12)
+
+
+@pytest.mark.parametrize("value", [
+    "2025-11-12T15:30:00-05:00",
+    "2025-11-12T15:30:00.999999-05:00",
+    "2025-11-12 23:59:59+05:30",
+    "2024-02-29T00:00:00+00:00",
+    "1969-12-31T23:59:59.5+00:00",
+    "2025-11-12T15:30:00Z",
+    "2025-11-12T15:30:00",
+    "2025-11-12",
+])
+def test_iso_to_epoch_matches_fromisoformat(value):
+    expected = math.floor(datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    assert dates.iso_to_epoch(value) == expected
+
+
+def test_range_test_matches_exact_comparison():
+    tz = utils.get_timezone(TZ)
+    start = tz.localize(datetime.datetime(2025, 3, 1))
+    end = tz.localize(datetime.datetime(2025, 4, 1))
+    start_ts, end_ts = utils.to_epoch(start), utils.to_epoch(end)
+
+    fechas = []
+    base = datetime.datetime(2025, 2, 20, tzinfo=datetime.timezone.utc)
+    for hours in range(0, 24 * 45, 5):
+        t = base + datetime.timedelta(hours=hours)
+        for offset in (-12, -5, 0, 9, 14):
+            fechas.append(t.astimezone(datetime.timezone(datetime.timedelta(hours=offset))).isoformat())
+
+    for bounds in ((start_ts, end_ts), (start_ts, None), (None, end_ts)):
+        test = dates.range_test(*bounds)
+        for fecha in fechas:
+            ts = utils.to_epoch(fecha)
+            expected = (bounds[0] is None or ts >= bounds[0]) and (bounds[1] is None or ts < bounds[1])
+            assert test(fecha) == expected, (bounds, fecha)
+
+
+def test_week_key():
+    assert dates.week_key("2025-01-01") == "2025-W01"
+    assert dates.week_key("2024-12-30") == "2025-W01"
+    with pytest.raises(ValueError):
+        dates.week_key("no-date")
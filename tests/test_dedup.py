@@ -0,0 +1,43 @@
+import time
+import multiprocessing
+import dedup
+
+def test_hits_and_misses(tmp_path):
+    cache = dedup.DedupCache(str(tmp_path / 'dedup.db'))
+    assert cache.is_duplicate("a") is False
+    assert cache.is_duplicate("a") is True
+    assert cache.is_duplicate("b") is False
+    assert cache.stats() == {"hits": 1, "misses": 2, "cached": 2}
+
+def test_workers_share_the_disk_store(tmp_path):
+    path = str(tmp_path / 'dedup.db')
+    first, second = dedup.DedupCache(path), dedup.DedupCache(path)
+
+    assert first.is_duplicate("wamid.1") is False
+    assert second.is_duplicate("wamid.1") is True  # nothing in its memory yet
+
+def test_memory_is_bounded_and_entries_expire(tmp_path):
+    cache = dedup.DedupCache(str(tmp_path / 'dedup.db'), ttl=0.05, max_entries=2)
+    for message_id in ("a", "b", "c"):
+        cache.is_duplicate(message_id)
+    assert list(cache.recent) == ["b", "c"]
+
+    time.sleep(0.1)
+    assert cache.is_duplicate("c") is False  # expired everywhere, handled again
+
+def _claim(path, message_id, results):
+    results.put(dedup.DedupCache(path).is_duplicate(message_id))
+
+def test_exactly_one_process_claims_a_message(tmp_path):
+    path = str(tmp_path / 'dedup.db')
+    dedup.DedupCache(path).is_duplicate("warmup")  # create the schema once
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_claim, args=(path, "wamid.x", results)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(10)
+
+    outcomes = [results.get(timeout=5) for _ in procs]
+    assert outcomes.count(False) == 1
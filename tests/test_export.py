@@ -0,0 +1,89 @@
+import csv
+import gzip
+import io
+import pytest
+from unittest.mock import patch
+import app
+import commands
+import export
+import storage
+
+GASTOS = [
+    {"id": "g1", "fecha": "2025-01-15T10:00:00-05:00", "monto": 1000, "categoria": "comida", "detalle": "pan"},
+    {"id": "g2", "fecha": "2025-02-10T10:00:00-05:00", "monto": 2000, "categoria": "transporte", "detalle": "bus"},
+    {"id": "g3", "fecha": "2025-02-20T10:00:00-05:00", "monto": 3000, "categoria": "comida", "detalle": "cena"},
+    {"id": "g4", "fecha": "2025-03-01T10:00:00-05:00", "monto": 4000, "categoria": "comida", "detalle": "café"},
+]
+
+@pytest.fixture(params=["json", "journal", "sqlite"])
+def data_dir(request, tmp_path):
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+         patch('storage.PAGOS_FILE', str(tmp_path / 'pagos.json')), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')), \
+         patch('storage.SQLITE_FILE', str(tmp_path / 'storage.db')), \
+         patch('storage.STORAGE_BACKEND', request.param):
+        storage.save_gastos(GASTOS)
+        yield tmp_path
+
+def _ids(csv_text):
+    return [row["id"] for row in csv.DictReader(io.StringIO(csv_text))]
+
+def test_exportar_mes(data_dir):
+    response = commands.parse("exportar mes 2025-02")
+    assert response.startswith("✅ Archivo exportado: ")
+    assert _ids((data_dir / 'export_2025-02.csv').read_text()) == ["g2", "g3"]
+
+def test_exportar_rango_categoria_gzip(data_dir):
+    response = commands.parse("exportar 2025-01-01..2025-02-28 comida gz")
+    assert "export_2025-01-01_2025-02-28_comida.csv.gz" in response
+    with gzip.open(data_dir / 'export_2025-01-01_2025-02-28_comida.csv.gz', 'rt') as f:
+        assert _ids(f.read()) == ["g1", "g3"]
+
+def test_exportar_sin_gastos(data_dir):
+    assert commands.parse("exportar mes 2024-12") == "No hay gastos para 2024-12."
+    assert not list(data_dir.glob("export_*"))
+
+def test_exportar_formato_invalido(data_dir):
+    assert commands.parse("exportar mes 2025-13").startswith("❌")
+    assert commands.parse("exportar 2025-03-01..2025-01-01").startswith("❌")
+    assert commands.parse("exportar").startswith("❌")
+
+def test_export_endpoint_streams_csv(data_dir):
+    client = app.app.test_client()
+    auth = {"Authorization": "Bearer secreto"}
+    with patch('app.EXPORT_TOKEN', 'secreto'):
+        assert client.get("/export").status_code == 403
+
+        assert client.get("/export?token=secreto").status_code == 403
+
+        response = client.get("/export?desde=2025-02-01&hasta=2025-03-31", headers=auth)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert _ids(response.get_data(as_text=True)) == ["g2", "g3", "g4"]
+
+        response = client.get("/export?categoria=transporte&gzip=1", headers=auth)
+        assert _ids(gzip.decompress(response.get_data()).decode()) == ["g2"]
+
+        assert client.get("/export?desde=ayer", headers=auth).status_code == 400
+
+def test_iter_csv_is_lazy():
+    def gastos():
+        yield GASTOS[0]
+        raise AssertionError("read past the first row")
+
+    chunks = export.iter_csv(gastos())
+    assert next(chunks).startswith("fecha,monto")
+    assert next(chunks).startswith("2025-01-15")
+
+def test_ranges_use_each_bounds_own_offset():
+    import pytz
+    tz = pytz.timezone("America/New_York")
+    # One of the two months is always in the other DST period from today
+    for mes, offset in (("2025-01", "-05:00"), ("2025-07", "-04:00")):
+        start, end = export.month_range(mes, tz)
+        assert start.isoformat() == f"{mes}-01T00:00:00{offset}"
+        assert end.utcoffset() == start.utcoffset()
+    desde, hasta = export.day_range("2025-03-08", "2025-03-09", tz)
+    assert desde.isoformat() == "2025-03-08T00:00:00-05:00"
+    assert hasta.isoformat() == "2025-03-10T00:00:00-04:00"
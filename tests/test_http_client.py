@@ -0,0 +1,103 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from unittest.mock import patch
+import http_client
+import metrics
+
+class StubGraphAPI(BaseHTTPRequestHandler):
+    """
+    Stands in for graph.facebook.com: answers with the scripted statuses
+    in order, then 200, and records which connection each request used.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests.append((self.client_address, body))
+            status, headers = server.script.pop(0) if server.script else (200, {})
+        payload = b'{"messages": [{"id": "wamid.x"}]}'
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphAPI)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.script = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/messages"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client():
+    c = http_client.OutboundClient(pool_size=2, timeout=2, max_attempts=3, backoff_base=0.01, backoff_cap=0.05)
+    yield c
+    c.close(timeout=2)
+
+def test_connections_are_reused(stub, client):
+    for i in range(5):
+        assert client.post_async(stub.url, {}, {"n": i}).result(timeout=5) is True
+
+    assert [body["n"] for _, body in stub.requests] == list(range(5))
+    assert len({addr for addr, _ in stub.requests}) == 1  # one keep-alive connection
+    stats = client.stats()
+    assert stats["sent"] == 5
+    assert stats["send_latency_seconds"]["count"] == 5
+
+def test_send_seconds_metric_covers_async_sends(stub, client):
+    h = metrics.Histogram("send_seconds", "Test.")
+    stub.script = [(503, {})]
+    with patch('metrics.METRICS_ENABLED', True), patch('metrics.SEND_SECONDS', h):
+        assert client.post_async(stub.url, {}, {"n": 1}).result(timeout=5) is True
+    assert dict(h.samples())["send_seconds_count"] == 1
+
+def test_rate_limit_honours_retry_after(stub, client):
+    stub.script = [(429, {"Retry-After": "0"}), (503, {})]
+
+    assert client.post_async(stub.url, {}, {}).result(timeout=5) is True
+    assert len(stub.requests) == 3
+    stats = client.stats()
+    assert stats["rate_limited"] == 1
+    assert stats["retries"] == 2
+
+def test_gives_up_after_max_attempts(stub, client):
+    stub.script = [(500, {})] * 3
+
+    assert client.post_async(stub.url, {}, {}).result(timeout=5) is False
+    assert len(stub.requests) == 3
+    assert client.stats()["failed"] == 1
+
+def test_client_errors_are_not_retried(stub, client):
+    stub.script = [(400, {})]
+
+    assert client.post_async(stub.url, {}, {}).result(timeout=5) is False
+    assert len(stub.requests) == 1
+
+def test_retry_does_not_block_the_caller(stub, client):
+    client.backoff_base = client.backoff_cap = 0.5
+    stub.script = [(503, {})]
+
+    future = client.post_async(stub.url, {}, {})
+    assert future.done() is False  # returned before the retry delay elapsed
+    assert future.result(timeout=5) is True
+
+def test_parse_retry_after():
+    assert http_client.parse_retry_after("7") == 7.0
+    assert http_client.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert http_client.parse_retry_after("soon") is None
+    assert http_client.parse_retry_after(None) is None
@@ -0,0 +1,124 @@
+import os
+import json
+import logging
+import pytest
+from unittest.mock import patch
+import log_config
+
+BODY = {
+    "entry": [{"changes": [{"value": {
+        "contacts": [{"profile": {"name": "Ana"}, "wa_id": "573001234567"}],
+        "messages": [{"id": "wamid.1", "from": "573001234567", "type": "text",
+                      "text": {"body": "gasto 5000 comida"}}],
+        "statuses": [{"id": "wamid.0", "recipient_id": "573001234567"}],
+    }}]}]
+}
+
+
+def _record(msg, *args, **extra):
+    record = logging.LogRecord("bot", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extras():
+    line = log_config.JsonFormatter().format(_record("hola %s", "mundo", webhook={"statuses": 1}))
+    entry = json.loads(line)
+    assert entry["message"] == "hola mundo"
+    assert entry["level"] == "INFO"
+    assert entry["webhook"] == {"statuses": 1}
+
+
+def test_text_formatter_appends_extras():
+    line = log_config.TextFormatter().format(_record("Received webhook", webhook={"statuses": 1}))
+    assert line.endswith(' - bot - INFO - Received webhook {"webhook": {"statuses": 1}}')
+
+
+def test_queue_handler_leaves_formatting_to_listener():
+    record = _record("hola %s", "mundo")
+    prepared = log_config.DeferredQueueHandler(None).prepare(record)
+    assert prepared.msg == "hola %s" and prepared.args == ("mundo",)
+
+
+def test_webhook_payload_modes():
+    with patch('log_config.LOG_WEBHOOK_BODY', "summary"):
+        assert log_config.webhook_payload(BODY) == {
+            "messages": [{"id": "wamid.1", "from": "573*******67", "type": "text"}],
+            "statuses": 1,
+        }
+    with patch('log_config.LOG_WEBHOOK_BODY', "redacted"):
+        redacted = json.dumps(log_config.webhook_payload(BODY))
+        assert "573001234567" not in redacted and "gasto" not in redacted and "Ana" not in redacted
+        assert '"body": "<17 chars>"' in redacted
+    with patch('log_config.LOG_WEBHOOK_BODY', "full"):
+        assert log_config.webhook_payload(BODY) is BODY
+    with patch('log_config.LOG_WEBHOOK_BODY', "off"):
+        assert log_config.webhook_payload(BODY) is None
+    with patch('log_config.LOG_WEBHOOK_SAMPLE', 0.0):
+        assert log_config.webhook_payload(BODY) is None
+
+
+@pytest.mark.parametrize("body", [
+    {"entry": [None]},
+    {"entry": [{"changes": ["texto"]}]},
+    {"entry": [{"changes": [{"value": {"messages": [None, 3], "statuses": "x"}}]}]},
+    {"entry": {"changes": []}},
+    ["entry"],
+])
+def test_summary_of_malformed_bodies(body):
+    with patch('log_config.LOG_WEBHOOK_BODY', "summary"):
+        summary = log_config.webhook_payload(body)
+    assert summary in ({"messages": [], "statuses": 0}, {"type": "list"})
+
+
+def test_malformed_webhook_is_acknowledged():
+    import app
+    with patch('log_config.LOG_WEBHOOK_BODY', "summary"), \
+            patch.object(app.logger, 'isEnabledFor', return_value=True), \
+            patch('webhook_queue.WEBHOOK_ASYNC', False):
+        response = app.app.test_client().post("/webhook", json={"entry": [None]})
+    assert response.status_code == 200
+
+
+@pytest.fixture
+def fresh_setup(tmp_path):
+    root = logging.getLogger()
+    level = root.level
+    with patch('log_config._handler', None), patch('log_config._listener', None), \
+            patch('log_config.LOG_FILE', str(tmp_path / "bot.log")), \
+            patch('log_config.LOG_MAX_BYTES', 300), patch('log_config.LOG_BACKUP_COUNT', 2):
+        log_config.setup()
+        yield tmp_path
+        log_config.stop()
+        root.removeHandler(log_config._handler)
+    root.setLevel(level)
+
+
+def test_setup_writes_rotated_file_from_listener(fresh_setup):
+    log = logging.getLogger("test_log_config")
+    for i in range(20):
+        log.info("line %d", i)
+    log_config.stop()
+
+    files = sorted(os.listdir(fresh_setup))
+    assert files == ["bot.log", "bot.log.1", "bot.log.2"]
+    assert "line 19" in (fresh_setup / "bot.log").read_text()
+
+
+def test_forked_child_gets_its_own_listener(fresh_setup):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logging.getLogger("test_log_config").warning("from child")
+            log_config.stop()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    log_config.stop()
+    assert "from child" in (fresh_setup / "bot.log").read_text()
+
+
+def test_format_and_level_come_from_dotenv(app_with_dotenv):
+    settings = {"LOG_FORMAT": "json", "LOG_LEVEL": "debug"}
+    expression = "[log_config.logging.getLogger().level, type(log_config._listener.handlers[0].formatter).__name__]"
+    assert app_with_dotenv(settings, expression) == [logging.DEBUG, "JsonFormatter"]
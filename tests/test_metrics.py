@@ -0,0 +1,90 @@
+import fcntl
+import pytest
+from unittest.mock import patch
+import app
+import commands
+import locking
+import metrics
+
+
+@pytest.fixture
+def enabled():
+    with patch('metrics.METRICS_ENABLED', True):
+        yield
+
+
+def test_histogram_samples_are_cumulative():
+    h = metrics.Histogram("t_seconds", "Test.", ("op",), buckets=(0.1, 1))
+    h.observe(0.05, op="a")
+    h.observe(0.5, op="a")
+    h.observe(5, op="a")
+    samples = dict(h.samples())
+    assert samples['t_seconds_bucket{op="a",le="0.1"}'] == 1
+    assert samples['t_seconds_bucket{op="a",le="1"}'] == 2
+    assert samples['t_seconds_bucket{op="a",le="+Inf"}'] == 3
+    assert samples['t_seconds_count{op="a"}'] == 3
+    assert samples['t_seconds_sum{op="a"}'] == 5.55
+
+
+def test_timed_is_a_noop_when_disabled():
+    def fn():
+        return 1
+    with patch('metrics.METRICS_ENABLED', False):
+        assert metrics.timed(metrics.STORAGE_SECONDS, op="x")(fn) is fn
+
+
+def test_timed_and_timer_observe(enabled):
+    h = metrics.Histogram("t_seconds", "Test.", ("op",))
+    assert metrics.timed(h, op="f")(lambda: 42)() == 42
+    with metrics.timer(h, op="block"):
+        pass
+    counts = {name: value for name, value in h.samples() if "_count" in name}
+    assert counts == {'t_seconds_count{op="block"}': 1, 't_seconds_count{op="f"}': 1}
+
+
+def test_render_includes_collectors():
+    c = metrics.Counter("t_total", "Things.", ("kind",))
+    c.inc(kind='a"b')
+
+    def collect():
+        return [("t_gauge", "gauge", "A gauge.", [("t_gauge", {"file": "x.json"}, 7)])]
+
+    def broken():
+        raise RuntimeError("boom")
+
+    with patch('metrics._metrics', [c]), patch('metrics._collectors', [broken, collect]):
+        text = metrics.render()
+    assert '# TYPE t_total counter\nt_total{kind="a\\"b"} 1\n' in text
+    assert '# TYPE t_gauge gauge\nt_gauge{file="x.json"} 7\n' in text
+
+
+def test_command_latency_and_lock_wait(enabled, tmp_path):
+    h = metrics.Histogram("cmd_seconds", "Test.", ("command",))
+    with patch('metrics.COMMAND_SECONDS', h), patch('commands.storage'):
+        commands.parse("ayuda")
+        commands.parse("nada que ver")
+    assert [name for name, _ in h.samples() if "_count" in name] == ['cmd_seconds_count{command="ayuda"}']
+
+    lock = metrics.Histogram("lock_seconds", "Test.", ("file",))
+    with patch('metrics.LOCK_WAIT_SECONDS', lock), open(tmp_path / "gastos.json", "w") as f:
+        locking.flock(f, fcntl.LOCK_EX)
+    assert dict(lock.samples())['lock_seconds_count{file="gastos.json"}'] == 1
+
+
+def test_metrics_endpoint_follows_dotenv(app_with_dotenv):
+    status = "app.app.test_client().get('/metrics').status_code"
+    assert app_with_dotenv({"METRICS_ENABLED": "0"}, status) == 404
+    assert app_with_dotenv({"METRICS_ENABLED": "1"}, status) == 200
+
+
+def test_metrics_endpoint(enabled, tmp_path):
+    client = app.app.test_client()
+    (tmp_path / "gastos.json").write_text("[]")
+    (tmp_path / "gastos_20250101_000000.json").write_text("[1]")
+    with patch('storage.DATA_DIR', str(tmp_path)):
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert 'bot_data_file_bytes{file="gastos.json"} 2' in text
+    assert 'bot_data_files{file="gastos_rotated"} 1' in text
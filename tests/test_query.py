@@ -0,0 +1,77 @@
+import datetime
+import pytest
+from unittest.mock import patch
+import columnar
+import query
+import utils
+
+TZ = utils.get_timezone("America/Bogota")
+TODAY = datetime.date(2025, 3, 12)  # a Wednesday
+
+
+@pytest.mark.parametrize("spec, label, first, last", [
+    ("hoy", "2025-03-12", "2025-03-12", "2025-03-13"),
+    ("ayer", "2025-03-11", "2025-03-11", "2025-03-12"),
+    ("semana", "semana del 10/03", "2025-03-10", "2025-03-17"),
+    ("mes", "2025-03", "2025-03-01", "2025-04-01"),
+    ("año", "2025", "2025-01-01", "2026-01-01"),
+    ("2024-12", "2024-12", "2024-12-01", "2025-01-01"),
+    ("2025-01..2025-06", "2025-01..2025-06", "2025-01-01", "2025-07-01"),
+    ("2025-01-15..2025-02-15", "2025-01-15..2025-02-15", "2025-01-15", "2025-02-16"),
+])
+def test_resolve_period(spec, label, first, last):
+    got_label, start, end = query.resolve_period(spec, TZ, TODAY)
+    assert got_label == label
+    assert start.date().isoformat() == first and start.hour == 0
+    assert end.date().isoformat() == last
+    assert start.utcoffset() == datetime.timedelta(hours=-5)
+
+
+def test_resolve_period_open_and_invalid():
+    _, start, end = query.resolve_period("..2025-02", TZ, TODAY)
+    assert start is None and end.date() == datetime.date(2025, 3, 1)
+    for spec in ("..", "2025-13", "manana", "2025-03..2025-01"):
+        with pytest.raises(ValueError):
+            query.resolve_period(spec, TZ, TODAY)
+
+
+def test_month_periods_are_clipped():
+    _, start, end = query.resolve_period("2025-01-15..2025-03-10", TZ, TODAY)
+    periods = query.month_periods(start, end, TZ)
+    assert [label for label, _, _ in periods] == ["2025-01", "2025-02", "2025-03"]
+    assert periods[0][1] == start and periods[-1][2] == end
+    assert all(a[2] == b[1] for a, b in zip(periods, periods[1:]))
+
+
+def _table(n=2000):
+    gastos = [{
+        "fecha": f"2025-{1 + i % 6:02d}-{1 + i % 28:02d}T10:00:00-05:00",
+        "monto": (i * 7919) % 50000,
+        "categoria": ["comida", "ocio", "transporte"][i % 3],
+        "detalle": f"d{i}",
+    } for i in range(n)]
+    return columnar.GastoTable.from_gastos(gastos)
+
+
+@pytest.mark.parametrize("engine", ["0", "1"], ids=["scan", "numpy"])
+def test_run_matches_table_methods(engine):
+    if engine == "1":
+        pytest.importorskip("numpy")
+    table = _table()
+    _, start, end = query.resolve_period("2025-02..2025-04", TZ, TODAY)
+    with patch.object(columnar, "COLUMNAR_NUMPY", engine):
+        report = query.run(table, start, end, categorias=True, top=7,
+                           periods=query.month_periods(start, end, TZ))
+
+    start_ts, end_ts = utils.to_epoch(start), utils.to_epoch(end)
+    with patch.object(columnar, "COLUMNAR_NUMPY", "0"):
+        assert report["categorias"] == table.by_category(start_ts, end_ts)
+        assert report["top"] == [table.row(i) for i in table.top(7, start_ts, end_ts)]
+    assert (report["total"], report["count"]) == table.sum_between(start_ts, end_ts)
+    assert sum(t for _, t, _ in report["periods"]) == report["total"]
+    assert [label for label, _, _ in report["periods"]] == ["2025-02", "2025-03", "2025-04"]
+
+
+def test_run_empty_range():
+    report = query.run(_table(10), *query.resolve_period("2030-01", TZ, TODAY)[1:], categorias=True, top=3)
+    assert report["count"] == 0 and report["categorias"] == {} and report["top"] == []
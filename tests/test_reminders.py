@@ -0,0 +1,136 @@
+import time
+import datetime
+import threading
+from concurrent.futures import Future
+import pytest
+from unittest.mock import patch
+import reminders
+import storage
+import utils
+
+USER = "573001234567"
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+         patch('storage.PAGOS_FILE', str(tmp_path / 'pagos.json')), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')):
+        yield tmp_path
+
+
+class FakeSender:
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.sent = []
+        self.event = threading.Event()
+
+    def __call__(self, to, text):
+        self.sent.append((to, text))
+        self.event.set()
+        future = Future()
+        future.set_result(self.ok)
+        return future
+
+
+def _add_pago(user, pago_id, nombre, vencimiento, pagado=False):
+    pago = {"id": pago_id, "nombre": nombre, "monto": 1000, "vencimiento": vencimiento, "pagado": pagado}
+    with storage.user_partition(user):
+        storage.save_pago(pago)
+    return pago
+
+
+def test_reminder_time():
+    tz = utils.get_timezone("America/Bogota")
+    with patch.object(reminders, "REMINDER_DAYS_BEFORE", 1), patch.object(reminders, "REMINDER_HOUR", 9):
+        assert reminders.reminder_time("2025-12-01", tz).isoformat() == "2025-11-30T09:00:00-05:00"
+
+
+def test_due_reminders_are_batched_per_user(data_dir):
+    sender = FakeSender()
+    scheduler = reminders.ReminderScheduler(str(data_dir), sender, batch_size=2)
+    now = time.time()
+    for user, pago_id, nombre in [("111", "p1", "luz"), ("111", "p2", "agua"), ("222", "p3", "gas")]:
+        scheduler.schedule(user, _add_pago(user, pago_id, nombre, "2025-12-01"), now - 10)
+    scheduler.schedule("222", _add_pago("222", "p4", "arriendo", "2026-01-01"), now + 3600)
+
+    delay = scheduler.run_due(now)
+
+    assert sorted(to for to, _ in sender.sent) == ["111", "222"]
+    text_111 = next(text for to, text in sender.sent if to == "111")
+    assert "luz" in text_111 and "agua" in text_111
+    assert 3590 <= delay <= 3600
+    assert scheduler.run_due(now) == delay
+    assert len(sender.sent) == 2
+
+
+def test_paid_pagos_are_not_reminded(data_dir):
+    sender = FakeSender()
+    scheduler = reminders.ReminderScheduler(str(data_dir), sender)
+    scheduler.schedule(USER, _add_pago(USER, "p1", "luz", "2025-12-01"), 0)
+    with storage.user_partition(USER):
+        storage.update_pago("p1", {"pagado": True})
+
+    assert scheduler.run_due() is None
+    assert sender.sent == []
+
+
+def test_failed_reminders_are_retried_then_dropped(data_dir):
+    sender = FakeSender(ok=False)
+    scheduler = reminders.ReminderScheduler(str(data_dir), sender)
+    scheduler.schedule(USER, _add_pago(USER, "p1", "luz", "2025-12-01"), 0)
+
+    now = time.time()
+    for attempt in range(reminders.REMINDER_MAX_ATTEMPTS):
+        delay = scheduler.run_due(now)
+        now += reminders.REMINDER_RETRY_DELAY
+    assert len(sender.sent) == reminders.REMINDER_MAX_ATTEMPTS
+    assert delay is None
+
+
+def test_single_leader_and_wakeup(data_dir):
+    senders = [FakeSender(), FakeSender()]
+    schedulers = [reminders.ReminderScheduler(str(data_dir), s) for s in senders]
+    for s in schedulers:
+        s.start()
+    deadline = time.time() + 5
+    while not any(s.is_leader for s in schedulers) and time.time() < deadline:
+        time.sleep(0.01)
+    leaders = [s for s in schedulers if s.is_leader]
+    assert len(leaders) == 1
+    leader = leaders[0]
+    follower = schedulers[1 - schedulers.index(leader)]
+
+    # Scheduled from the follower: the sleeping leader is woken up and sends it
+    follower.schedule(USER, _add_pago(USER, "p1", "luz", "2025-12-01"), time.time() - 1)
+    assert senders[schedulers.index(leader)].event.wait(5)
+    assert senders[schedulers.index(follower)].sent == []
+
+    # The follower takes over once the leader is gone
+    leader.stop()
+    leader.thread.join(5)
+    deadline = time.time() + 5
+    while not follower.is_leader and time.time() < deadline:
+        time.sleep(0.01)
+    assert follower.is_leader
+    follower.stop()
+    follower.thread.join(5)
+
+
+def test_schedule_uses_current_user(data_dir):
+    scheduler = reminders.ReminderScheduler(str(data_dir), FakeSender())
+    tz = utils.get_timezone("America/Bogota")
+    tomorrow = (datetime.datetime.now(tz).date() + datetime.timedelta(days=1)).isoformat()
+    with patch.object(reminders, "_scheduler", scheduler):
+        with storage.user_partition(USER):
+            reminders.schedule({"id": "p1", "vencimiento": tomorrow}, tz)
+            reminders.schedule({"id": "p0", "vencimiento": "2020-01-01"}, tz)
+        reminders.schedule({"id": "p2", "vencimiento": tomorrow}, tz)  # no recipient
+    rows = scheduler._connect().execute("SELECT user, pago_id FROM reminders").fetchall()
+    assert rows == [(USER, "p1")]
+
+
+def test_enabled_comes_from_dotenv(app_with_dotenv):
+    assert app_with_dotenv({"REMINDERS_ENABLED": "1"}, "reminders.REMINDERS_ENABLED") is True
+    assert app_with_dotenv({"REMINDERS_ENABLED": "0"}, "reminders.REMINDERS_ENABLED") is False
@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_startup import DEFERRED_MODULES, import_profile
+
+# Generous on purpose: catches a heavy import sneaking back in, not noise
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+
+@pytest.mark.parametrize("module", ["app", "commands", "whatsapp_handler"])
+def test_heavy_dependencies_are_deferred(module):
+    profile = import_profile(module)
+    assert [m for m in DEFERRED_MODULES if m in profile] == []
+
+
+def test_app_import_within_budget():
+    best = min(import_profile("app")["app"][1] for _ in range(3)) / 1000
+    assert best <= STARTUP_BUDGET_MS, f"importing app took {best:.0f} ms"
+
+
+def test_storage_settings_come_from_dotenv(app_with_dotenv):
+    assert app_with_dotenv({"STORAGE_BACKEND": "journal"}, "storage.STORAGE_BACKEND") == "journal"
@@ -0,0 +1,193 @@
+import os
+import sys
+import socket
+import threading
+import subprocess
+import pytest
+from unittest.mock import patch
+import storage
+import storage_client
+import storage_daemon
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _gasto(gid, monto=100, fecha="2025-05-10T12:00:00-05:00"):
+    return {"id": gid, "fecha": fecha, "monto": monto, "categoria": "comida", "detalle": "x"}
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    """
+    A daemon serving tmp_path from a thread of this process. Only
+    storage_client talks to it: storage itself stays on the json backend.
+    """
+    sock = str(tmp_path / 'storage.sock')
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+            patch('storage.GASTOS_FILE', str(tmp_path / 'gastos.json')), \
+            patch('storage.PAGOS_FILE', str(tmp_path / 'pagos.json')), \
+            patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')), \
+            patch('storage.STORAGE_BACKEND', 'json'), \
+            patch('storage_client.SOCKET_PATH', sock), \
+            patch('storage_daemon.COMMIT_WINDOW', 0.05):
+        server = storage_daemon.serve(sock, backend="json")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+        server.committer.stop()
+        storage_client.close()
+
+
+def test_concurrent_writes_are_group_committed(daemon):
+    def client(n):
+        assert storage_client.call("save_gastos", records=[_gasto(f"g-{n}", n)]) is True
+        storage_client.close()
+
+    with patch('storage._append_json', wraps=storage._append_json) as append:
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(1, 21)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert sorted(g["id"] for g in storage.get_gastos()) == sorted(f"g-{n}" for n in range(1, 21))
+    assert append.call_count == daemon.committer.commits < 20
+    assert storage.get_index()["count"] == 20
+
+
+def test_partitions_reads_and_errors(daemon):
+    storage_client.call("save_gastos", user="573001", records=[_gasto("a", 500)])
+    storage_client.call("save_pagos", user="573001", records=[{"id": "p-1", "nombre": "luz", "vencimiento": "2025-06-01", "pagado": False}])
+
+    assert storage_client.call("get_gastos") == []
+    assert [g["id"] for g in storage_client.call("get_gastos", user="573001")] == ["a"]
+    assert storage_client.call("get_totals", user="573001", buckets=[["mes", "2025-05"]]) == [["mes", "2025-05", 500, 1]]
+    assert storage_client.call("update_pago", user="573001", pago_id="p-1", changes={"pagado": True})["pagado"] is True
+    assert storage_client.call("get_pending_pagos", user="573001") == []
+
+    with pytest.raises(storage_client.DaemonError, match="unknown operation"):
+        storage_client.call("remove_everything")
+
+
+def test_client_reports_daemon_down(tmp_path):
+    with patch('storage_client.SOCKET_PATH', str(tmp_path / 'missing.sock')), \
+            patch('storage.STORAGE_BACKEND', 'daemon'):
+        storage_client.close()
+        assert storage.save_gasto(_gasto("a")) is False
+        with pytest.raises(storage_client.DaemonError):
+            storage.get_gastos()
+
+
+DAEMON = """
+import os, sys
+sys.path.insert(0, {root!r})
+from unittest.mock import patch
+import storage, storage_daemon
+tmp = {tmp!r}
+with patch.object(storage, "DATA_DIR", tmp), \\
+        patch.object(storage, "GASTOS_FILE", os.path.join(tmp, "gastos.json")), \\
+        patch.object(storage, "PAGOS_FILE", os.path.join(tmp, "pagos.json")), \\
+        patch.object(storage, "CONFIG_FILE", os.path.join(tmp, "config.json")):
+    server = storage_daemon.serve(os.path.join(tmp, "storage.sock"), backend="json")
+    print("ready", flush=True)
+    server.serve_forever()
+"""
+
+
+def _start_daemon(tmp_path):
+    child = subprocess.Popen([sys.executable, "-c", DAEMON.format(root=ROOT, tmp=str(tmp_path))],
+                             stdout=subprocess.PIPE, text=True)
+    assert child.stdout.readline().strip() == "ready"
+    return child
+
+
+def _stop_daemon(child):
+    child.terminate()
+    child.wait()
+    child.stdout.close()
+
+
+def test_daemon_backend_keeps_storage_api(tmp_path):
+    child = _start_daemon(tmp_path)
+    try:
+        worker_dir = tmp_path / 'worker'
+        with patch('storage.STORAGE_BACKEND', 'daemon'), \
+                patch('storage.DATA_DIR', str(worker_dir)), \
+                patch('storage_client.SOCKET_PATH', str(tmp_path / 'storage.sock')):
+            with storage.user_partition("573001"), storage.batched_writes():
+                storage.save_gasto(_gasto("a", 1000, "2025-05-10T12:00:00-05:00"))
+                storage.save_gasto(_gasto("b", 2000, "2025-05-20T12:00:00-05:00"))
+            with storage.user_partition("573001"):
+                assert [g["id"] for g in storage.get_gastos()] == ["a", "b"]
+                assert storage.sum_gastos_between() == 3000
+                from datetime import datetime, timezone
+                since = datetime(2025, 5, 15, tzinfo=timezone.utc)
+                assert [g["id"] for g in storage.iter_gastos(since=since)] == ["b"]
+                assert storage.get_period_totals("mes", "2025-05") == (3000, 2)
+                assert storage.get_table().sum_between() == (3000, 2)
+                assert storage.update_config("moneda", "USD")["moneda"] == "USD"
+                assert storage.get_config()["moneda"] == "USD"
+            storage_client.close()
+        # Written by the daemon, in the partition's own files
+        assert (tmp_path / 'users').exists() and not (tmp_path / 'gastos.json').exists()
+        # and nothing on the worker's side
+        assert not worker_dir.exists()
+    finally:
+        _stop_daemon(child)
+
+
+def test_first_call_after_a_daemon_restart(tmp_path):
+    with patch('storage_client.SOCKET_PATH', str(tmp_path / 'storage.sock')):
+        child = _start_daemon(tmp_path)
+        try:
+            assert storage_client.call("save_gastos", records=[_gasto("a")]) is True
+        finally:
+            _stop_daemon(child)
+        child = _start_daemon(tmp_path)
+        try:
+            # The connection to the old daemon is noticed before sending
+            assert storage_client.call("save_gastos", records=[_gasto("b")]) is True
+            assert [g["id"] for g in storage_client.call("get_gastos")] == ["a", "b"]
+        finally:
+            storage_client.close()
+            _stop_daemon(child)
+
+
+def test_only_reads_are_sent_again_when_the_answer_is_lost(tmp_path):
+    path = str(tmp_path / 'fake.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+    listener.settimeout(5)
+    requests = []
+
+    def serve():
+        # Drops the first request unanswered, answers the second, drops the third
+        for replies in ((None,), (b'{"result": []}\n', None)):
+            conn, _ = listener.accept()
+            conn.settimeout(5)
+            with conn, conn.makefile('rb') as reader:
+                for reply in replies:
+                    requests.append(reader.readline())
+                    if reply is not None:
+                        conn.sendall(reply)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        with patch('storage_client.SOCKET_PATH', path):
+            storage_client.close()
+            assert storage_client.call("get_gastos") == []
+            with pytest.raises(storage_client.DaemonError, match="connection closed"):
+                storage_client.call("save_gastos", records=[_gasto("a")])
+    finally:
+        storage_client.close()
+        thread.join()
+        listener.close()
+    assert len(requests) == 3 and b"save_gastos" in requests[2]
+
+
+def test_client_knows_which_operations_are_reads():
+    assert storage_client.READ_ONLY == set(storage_daemon.READS)
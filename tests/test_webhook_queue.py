@@ -0,0 +1,64 @@
+import time
+import threading
+from unittest.mock import patch
+import webhook_queue
+
+def test_events_are_processed_in_background():
+    seen = []
+    q = webhook_queue.WebhookQueue(seen.append, maxsize=10, workers=2)
+
+    for i in range(5):
+        assert q.submit({"n": i}) is True
+
+    assert q.shutdown(timeout=5) is True
+    assert sorted(e["n"] for e in seen) == list(range(5))
+    stats = q.stats()
+    assert stats["enqueued"] == 5
+    assert stats["processed"] == 5
+    assert stats["depth"] == 0
+
+def test_full_queue_rejects_and_shutdown_drains():
+    release = threading.Event()
+    seen = []
+
+    def slow_handler(body):
+        release.wait(5)
+        seen.append(body)
+
+    q = webhook_queue.WebhookQueue(slow_handler, maxsize=2, workers=1)
+    assert q.submit(1)
+    time.sleep(0.05)  # worker picks up the first event and blocks
+    assert q.submit(2)
+    assert q.submit(3)
+    assert q.submit(4) is False
+    assert q.stats()["rejected"] == 1
+    assert q.stats()["oldest_age_seconds"] >= 0
+
+    release.set()
+    assert q.shutdown(timeout=5) is True
+    assert seen == [1, 2, 3]
+    assert q.submit(5) is False  # closed
+
+def test_handler_errors_are_counted():
+    def broken(body):
+        raise RuntimeError("boom")
+
+    q = webhook_queue.WebhookQueue(broken, maxsize=5, workers=1)
+    q.submit({})
+    q.shutdown(timeout=5)
+    assert q.stats()["failed"] == 1
+
+def test_webhook_acks_immediately_in_async_mode():
+    import app
+    q = webhook_queue.WebhookQueue(lambda body: time.sleep(0.5), maxsize=5, workers=1)
+
+    with patch('webhook_queue.WEBHOOK_ASYNC', True), patch('webhook_queue.get_queue', return_value=q):
+        client = app.app.test_client()
+        started = time.monotonic()
+        response = client.post("/webhook", json={"entry": []})
+        assert time.monotonic() - started < 0.3
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "queued"
+        assert client.get("/stats").get_json()["queue"]["enqueued"] == 1
+
+    q.shutdown(timeout=5)
@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from unittest.mock import patch
+import dedup
+import storage
+import whatsapp_handler
+
+def _text(from_number, body, msg_id):
+    return {"from": from_number, "id": msg_id, "type": "text", "text": {"body": body}}
+
+def _webhook(*changes):
+    # One entry per list of messages, to exercise every level of nesting
+    return {"entry": [{"changes": [{"value": {"messages": messages}}]} for messages in changes]}
+
+@pytest.fixture(autouse=True)
+def dedup_cache(tmp_path):
+    cache = dedup.DedupCache(str(tmp_path / 'dedup.db'))
+    with patch('dedup._cache', cache):
+        yield cache
+
+@pytest.fixture
+def sent():
+    replies = []
+    lock = threading.Lock()
+
+    def fake_send(to_number, text_body):
+        with lock:
+            replies.append((to_number, text_body))
+        future = Future()
+        future.set_result(True)
+        return future
+
+    with patch('whatsapp_handler.send_message_async', side_effect=fake_send):
+        yield replies
+
+def test_every_message_in_the_batch_is_processed(sent):
+    body = _webhook(
+        [_text("111", "uno", "m1"), _text("222", "dos", "m2")],
+        [_text("111", "tres", "m3"), {"from": "333", "id": "m4", "type": "image"}],
+    )
+    with patch('whatsapp_handler.commands.parse', side_effect=lambda text, user_id=None: f"eco {text}"):
+        whatsapp_handler.process_webhook_event(body)
+
+    assert [r for n, r in sent if n == "111"] == ["eco uno", "eco tres"]
+    assert [r for n, r in sent if n == "222"] == ["eco dos"]
+    assert [r for n, r in sent if n == "333"] == ["⚠️ Por ahora solo entiendo mensajes de texto."]
+
+def test_status_updates_are_ignored(sent):
+    whatsapp_handler.process_webhook_event({"entry": [{"changes": [{"value": {"statuses": [{}]}}]}]})
+    whatsapp_handler.process_webhook_event({})
+    assert sent == []
+
+def test_sender_writes_are_coalesced(sent, tmp_path):
+    body = _webhook([_text("111", f"gasto {n}000 comida item{n}", f"m{n}") for n in range(1, 4)])
+
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.save_gastos', wraps=storage.save_gastos) as save_gastos:
+        whatsapp_handler.process_webhook_event(body)
+        assert save_gastos.call_count == 1
+        with storage.user_partition("111"):
+            assert [g["monto"] for g in storage.get_gastos()] == [1000, 2000, 3000]
+
+    assert len(sent) == 3
+    assert all(r.startswith("✅ Registrado") for _, r in sent)
+
+def test_reads_see_earlier_writes_of_the_same_batch(sent, tmp_path):
+    body = _webhook([_text("111", "gasto 5000 cafe", "m1"), _text("111", "hoy", "m2")])
+
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')):
+        whatsapp_handler.process_webhook_event(body)
+
+    assert sent[1] == ("111", "Hoy has gastado: 5.000 COP.")
+
+def test_each_sender_gets_their_own_data(sent, tmp_path):
+    body = _webhook([_text("111", "gasto 5000 cafe", "m1"), _text("222", "gasto 7000 pan", "m2")])
+    followup = _webhook([_text("111", "hoy", "m3"), _text("222", "hoy", "m4"), _text("333", "hoy", "m5")])
+
+    with patch('storage.DATA_DIR', str(tmp_path)), \
+         patch('storage.CONFIG_FILE', str(tmp_path / 'config.json')):
+        whatsapp_handler.process_webhook_event(body)
+        whatsapp_handler.process_webhook_event(followup)
+
+    replies = dict(sent[2:])
+    assert replies["111"] == "Hoy has gastado: 5.000 COP."
+    assert replies["222"] == "Hoy has gastado: 7.000 COP."
+    assert replies["333"].endswith("no has gastado nada.")
+    assert not (tmp_path / 'gastos.json').exists()  # shared files untouched
+
+def test_failed_flush_is_reported_to_the_sender(sent):
+    body = _webhook([_text("111", "gasto 5000 cafe", "m1")])
+
+    with patch('storage.save_gastos', return_value=False), \
+         patch('commands.storage.get_config', return_value={"timezone": "UTC", "moneda": "COP"}):
+        whatsapp_handler.process_webhook_event(body)
+
+    assert sent == [("111", "❌ Error interno al guardar los datos.")]
+
+def test_redelivered_messages_are_skipped(sent, dedup_cache):
+    body = _webhook([_text("111", "uno", "wamid.1")])
+    with patch('whatsapp_handler.commands.parse', side_effect=lambda text, user_id=None: f"eco {text}") as parse:
+        whatsapp_handler.process_webhook_event(body)
+        whatsapp_handler.process_webhook_event(body)
+        assert parse.call_count == 1
+
+    assert sent == [("111", "eco uno")]
+    assert dedup_cache.stats()["hits"] == 1
+    assert dedup_cache.stats()["misses"] == 1
+
+def test_malformed_items_do_not_lose_claimed_messages(sent, dedup_cache):
+    body = {"entry": [
+        {"changes": [{"value": {"messages": [_text("111", "uno", "wamid.1"), None]}}]},
+        {"changes": ["texto", {"value": None}]},
+        "entrada",
+    ]}
+    with patch('whatsapp_handler.commands.parse', side_effect=lambda text, user_id=None: f"eco {text}"):
+        whatsapp_handler.process_webhook_event(body)
+
+    assert sent == [("111", "eco uno")]
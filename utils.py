@@ -1,9 +1,11 @@
 import uuid
+import math
 import datetime
-import pytz
-import dateparser
+import dates
 
 def get_timezone(tz_name="America/Bogota"):
+    # pytz is imported on first use to keep it out of worker startup
+    import pytz
     try:
         return pytz.timezone(tz_name)
     except pytz.UnknownTimeZoneError:
@@ -30,12 +32,18 @@ def parse_date_input(date_str, tz_name="America/Bogota"):
     Parses natural language dates like 'hoy', 'ayer', '2025-11-12'.
     Returns a datetime object or None.
     """
-    settings = {
-        'TIMEZONE': tz_name,
-        'RETURN_AS_TIMEZONE_AWARE': True
-    }
-    dt = dateparser.parse(date_str, settings=settings)
-    return dt
+    return dates.parse_date(date_str, get_timezone(tz_name))
+
+def to_epoch(value):
+    """
+    Converts a datetime or ISO 8601 string to epoch seconds.
+    Naive values are taken as local time. Returns None for empty values.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return dates.iso_to_epoch(value)
+    return math.floor(value.timestamp())
 
 def generate_id(prefix="g"):
     """
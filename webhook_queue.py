@@ -0,0 +1,179 @@
+"""
+Bounded in-process queue for webhook events.
+
+With WEBHOOK_ASYNC=1 the /webhook endpoint only enqueues the body and
+answers 200 right away; a small pool of worker threads runs
+whatsapp_handler.process_webhook_event (command parsing and the reply)
+off the request path. When the queue is full the endpoint answers 503 so
+Meta redelivers later instead of us buffering without limit.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import metrics
+import whatsapp_handler
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+QUEUE_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+# Seconds to keep draining pending events on shutdown
+DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "25"))
+
+_STOP = object()
+
+
+class WebhookQueue:
+    def __init__(self, handler, maxsize=QUEUE_MAX_SIZE, workers=QUEUE_WORKERS):
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.num_workers = workers
+        self.threads = []
+        self.started = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.started or self.closed:
+                return
+            self.started = True
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker, name=f"webhook-worker-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, body):
+        """
+        Enqueues a webhook body. Returns False if it was not accepted.
+        """
+        if self.closed:
+            with self.lock:
+                self.rejected += 1
+            return False
+        if not self.started:
+            self.start()
+        try:
+            self.queue.put_nowait((time.monotonic(), body))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            logger.warning("Webhook queue full, rejecting event.")
+            return False
+        with self.lock:
+            self.enqueued += 1
+        return True
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                enqueued_at, body = item
+                lag = time.monotonic() - enqueued_at
+                with self.lock:
+                    self.last_lag = lag
+                    self.max_lag = max(self.max_lag, lag)
+                try:
+                    self.handler(body)
+                    with self.lock:
+                        self.processed += 1
+                except Exception as e:
+                    logger.error(f"Error processing queued webhook: {e}")
+                    with self.lock:
+                        self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    def oldest_age(self):
+        """
+        Seconds the oldest pending event has been waiting.
+        """
+        with self.queue.mutex:
+            for item in self.queue.queue:
+                if item is not _STOP:
+                    return time.monotonic() - item[0]
+        return 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.queue.qsize(),
+                "max_size": self.queue.maxsize,
+                "workers": self.num_workers,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "oldest_age_seconds": round(self.oldest_age(), 3),
+                "last_lag_seconds": round(self.last_lag, 3),
+                "max_lag_seconds": round(self.max_lag, 3),
+            }
+
+    def shutdown(self, timeout=DRAIN_TIMEOUT):
+        """
+        Stops accepting events and waits for the pending ones to be processed.
+        Returns True if the queue was fully drained.
+        """
+        with self.lock:
+            if self.closed:
+                return True
+            self.closed = True
+            threads, self.threads = self.threads, []
+
+        for _ in threads:
+            self.queue.put(_STOP)
+
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+        drained = not any(t.is_alive() for t in threads)
+        if not drained:
+            logger.warning(f"Webhook queue shutdown timed out with {self.queue.qsize()} events pending.")
+        return drained
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Process-wide queue, created lazily so that each gunicorn worker starts
+    its own threads after the fork.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WebhookQueue(whatsapp_handler.process_webhook_event)
+            atexit.register(_queue.shutdown)
+        return _queue
+
+
+@metrics.collector
+def _collect_metrics():
+    if _queue is None:
+        return []
+    stats = _queue.stats()
+    return [
+        ("bot_webhook_queue_depth", "gauge", "Webhook events waiting in the queue.",
+         [("bot_webhook_queue_depth", {}, stats["depth"])]),
+        ("bot_webhook_queue_oldest_age_seconds", "gauge", "Age of the oldest queued event.",
+         [("bot_webhook_queue_oldest_age_seconds", {}, stats["oldest_age_seconds"])]),
+        ("bot_webhook_queue_rejected_total", "counter", "Events refused because the queue was full.",
+         [("bot_webhook_queue_rejected_total", {}, stats["rejected"])]),
+        ("bot_webhook_queue_failed_total", "counter", "Events whose processing raised.",
+         [("bot_webhook_queue_failed_total", {}, stats["failed"])]),
+    ]
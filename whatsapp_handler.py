@@ -1,10 +1,14 @@
 import os
-import requests
 import logging
-import time
-import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 import commands
+import dedup
+import http_client
+import log_config
+import metrics
+import storage
 
 load_dotenv()
 
@@ -13,11 +17,14 @@ logger = logging.getLogger(__name__)
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 BASE_URL = os.getenv("BASE_URL", "https://graph.facebook.com/v17.0")
+# Senders from one webhook batch processed in parallel
+BATCH_WORKERS = int(os.getenv("WEBHOOK_BATCH_WORKERS", "4"))
 
-def send_message(to_number, text_body):
+def send_message_async(to_number, text_body):
     """
     Sends a text message to the specified number using WhatsApp Cloud API.
-    Retries 3 times with exponential backoff.
+    Returns a Future resolving to True once delivered; failed attempts are
+    retried in the background by the shared outbound client.
     """
     url = f"{BASE_URL}/{PHONE_NUMBER_ID}/messages"
     headers = {
@@ -30,54 +37,133 @@ def send_message(to_number, text_body):
         "type": "text",
         "text": {"body": text_body}
     }
+    return http_client.get_client().post_async(url, headers, payload)
+
+def send_message(to_number, text_body):
+    """
+    Blocking variant of send_message_async. Returns True if delivered.
+    """
+    return send_message_async(to_number, text_body).result()
+
+def send_messages_in_order(to_number, texts):
+    """
+    Sends several messages without blocking the caller, each one only after
+    the previous has finished (retries included) so they arrive in order.
+    Returns a Future resolving to True if all were delivered.
+    """
+    texts = list(texts)
+    results = []
+    done = Future()
+
+    def send_next(previous=None):
+        if previous is not None:
+            results.append(previous.result())
+        if len(results) == len(texts):
+            done.set_result(all(results))
+            return
+        send_message_async(to_number, texts[len(results)]).add_done_callback(send_next)
+
+    send_next()
+    return done
+
+def _dicts(value, key):
+    # Items of value[key] that are dicts; anything malformed is skipped
+    items = value.get(key) if isinstance(value, dict) else None
+    return [item for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+def _iter_messages(body):
+    """
+    Yields every message in a webhook body, across all entries and changes.
+    Malformed entries, changes and messages are skipped.
+    """
+    for entry in _dicts(body, "entry"):
+        for change in _dicts(entry, "changes"):
+            yield from _dicts(change.get("value"), "messages")
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            return True
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Attempt {attempt+1} failed to send message: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt) # 1s, 2s, 4s
-            else:
-                logger.error(f"Failed to send message after {max_retries} attempts.")
-                return False
+def _reply_for(message):
+    from_number = message.get("from")
+    msg_type = message.get("type")
+
+    if msg_type == "text":
+        text_body = message.get("text", {}).get("body", "")
+        logger.info("Received message from %s", log_config.mask_phone(from_number))
+        logger.debug("Message text: %s", text_body)
+        return commands.parse(text_body, from_number)
+
+    logger.info("Received non-text message type: %s", msg_type)
+    return "⚠️ Por ahora solo entiendo mensajes de texto."
+
+def _process_sender(from_number, messages):
+    """
+    Handles one sender's messages in order. Their storage writes are
+    coalesced into a single append, and replies go out once it is durable.
+    """
+    replies = []
+    with storage.user_partition(from_number), storage.batched_writes() as batch:
+        for i, message in enumerate(messages):
+            batch.owner = i
+            try:
+                replies.append(_reply_for(message))
+            except Exception as e:
+                logger.error(f"Error processing message from {from_number}: {e}")
+                replies.append(None)
+
+    for i in batch.failed:
+        replies[i] = "❌ Error interno al guardar los datos."
+
+    def check_sent(future):
+        if not future.result():
+            logger.error(f"Could not send response to {from_number}")
+
+    send_messages_in_order(from_number, [r for r in replies if r is not None]).add_done_callback(check_sent)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="webhook-batch")
+        return _executor
 
 def process_webhook_event(body):
     """
     Processes the incoming webhook JSON from WhatsApp.
+    Every message in the batch is handled; different senders run
+    concurrently while each sender's messages keep their order.
     """
     try:
-        entry = body.get("entry", [])[0]
-        changes = entry.get("changes", [])[0]
-        value = changes.get("value", {})
-        messages = value.get("messages", [])
-        
-        if not messages:
+        # Read the whole body before claiming any id: claimed messages
+        # are never delivered again
+        by_sender = {}
+        for message in list(_iter_messages(body)):
+            if dedup.is_duplicate(message.get("id")):
+                logger.info("Skipping redelivered message %s", message.get("id"))
+                metrics.inc(metrics.WEBHOOK_MESSAGES, result="duplicate")
+                continue
+            metrics.inc(metrics.WEBHOOK_MESSAGES, result="accepted")
+            by_sender.setdefault(message.get("from"), []).append(message)
+
+        if not by_sender:
             return # No messages (could be a status update)
 
-        message = messages[0]
-        from_number = message.get("from")
-        msg_type = message.get("type")
-        
-        if msg_type == "text":
-            text_body = message.get("text", {}).get("body", "")
-            logger.info(f"Received message from {from_number}: {text_body}")
-            
-            # Process command
-            response_text = commands.parse(text_body)
-            
-            # Send response
-            success = send_message(from_number, response_text)
-            if not success:
-                logger.error(f"Could not send response to {from_number}")
-        else:
-            logger.info(f"Received non-text message type: {msg_type}")
-            send_message(from_number, "⚠️ Por ahora solo entiendo mensajes de texto.")
-
-    except (IndexError, KeyError) as e:
+        if len(by_sender) == 1:
+            (from_number, messages), = by_sender.items()
+            _process_sender(from_number, messages)
+            return
+
+        futures = {
+            _get_executor().submit(_process_sender, from_number, messages): from_number
+            for from_number, messages in by_sender.items()
+        }
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Error processing messages from {futures[future]}: {e}")
+
+    except (AttributeError, TypeError) as e:
         logger.error(f"Error parsing webhook body: {e}")
     except Exception as e:
         logger.error(f"Unexpected error processing webhook: {e}")